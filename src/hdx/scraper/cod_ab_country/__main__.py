@@ -1,26 +1,67 @@
 """COD-AB country scraper pipeline."""
 
 import logging
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from multiprocessing import get_context
 from pathlib import Path
 from shutil import rmtree
+from typing import Any
 
 from hdx.api.configuration import Configuration
 from hdx.facades.infer_arguments import facade
 from hdx.utilities.path import wheretostart_tempdir_batch
 from tqdm import tqdm
 
-from .arcgis import generate_token, get_layer_list, get_metadata, is_recently_updated
+from . import metrics
+from .arcgis import (
+    client_get,
+    get_last_edit_date,
+    get_layer_list,
+    get_service_url,
+    get_token,
+    is_recently_updated,
+    shared_client,
+    use_response_cache,
+    use_token_cache,
+)
+from .changes import find_changed_countries
 from .config import (
     ARCGIS_METADATA_SERVICE_URL,
     ARCGIS_METADATA_URL,
+    CONVERT_WORKERS,
+    DOWNLOAD_WORKERS,
+    PRESCAN_CONCURRENCY,
+    QUEUE_DEPTH,
+    REPORT_TOP_N,
     TEMP_DIR,
+    UPLOAD_WORKERS,
+    WORKERS,
     iso3_exclude_cfg,
     iso3_include_cfg,
 )
-from .dataset import FORMAT_TYPES, add_boundary_resource, generate_dataset
+from .dataset import (
+    COMPARED_EXTS,
+    FORMAT_TYPES,
+    add_boundary_resource,
+    generate_dataset,
+    get_resource_name,
+    load_lookup_cache,
+    merge_lookups,
+    pop_lookups,
+    save_lookup_cache,
+)
 from .download.boundaries import download_boundaries
+from .download.boundaries.download import use_layer_cache
+from .download.boundaries.incremental import LayerStore
 from .download.metadata import download_metadata
 from .geodata import formats
+from .geodata.compare import compare_geodata
+from .journal import COMPARED, CONVERTED, DONE, DOWNLOADED, UPLOADED, Journal
+from .metadata import MetadataStore
+from .pipeline import CountryJob, Stage, run_pipeline
+from .retry import retry_policy
 
 cwd = Path(__file__).parent
 logger = logging.getLogger(__name__)
@@ -30,65 +71,432 @@ _SAVED_DATA_DIR = f"{TEMP_DIR}/saved_data"
 _UPDATED_BY_SCRIPT = "HDX Scraper: COD-AB Country"
 
 
-def _create_country_dataset(  # noqa: C901, PLR0912, PLR0913
+def _is_service_unchanged(job: CountryJob, journal: Journal) -> bool:
+    """Return True if the service has not been edited since it was journaled."""
+    recorded = journal.edited(job.iso3, job.version)
+    if recorded is None:
+        return True
+    params = {"f": "json", "token": get_token()}
+    current = get_last_edit_date(
+        client_get(get_service_url(job.iso3, job.version), params).json()
+    )
+    return current is None or current == recorded
+
+
+def _download_stage(  # noqa: PLR0913
+    job: CountryJob,
+    force_download: bool,  # noqa: FBT001
+    global_metadata_updated: bool,  # noqa: FBT001
+    journal: Journal,
+    prechecked: bool = False,  # noqa: FBT001, FBT002
+    layer_store: LayerStore | None = None,
+) -> bool:
+    """Download boundaries for a country into a fresh directory.
+
+    Work recorded in the journal is reused if the service is unchanged. If
+    change detection already ran up front, it is not repeated per layer.
+    """
+    iso3, version = job.iso3, job.version
+    if journal.get(iso3, version)["stages"]:
+        if not _is_service_unchanged(job, journal):
+            logger.info("Resuming: %s %s changed since last run", iso3, version)
+            journal.reset(iso3, version)
+        elif journal.is_done(iso3, version, DONE):
+            logger.info("Resuming: %s %s already complete", iso3, version)
+            return False
+        elif journal.is_done(iso3, version, DOWNLOADED):
+            info = journal.stage_info(iso3, version, DOWNLOADED)
+            job.has_downloads = info["has_downloads"]
+            if not job.has_downloads or job.iso3_dir.exists():
+                logger.info("Resuming: reusing %s %s download", iso3, version)
+                return job.has_downloads or force_download or global_metadata_updated
+    rmtree(job.iso3_dir, ignore_errors=True)
+    job.iso3_dir.mkdir(parents=True)
+    edited = download_boundaries(
+        job.iso3_dir,
+        get_token(),
+        iso3,
+        version,
+        force=force_download or prechecked,
+        store=layer_store,
+    )
+    job.has_downloads = any(job.iso3_dir.glob("*.parquet"))
+    journal.reset(iso3, version, edited)
+    journal.mark(iso3, version, DOWNLOADED, has_downloads=job.has_downloads)
+    if not job.has_downloads:
+        rmtree(job.iso3_dir)
+        if not (force_download or global_metadata_updated):
+            journal.mark(iso3, version, DONE)
+            return False
+    return True
+
+
+def _convert_stage(job: CountryJob, journal: Journal) -> bool:
+    """Convert downloaded boundaries into every output format."""
+    if not job.has_downloads:
+        return True
+    outputs = [
+        job.iso3_dir / get_resource_name(job.iso3, ext) for ext, _ in FORMAT_TYPES
+    ]
+    if journal.is_done(job.iso3, job.version, CONVERTED) and all(
+        x.exists() for x in outputs
+    ):
+        logger.info("Resuming: reusing %s %s outputs", job.iso3, job.version)
+        return True
+    formats.main(job.iso3_dir, job.iso3)
+    metrics.add_output_sizes(
+        job.iso3,
+        {ext: path for (ext, _), path in zip(FORMAT_TYPES, outputs, strict=True)},
+    )
+    journal.mark(job.iso3, job.version, CONVERTED)
+    return True
+
+
+def _compare_output(
+    job: CountryJob,
+    dataset_name: str,
+    ext: str,
+    force_upload: bool,  # noqa: FBT001
+    journal: Journal,
+) -> Path:
+    """Choose between the local output and the identical copy already in HDX."""
+    local_path = job.iso3_dir / get_resource_name(job.iso3, ext)
+    if ext not in COMPARED_EXTS or force_upload:
+        return local_path
+    stage = f"{COMPARED}:{ext}"
+    recorded = Path(journal.stage_info(job.iso3, job.version, stage).get("path", ""))
+    if journal.is_done(job.iso3, job.version, stage) and recorded.is_file():
+        return recorded
+    path = compare_geodata(local_path, dataset_name)
+    journal.mark(job.iso3, job.version, stage, path=str(path))
+    return path
+
+
+def _upload_formats(  # noqa: PLR0913
+    job: CountryJob,
+    info: dict,
+    metadata: dict,
+    format_types: list[tuple[str, str]],
+    force_upload: bool,  # noqa: FBT001
+    test: bool,  # noqa: FBT001
+    journal: Journal,
+) -> bool:
+    """Create the dataset in HDX with a resource for each of the given formats.
+
+    The batch holding the first format sets the preview resource and removes
+    resources that are no longer generated. Returns False if the dataset could
+    not be generated.
+    """
+    iso3, version, iso3_dir = job.iso3, job.version, job.iso3_dir
+    dataset = generate_dataset(iso3_dir, iso3, metadata, with_resources=False)
+    if not dataset:
+        return False
+    dataset.update_from_yaml(path=str(cwd / "config/hdx_dataset_static.yaml"))
+    for ext, format_type in format_types:
+        file_to_upload = _compare_output(
+            job, dataset.get_name_or_id(), ext, force_upload, journal
+        )
+        add_boundary_resource(
+            dataset,
+            iso3_dir,
+            iso3,
+            metadata,
+            ext,
+            format_type,
+            force_upload,
+            file_to_upload=file_to_upload,
+        )
+    is_first = format_types[0] == FORMAT_TYPES[0]
+    if is_first:
+        dataset.preview_resource()
+    names = ", ".join(format_type for _, format_type in format_types)
+    if test:
+        logger.info("Test mode: skipping HDX upload for %s (%s)", iso3, names)
+        return True
+    with metrics.timed("create_in_hdx"):
+        dataset.create_in_hdx(
+            remove_additional_resources=is_first,
+            match_resource_order=False,
+            updated_by_script=_UPDATED_BY_SCRIPT,
+            batch=info["batch"],
+        )
+    for ext, _ in format_types:
+        journal.mark(iso3, version, f"{UPLOADED}:{ext}")
+    return True
+
+
+def _upload_stage(  # noqa: PLR0913
+    job: CountryJob,
+    info: dict,
+    metadata_store: MetadataStore,
+    force_upload: bool,  # noqa: FBT001
+    test: bool,  # noqa: FBT001
+    journal: Journal,
+    single_upload: bool = False,  # noqa: FBT001, FBT002
+) -> bool:
+    """Generate the dataset and create it in HDX.
+
+    By default each format is uploaded with its own create_in_hdx call. With
+    single_upload, all formats are attached and created in one call.
+    """
+    iso3, version, iso3_dir = job.iso3, job.version, job.iso3_dir
+    metadata = metadata_store.get(iso3, version)
+    if not job.has_downloads:
+        dataset = generate_dataset(iso3_dir, iso3, metadata, with_resources=False)
+        if dataset:
+            dataset.update_from_yaml(path=str(cwd / "config/hdx_dataset_static.yaml"))
+            if test:
+                logger.info("Test mode: skipping HDX upload for %s", iso3)
+            else:
+                with metrics.timed("create_in_hdx"):
+                    dataset.create_in_hdx(
+                        remove_additional_resources=False,
+                        match_resource_order=False,
+                        updated_by_script=_UPDATED_BY_SCRIPT,
+                        batch=info["batch"],
+                    )
+        journal.mark(iso3, version, DONE)
+        return True
+    pending = [
+        (ext, format_type)
+        for ext, format_type in FORMAT_TYPES
+        if not journal.is_done(iso3, version, f"{UPLOADED}:{ext}")
+    ]
+    if len(pending) < len(FORMAT_TYPES):
+        logger.info("Resuming: %s has %d formats to upload", iso3, len(pending))
+    batches = [pending] if single_upload else [[x] for x in pending]
+    for batch in batches:
+        if batch and not _upload_formats(
+            job, info, metadata, batch, force_upload, test, journal
+        ):
+            break
+    if not test:
+        rmtree(iso3_dir)
+    journal.mark(iso3, version, DONE)
+    return True
+
+
+def _get_stages(  # noqa: PLR0913
+    info: dict,
+    journal: Journal,
+    metadata_store: MetadataStore,
+    force_download: bool = False,  # noqa: FBT001, FBT002
+    force_upload: bool = False,  # noqa: FBT001, FBT002
+    global_metadata_updated: bool = False,  # noqa: FBT001, FBT002
+    test: bool = False,  # noqa: FBT001, FBT002
+    single_upload: bool = False,  # noqa: FBT001, FBT002
+    prechecked: bool = False,  # noqa: FBT001, FBT002
+    layer_store: LayerStore | None = None,
+) -> list[Stage]:
+    """Bind run settings to each stage of a country dataset."""
+    return [
+        Stage(
+            "download",
+            partial(
+                _download_stage,
+                force_download=force_download,
+                global_metadata_updated=global_metadata_updated,
+                journal=journal,
+                prechecked=prechecked,
+                layer_store=layer_store,
+            ),
+            DOWNLOAD_WORKERS,
+        ),
+        Stage("convert", partial(_convert_stage, journal=journal), CONVERT_WORKERS),
+        Stage(
+            "upload",
+            partial(
+                _upload_stage,
+                info=info,
+                metadata_store=metadata_store,
+                force_upload=force_upload,
+                test=test,
+                journal=journal,
+                single_upload=single_upload,
+            ),
+            UPLOAD_WORKERS,
+        ),
+    ]
+
+
+def _get_job(data_dir: Path, iso3: str, version: str) -> CountryJob:
+    return CountryJob(iso3, version, data_dir / "boundaries" / iso3.lower())
+
+
+def _create_country_dataset(  # noqa: PLR0913
     info: dict,
     data_dir: Path,
-    token: str,
     iso3: str,
     version: str,
+    journal: Journal,
+    metadata_store: MetadataStore,
     force_download: bool = False,  # noqa: FBT001, FBT002
     force_upload: bool = False,  # noqa: FBT001, FBT002
     global_metadata_updated: bool = False,  # noqa: FBT001, FBT002
     test: bool = False,  # noqa: FBT001, FBT002
+    single_upload: bool = False,  # noqa: FBT001, FBT002
+    prechecked: bool = False,  # noqa: FBT001, FBT002
+    layer_store: LayerStore | None = None,
 ) -> None:
     """Create a dataset for a country."""
-    iso3_dir = data_dir / "boundaries" / iso3.lower()
-    rmtree(iso3_dir, ignore_errors=True)
-    iso3_dir.mkdir(parents=True)
-    download_boundaries(iso3_dir, token, iso3, version, force=force_download)
-    has_downloads = any(iso3_dir.glob("*.parquet"))
-    if not has_downloads:
-        rmtree(iso3_dir)
-        if not (force_download or global_metadata_updated):
+    job = _get_job(data_dir, iso3, version)
+    stages = _get_stages(
+        info,
+        journal,
+        metadata_store,
+        force_download=force_download,
+        force_upload=force_upload,
+        global_metadata_updated=global_metadata_updated,
+        test=test,
+        single_upload=single_upload,
+        prechecked=prechecked,
+        layer_store=layer_store,
+    )
+    for stage in stages:
+        with metrics.stage(stage.name, iso3):
+            proceed = stage.func(job)
+        if not proceed:
             return
-    else:
-        formats.main(iso3_dir, iso3)
-    metadata = get_metadata(data_dir, iso3, version)
-    if not has_downloads:
-        dataset = generate_dataset(iso3_dir, iso3, metadata, with_resources=False)
-        if dataset:
-            dataset.update_from_yaml(path=str(cwd / "config/hdx_dataset_static.yaml"))
-            if test:
-                logger.info("Test mode: skipping HDX upload for %s", iso3)
-            else:
-                dataset.create_in_hdx(
-                    remove_additional_resources=False,
-                    match_resource_order=False,
-                    updated_by_script=_UPDATED_BY_SCRIPT,
-                    batch=info["batch"],
+
+
+def _run_country(
+    iso3: str,
+    version: str,
+    **kwargs: Any,  # noqa: ANN401
+) -> tuple[str | None, dict, dict]:
+    """Create a country dataset, returning an error message instead of raising.
+
+    The country's metrics and the HDX lookups it fetched are returned too, so
+    a worker process can hand them back to the parent.
+    """
+    error = None
+    try:
+        _create_country_dataset(iso3=iso3, version=version, **kwargs)
+    except Exception as e:
+        logger.exception("Failed to create dataset for %s %s", iso3, version)
+        error = f"{type(e).__name__}: {e}"
+    return error, metrics.pop(iso3), pop_lookups()
+
+
+def _run_pipelined(
+    layer_list: list[tuple[str, str]],
+    on_done: Callable[[str], None],
+    data_dir: Path,
+    **kwargs: Any,  # noqa: ANN401
+) -> dict[str, str]:
+    """Run countries through download, convert and upload stage pools."""
+    return run_pipeline(
+        (_get_job(data_dir, iso3, version) for iso3, version in layer_list),
+        _get_stages(**kwargs),
+        QUEUE_DEPTH,
+        lambda job: on_done(job.iso3),
+    )
+
+
+def _run_process_pool(
+    layer_list: list[tuple[str, str]],
+    on_done: Callable[[str], None],
+    workers: int,
+    **kwargs: Any,  # noqa: ANN401
+) -> dict[str, str]:
+    """Run whole countries in a pool of forked worker processes.
+
+    Workers are forked so they inherit the HDX configuration set up by facade.
+    The lookups each worker fetches are merged into the parent's lookup
+    cache, so they are saved for the next run.
+    """
+    failures = {}
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=get_context("fork")
+    ) as executor:
+        futures = {
+            executor.submit(_run_country, iso3, version, **kwargs): iso3
+            for iso3, version in layer_list
+        }
+        for future in as_completed(futures):
+            iso3 = futures[future]
+            try:
+                error, record, lookups = future.result()
+                metrics.merge(iso3, record)
+                merge_lookups(lookups)
+            except Exception as e:
+                logger.exception("Worker failed for %s", iso3)
+                error = f"{type(e).__name__}: {e}"
+            if error:
+                failures[iso3] = error
+            on_done(iso3)
+    return failures
+
+
+def _run_countries(
+    layer_list: list[tuple[str, str]],
+    workers: int,
+    pipeline: bool = False,  # noqa: FBT001, FBT002
+    **kwargs: Any,  # noqa: ANN401
+) -> dict[str, str]:
+    """Create datasets for every country, returning failures keyed by ISO3.
+
+    Each country works in its own boundaries/<iso3> directory, so countries
+    are independent. With pipeline, stages of different countries overlap
+    and workers is ignored; otherwise, with more than one worker, whole
+    countries run in a process pool.
+    """
+    with tqdm(total=len(layer_list)) as pbar:
+
+        def on_done(iso3: str) -> None:
+            pbar.set_postfix_str(iso3)
+            pbar.update()
+
+        if pipeline:
+            if workers > 1:
+                logger.warning(
+                    "Ignoring --workers %d with --pipeline; set DOWNLOAD_WORKERS, "
+                    "CONVERT_WORKERS and UPLOAD_WORKERS instead",
+                    workers,
                 )
-        return
-    for i, (ext, format_type) in enumerate(FORMAT_TYPES):
-        dataset = generate_dataset(iso3_dir, iso3, metadata, with_resources=False)
-        if not dataset:
-            break
-        dataset.update_from_yaml(path=str(cwd / "config/hdx_dataset_static.yaml"))
-        add_boundary_resource(
-            dataset, iso3_dir, iso3, metadata, ext, format_type, force_upload
+            return _run_pipelined(layer_list, on_done, **kwargs)
+        if workers > 1:
+            return _run_process_pool(layer_list, on_done, workers, **kwargs)
+        failures = {}
+        for iso3, version in layer_list:
+            pbar.set_postfix_str(iso3)
+            error, record, _ = _run_country(iso3, version, **kwargs)
+            metrics.merge(iso3, record)
+            if error:
+                failures[iso3] = error
+            pbar.update()
+        return failures
+
+
+def _log_cache_counts() -> None:
+    """Log how often each cache was hit over the run, and any retries."""
+    counts = metrics.get_counts()
+    logger.info(
+        "Lookup cache: %d hits, %d misses",
+        counts.get("lookup_cache_hits", 0),
+        counts.get("lookup_cache_misses", 0),
+    )
+    logger.info(
+        "ArcGIS response cache: %d hits, %d revalidated, %d misses",
+        counts.get("http_cache_hits", 0),
+        counts.get("http_cache_revalidated", 0),
+        counts.get("http_cache_misses", 0),
+    )
+    logger.info(
+        "Layer cache: %d hits, %d misses",
+        counts.get("layer_cache_hits", 0),
+        counts.get("layer_cache_misses", 0),
+    )
+    logger.info(
+        "Format cache: %d hits, %d misses",
+        counts.get("format_cache_hits", 0),
+        counts.get("format_cache_misses", 0),
+    )
+    retries = {k: v for k, v in counts.items() if k.startswith("retry_")}
+    if retries:
+        logger.info(
+            "Retries: %s", ", ".join(f"{k} {v}" for k, v in sorted(retries.items()))
         )
-        if i == 0:
-            dataset.preview_resource()
-        if test:
-            logger.info("Test mode: skipping HDX upload for %s (%s)", iso3, format_type)
-        else:
-            dataset.create_in_hdx(
-                remove_additional_resources=(i == 0),
-                match_resource_order=False,
-                updated_by_script=_UPDATED_BY_SCRIPT,
-                batch=info["batch"],
-            )
-    if not test:
-        rmtree(iso3_dir)
 
 
 def main(  # noqa: PLR0913
@@ -100,9 +508,17 @@ def main(  # noqa: PLR0913
     force_upload: bool = False,  # noqa: FBT001, FBT002
     metadata_only: bool = False,  # noqa: FBT001, FBT002
     test: bool = False,  # noqa: FBT001, FBT002
+    workers: int = WORKERS,
+    pipeline: bool = False,  # noqa: FBT001, FBT002
+    resume: bool = False,  # noqa: FBT001, FBT002
+    single_upload: bool = False,  # noqa: FBT001, FBT002
+    prescan: bool = False,  # noqa: FBT001, FBT002
+    incremental: bool = False,  # noqa: FBT001, FBT002
 ) -> None:
     """Generate datasets and create them in HDX."""
     Configuration.read()
+    metrics.reset()
+    retry_policy.reset()
     if iso3_include:
         iso3_include_cfg.clear()
         iso3_include_cfg.extend(
@@ -113,33 +529,79 @@ def main(  # noqa: PLR0913
         iso3_exclude_cfg.extend(
             [x.strip() for x in iso3_exclude.upper().split(",") if x.strip()],
         )
-    with wheretostart_tempdir_batch(folder=_USER_AGENT_LOOKUP) as info:
+    with wheretostart_tempdir_batch(folder=_USER_AGENT_LOOKUP) as info, shared_client():
         temp_dir = info["folder"]
         data_dir = Path(_SAVED_DATA_DIR if save or use_saved else temp_dir)
         data_dir.mkdir(parents=True, exist_ok=True)
-        token = generate_token()
+        lookup_cache = Path(_SAVED_DATA_DIR) / "lookup_cache.json"
+        if save or use_saved:
+            load_lookup_cache(lookup_cache)
+        use_token_cache(
+            Path(_SAVED_DATA_DIR) / "arcgis_token.json" if save or use_saved else None
+        )
+        use_response_cache(
+            Path(_SAVED_DATA_DIR) / "http_cache" if save or use_saved else None
+        )
+        use_layer_cache(
+            Path(_SAVED_DATA_DIR) / "layer_cache" if save or use_saved else None
+        )
+        formats.use_format_cache(
+            Path(_SAVED_DATA_DIR) / "format_cache" if save or use_saved else None
+        )
+        token = get_token()
         download_metadata(data_dir, token)
         params = {"f": "json", "token": token}
         global_metadata_updated = metadata_only or is_recently_updated(
             ARCGIS_METADATA_URL, params, ARCGIS_METADATA_SERVICE_URL
         )
-        layer_list = get_layer_list(data_dir)
-        pbar = tqdm(layer_list)
-        for iso3, version in pbar:
-            pbar.set_postfix_str(iso3)
-            _create_country_dataset(
-                info,
-                data_dir,
-                token,
-                iso3,
-                version,
-                force_download=force_download or test,
-                force_upload=force_upload,
-                global_metadata_updated=global_metadata_updated,
-                test=test,
-            )
+        metadata_store = MetadataStore.from_parquet(
+            data_dir / "metadata/metadata_all.parquet"
+        )
+        layer_list = get_layer_list(data_dir, metadata_store)
+        prechecked = prescan and not (force_download or test or global_metadata_updated)
+        if prechecked:
+            changed = find_changed_countries(layer_list, token, PRESCAN_CONCURRENCY)
+            layer_list = [x for x in layer_list if x[0] in changed]
+        journal = Journal(Path(_SAVED_DATA_DIR) / "journal", resume=resume)
+        failures = _run_countries(
+            layer_list,
+            workers,
+            pipeline,
+            info=info,
+            data_dir=data_dir,
+            journal=journal,
+            metadata_store=metadata_store,
+            force_download=force_download or test,
+            force_upload=force_upload,
+            global_metadata_updated=global_metadata_updated,
+            test=test,
+            single_upload=single_upload,
+            prechecked=prechecked,
+            layer_store=(
+                LayerStore(Path(_SAVED_DATA_DIR) / "layers") if incremental else None
+            ),
+        )
+        if save or use_saved:
+            save_lookup_cache(lookup_cache)
         if not test and not (save or use_saved):
             rmtree(data_dir)
+        _log_cache_counts()
+        metrics.write_report(
+            Path(_SAVED_DATA_DIR) / "reports",
+            REPORT_TOP_N,
+            countries_run=len(layer_list),
+            failures=failures,
+        )
+        logger.info(
+            "Finished %d of %d countries",
+            len(layer_list) - len(failures),
+            len(layer_list),
+        )
+        if failures:
+            for iso3, error in sorted(failures.items()):
+                logger.error("%s failed: %s", iso3, error)
+            msg = f"{len(failures)} countries failed: {', '.join(sorted(failures))}"
+            raise RuntimeError(msg)
 
 
 if __name__ == "__main__":
@@ -1,46 +1,233 @@
 """ArcGIS REST API client utilities."""
 
+import json
 import logging
+from collections.abc import Iterator
+from contextlib import contextmanager
 from datetime import UTC, datetime, timedelta
+from os import register_at_fork
 from pathlib import Path
+from threading import Lock
+from time import time
+from urllib.parse import urlencode
 from xml.etree.ElementTree import ParseError
 
 from defusedxml.ElementTree import fromstring
-from httpx import Client, Response
+from httpx import Client, Limits, Request, Response, codes
 from pandas import read_parquet
-from tenacity import retry, stop_after_attempt, wait_fixed
 
+from . import metrics
+from .auth import TokenManager
+from .cache import FileCache
 from .config import (
     ARCGIS_PASSWORD,
     ARCGIS_SERVER,
+    ARCGIS_SERVICE_URL,
     ARCGIS_USERNAME,
-    ATTEMPT,
     EXPIRATION,
+    HTTP_CACHE_MAX_MB,
+    HTTP_CACHE_TTL,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
     TIMEOUT,
-    WAIT,
+    TOKEN_REFRESH_MARGIN,
     iso3_include_cfg,
 )
+from .metadata import MetadataStore
+from .retry import retry_policy
 
 logger = logging.getLogger(__name__)
 
 _DATE_LEN = 8
 _CUTOFF_DAYS = 1.5
+_INVALID_TOKEN = (498, 499)
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+_EDIT_DATE_KEYS = ("lastEditDate", "dataLastEditDate", "schemaLastEditDate")
 _DATE_TIME_PAIRS = [
     ("CreaDate", "CreaTime"),
     ("SyncDate", "SyncTime"),
     ("ModDate", "ModTime"),
 ]
 
+_client: Client | None = None
+_client_lock = Lock()
 
-@retry(stop=stop_after_attempt(ATTEMPT), wait=wait_fixed(WAIT))
-def client_get(url: str, params: dict | None = None) -> Response:
-    """HTTP GET with retries, waiting, and longer timeouts."""
-    with Client(http2=True, timeout=TIMEOUT) as client:
-        return client.get(url, params=params)
 
+def _forget_client() -> None:
+    """Drop the parent's client in a forked child, which must not share sockets."""
+    global _client, _client_lock  # noqa: PLW0603
+    _client = None
+    _client_lock = Lock()
 
-def generate_token() -> str:
-    """Generate a token for ArcGIS Server."""
+
+register_at_fork(after_in_child=_forget_client)
+
+
+def get_client() -> Client:
+    """Get the shared HTTP/2 client, creating it on first use.
+
+    Connections are pooled and kept alive, so TLS and HTTP/2 setup is paid
+    once per host rather than once per request.
+    """
+    global _client  # noqa: PLW0603
+    with _client_lock:
+        if _client is None:
+            _client = Client(
+                http2=True,
+                timeout=TIMEOUT,
+                limits=Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+            )
+        return _client
+
+
+def close_client() -> None:
+    """Close the shared client and its pooled connections."""
+    global _client  # noqa: PLW0603
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+@contextmanager
+def shared_client() -> Iterator[Client]:
+    """Use the shared client for the duration of a block, then close it."""
+    try:
+        yield get_client()
+    finally:
+        close_client()
+
+
+def error_code(response: Response) -> int | None:
+    """Return the error code of a response, as a status or an ArcGIS JSON error."""
+    if response.status_code != codes.OK:
+        return response.status_code
+    if b'"error"' not in response.content[:100]:
+        return None
+    try:
+        error = response.json().get("error") or {}
+    except (ValueError, AttributeError):
+        return None
+    return error.get("code")
+
+
+def _get(url: str, params: dict | None, headers: dict | None = None) -> Response:
+    with metrics.timed("arcgis_query"):
+        response = get_client().get(url, params=params, headers=headers)
+    metrics.add_bytes_downloaded(len(response.content))
+    return response
+
+
+_response_cache: FileCache | None = None
+
+
+def use_response_cache(directory: Path | None) -> None:
+    """Cache ArcGIS responses in directory, or stop caching them if None."""
+    global _response_cache  # noqa: PLW0603
+    _response_cache = (
+        FileCache(directory, HTTP_CACHE_MAX_MB * 1024 * 1024) if directory else None
+    )
+
+
+def _cache_key(url: str, params: dict | None) -> str:
+    """Key a request by URL and params, leaving out the token."""
+    kept = sorted((k, v) for k, v in (params or {}).items() if k != "token")
+    return f"{url}?{urlencode(kept)}"
+
+
+def _read_cached(cache: FileCache, key: str) -> tuple[dict, bytes] | None:
+    data = cache.get(key)
+    if data is None:
+        return None
+    header, _, content = data.partition(b"\n")
+    try:
+        return json.loads(header), content
+    except ValueError:
+        return None
+
+
+def _write_cached(cache: FileCache, key: str, meta: dict, content: bytes) -> None:
+    cache.put(key, json.dumps(meta).encode() + b"\n" + content)
+
+
+def _cached_response(url: str, meta: dict, content: bytes) -> Response:
+    return Response(
+        codes.OK,
+        content=content,
+        headers={"content-type": meta.get("content_type") or ""},
+        request=Request("GET", url),
+    )
+
+
+def _cached_get(url: str, params: dict | None, *, cache: bool = True) -> Response:
+    """GET through the response cache, if one is in use.
+
+    Entries with an ETag or Last-Modified value are revalidated with a
+    conditional request. Entries without either are reused for
+    HTTP_CACHE_TTL seconds.
+    """
+    store = _response_cache if cache else None
+    if store is None:
+        return _get(url, params)
+    key = _cache_key(url, params)
+    cached = _read_cached(store, key)
+    headers = {}
+    if cached is not None:
+        meta, content = cached
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        if not headers and time() - meta["stored"] < HTTP_CACHE_TTL:
+            metrics.add_count("http_cache_hits")
+            return _cached_response(url, meta, content)
+    response = _get(url, params, headers)
+    if cached is not None and response.status_code == codes.NOT_MODIFIED:
+        metrics.add_count("http_cache_revalidated")
+        meta, content = cached
+        _write_cached(store, key, {**meta, "stored": time()}, content)
+        return _cached_response(url, meta, content)
+    metrics.add_count("http_cache_misses")
+    if error_code(response) is None:
+        meta = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "content_type": response.headers.get("content-type"),
+            "stored": time(),
+        }
+        _write_cached(store, key, meta, response.content)
+    return response
+
+
+@retry_policy
+def client_get(url: str, params: dict | None = None, *, cache: bool = True) -> Response:
+    """HTTP GET with retries, waiting, and longer timeouts.
+
+    Transport errors and rate-limit or server error statuses are retried.
+    Responses are cached if a response cache is in use, unless cache is False.
+    A token in params from get_token is replaced with the current one, so
+    params can be reused after it expires. If ArcGIS rejects the token, it is
+    refreshed and the request sent again.
+    """
+    if params and params.get("token"):
+        params = {**params, "token": _tokens.current(params["token"])}
+    response = _cached_get(url, params, cache=cache)
+    if params and params.get("token") and error_code(response) in _INVALID_TOKEN:
+        logger.warning("ArcGIS token rejected, re-authenticating")
+        metrics.add_count("token_refreshes")
+        params = {**params, "token": refresh_token(params["token"])}
+        response = _cached_get(url, params, cache=cache)
+    if response.status_code in _RETRY_STATUS:
+        response.raise_for_status()
+    return response
+
+
+def _generate_token() -> tuple[str, float]:
     url = f"{ARCGIS_SERVER}/portal/sharing/rest/generateToken"
     data = {
         "username": ARCGIS_USERNAME,
@@ -49,17 +236,67 @@ def generate_token() -> str:
         "expiration": EXPIRATION,
         "f": "json",
     }
-    with Client(http2=True) as client:
-        r = client.post(url, data=data).json()
-        return r["token"]
+    r = get_client().post(url, data=data).json()
+    expires = r.get("expires")
+    return r["token"], expires / 1000 if expires else time() + EXPIRATION * 60
+
+
+_tokens = TokenManager(
+    _generate_token, f"{ARCGIS_USERNAME}@{ARCGIS_SERVER}", TOKEN_REFRESH_MARGIN * 60
+)
+
+
+def use_token_cache(path: Path | None) -> None:
+    """Save tokens to path and reuse them from there, or keep them in memory."""
+    _tokens.cache_path = path
+
 
+def get_token() -> str:
+    """Get a cached ArcGIS token, generating one if it is close to expiry."""
+    return _tokens.get()
 
-def get_layer_list(data_dir: Path) -> list[tuple[str, str]]:
-    """Get a list of ISO3 codes available on the ArcGIS server."""
-    layers = read_parquet(
-        data_dir / "metadata/metadata_latest.parquet",
-        columns=["country_iso3", "version"],
-    ).itertuples(index=False, name=None)
+
+def refresh_token(stale: str) -> str:
+    """Get a new ArcGIS token to replace one the server rejected."""
+    return _tokens.refresh(stale)
+
+
+def get_service_url(iso3: str, version: str) -> str:
+    """Get the FeatureServer URL for a country's COD-AB service."""
+    return f"{ARCGIS_SERVICE_URL}/cod_ab_{iso3.lower()}_{version}/FeatureServer"
+
+
+def get_last_edit_date(response: dict) -> int | None:
+    """Get the last edit timestamp (ms since epoch) from service or layer JSON."""
+    return response.get("editingInfo", {}).get("lastEditDate")
+
+
+def get_edit_datetimes(response: dict) -> list[datetime] | None:
+    """Get UTC edit datetimes from service or layer JSON, or None if it has none."""
+    editing_info = response.get("editingInfo") or {}
+    datetimes = [
+        datetime.fromtimestamp(editing_info[key] / 1000, tz=UTC)
+        for key in _EDIT_DATE_KEYS
+        if editing_info.get(key)
+    ]
+    return datetimes or None
+
+
+def get_layer_list(
+    data_dir: Path, store: MetadataStore | None = None
+) -> list[tuple[str, str]]:
+    """Get a list of ISO3 codes available on the ArcGIS server.
+
+    If a metadata store is given, its latest versions are used instead of
+    reading metadata_latest.parquet.
+    """
+    if store is not None:
+        layers = store.latest()
+    else:
+        layers = read_parquet(
+            data_dir / "metadata/metadata_latest.parquet",
+            columns=["country_iso3", "version"],
+        ).itertuples(index=False, name=None)
     layer_list = []
     for iso3, version in layers:
         if iso3_include_cfg:
@@ -76,17 +313,6 @@ def get_layer_list(data_dir: Path) -> list[tuple[str, str]]:
     return layer_list
 
 
-def get_metadata(data_dir: Path, iso3: str, version: str) -> dict:
-    """Get metadata for a country."""
-    df = read_parquet(data_dir / "metadata/metadata_all.parquet")
-    try:
-        df_meta = df[(df["country_iso3"] == iso3) & (df["version"] == version)]
-        return df_meta.to_dict("records")[0]
-    except IndexError:
-        logger.exception("Metadata not found for %s", iso3)
-        return {}
-
-
 def _parse_date_time(date_str: str, time_str: str) -> datetime | None:
     """Parse a YYYYMMDD + HHMMSSxx string pair into a UTC datetime."""
     try:
@@ -103,23 +329,12 @@ def _parse_date_time(date_str: str, time_str: str) -> datetime | None:
         return None
 
 
-def parse_metadata_datetimes(
-    url: str, params: dict, service_url: str
-) -> list[datetime]:
-    """Fetch layer metadata XML and return all UTC datetimes found."""
-    response = client_get(f"{url}/metadata", params)
+def parse_metadata_xml(text: str) -> list[datetime] | None:
+    """Return all UTC datetimes in layer metadata XML, or None if it is invalid."""
     try:
-        root = fromstring(response.text)
+        root = fromstring(text)
     except ParseError:
-        logger.warning("Failed to parse metadata XML from %s/metadata", url)
-        response = client_get(f"{service_url}/info/metadata", params)
-        try:
-            root = fromstring(response.text)
-        except ParseError:
-            logger.warning(
-                "Failed to parse metadata XML from %s/info/metadata", service_url
-            )
-            return []
+        return None
     datetimes = []
     esri = root.find("Esri")
     if esri is not None:
@@ -138,9 +353,57 @@ def parse_metadata_datetimes(
     return datetimes
 
 
+def parse_metadata_datetimes(
+    url: str, params: dict, service_url: str
+) -> list[datetime]:
+    """Fetch layer metadata XML and return all UTC datetimes found."""
+    response = client_get(f"{url}/metadata", params)
+    datetimes = parse_metadata_xml(response.text)
+    if datetimes is None:
+        logger.warning("Failed to parse metadata XML from %s/metadata", url)
+        response = client_get(f"{service_url}/info/metadata", params)
+        datetimes = parse_metadata_xml(response.text)
+        if datetimes is None:
+            logger.warning(
+                "Failed to parse metadata XML from %s/info/metadata", service_url
+            )
+            return []
+    return datetimes
+
+
+def is_recent(datetimes: list[datetime]) -> bool:
+    """Return True if any datetime is within the last 1.5 days."""
+    cutoff_utc = datetime.now(UTC) - timedelta(days=_CUTOFF_DAYS)
+    return any(dt > cutoff_utc for dt in datetimes)
+
+
 def is_recently_updated(url: str, params: dict, service_url: str) -> bool:
     """Return True if any metadata datetime is within the last 1.5 days."""
-    cutoff_utc = datetime.now(UTC) - timedelta(days=_CUTOFF_DAYS)
-    return any(
-        dt > cutoff_utc for dt in parse_metadata_datetimes(url, params, service_url)
-    )
+    return is_recent(parse_metadata_datetimes(url, params, service_url))
+
+
+def is_service_recently_updated(
+    service_url: str, params: dict, service: dict, layers: dict[int, dict]
+) -> bool:
+    """Return True if the service or any of its layers was edited recently.
+
+    Uses the editingInfo timestamps of the service and layer JSON already
+    fetched, and only falls back to metadata XML for layers without them.
+    """
+    datetimes = get_edit_datetimes(service)
+    if datetimes and is_recent(datetimes):
+        metrics.add_count("change_checks_edit_info")
+        return True
+    for layer_id, layer in layers.items():
+        datetimes = get_edit_datetimes(layer)
+        if datetimes is None:
+            metrics.add_count("change_checks_xml")
+            recent = is_recently_updated(
+                f"{service_url}/{layer_id}", params, service_url
+            )
+        else:
+            metrics.add_count("change_checks_edit_info")
+            recent = is_recent(datetimes)
+        if recent:
+            return True
+    return False
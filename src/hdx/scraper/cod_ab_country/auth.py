@@ -0,0 +1,128 @@
+"""ArcGIS token caching shared across threads, processes and runs."""
+
+import json
+import logging
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from fcntl import LOCK_EX, LOCK_UN, flock
+from os import register_at_fork
+from pathlib import Path
+from threading import Lock
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenManager:
+    """An ArcGIS token that is refreshed before it expires.
+
+    If a cache path is given, the token and its expiry are saved there, so
+    later runs and other worker processes reuse it instead of logging in
+    again. The file is only rewritten under an exclusive lock, and a worker
+    that finds a fresher token in it than the one it had adopts that token.
+    Tokens it has handed out are remembered, so one a caller held on to can
+    be swapped for the current token.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[], tuple[str, float]],
+        key: str,
+        margin: float,
+        cache_path: Path | None = None,
+    ) -> None:
+        """Manage tokens from generate, which returns (token, expiry epoch seconds).
+
+        Tokens are refreshed margin seconds before they expire. The key, e.g.
+        user and server, guards against reusing a cached token for another
+        account.
+        """
+        self.generate = generate
+        self.key = key
+        self.margin = margin
+        self.cache_path = cache_path
+        self._token: str | None = None
+        self._expires = 0.0
+        self._issued: set[str] = set()
+        self._lock = Lock()
+        register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self) -> None:
+        self._lock = Lock()
+
+    def _is_fresh(self, expires: float) -> bool:
+        return expires - time() > self.margin
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        if self.cache_path is None:
+            yield
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.cache_path.with_suffix(".lock").open("a") as f:
+            flock(f, LOCK_EX)
+            try:
+                yield
+            finally:
+                flock(f, LOCK_UN)
+
+    def _read(self) -> tuple[str | None, float]:
+        if self.cache_path is None:
+            return None, 0.0
+        try:
+            entry = json.loads(self.cache_path.read_text())
+        except (OSError, ValueError):
+            return None, 0.0
+        if entry.get("key") != self.key:
+            return None, 0.0
+        return entry.get("token"), entry.get("expires", 0.0)
+
+    def _write(self) -> None:
+        if self.cache_path is None:
+            return
+        tmp = self.cache_path.with_suffix(".tmp")
+        tmp.touch(mode=0o600)
+        tmp.write_text(
+            json.dumps(
+                {"key": self.key, "token": self._token, "expires": self._expires}
+            )
+        )
+        tmp.replace(self.cache_path)
+
+    def _renew(self, stale: str | None) -> str:
+        """Adopt a fresh cached token other than stale, or generate one. Hold locks."""
+        token, expires = self._read()
+        if token and token != stale and self._is_fresh(expires):
+            self._token, self._expires = token, expires
+        else:
+            logger.info("Generating ArcGIS token")
+            self._token, self._expires = self.generate()
+            self._write()
+        self._issued.add(self._token)
+        return self._token
+
+    def get(self) -> str:
+        """Return a token valid for at least margin seconds."""
+        with self._lock:
+            if self._token and self._is_fresh(self._expires):
+                return self._token
+            with self._file_lock():
+                return self._renew(None)
+
+    def current(self, token: str) -> str:
+        """Return the token to send in place of token.
+
+        A token handed out here is swapped for the current one, renewed if
+        close to expiry. Any other token is returned as is.
+        """
+        with self._lock:
+            issued = token in self._issued
+        return self.get() if issued else token
+
+    def refresh(self, stale: str) -> str:
+        """Replace a token the server rejected, unless it was already replaced."""
+        with self._lock:
+            if self._token and self._token != stale and self._is_fresh(self._expires):
+                return self._token
+            with self._file_lock():
+                return self._renew(stale)
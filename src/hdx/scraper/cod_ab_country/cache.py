@@ -0,0 +1,129 @@
+"""On-disk cache of files keyed by string, capped in size."""
+
+import logging
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+from fcntl import LOCK_EX, LOCK_UN, flock
+from hashlib import sha256
+from os import getpid, utime
+from pathlib import Path
+from shutil import copyfile
+from threading import Lock, get_ident
+
+logger = logging.getLogger(__name__)
+
+
+class FileCache:
+    """Files stored under string keys, evicting the least recently used.
+
+    Writes go to a temporary file that is renamed into place, so readers in
+    other threads or processes never see a partial entry. Reading an entry
+    updates its modification time, which eviction uses as its last use.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        """Open a cache in directory that holds at most max_bytes."""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        directory.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+        self._size = self._scan_size()
+
+    def path(self, key: str) -> Path:
+        """Return where the entry for key is stored, whether or not it exists."""
+        return self.directory / sha256(key.encode()).hexdigest()
+
+    def _entries(self) -> list[Path]:
+        return [x for x in self.directory.iterdir() if len(x.name) == 64]  # noqa: PLR2004
+
+    def _scan_size(self) -> int:
+        return sum(x.stat().st_size for x in self._entries())
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with (self.directory / ".lock").open("a") as f:
+            flock(f, LOCK_EX)
+            try:
+                yield
+            finally:
+                flock(f, LOCK_UN)
+
+    def get(self, key: str) -> bytes | None:
+        """Return the entry for key, or None if there is none."""
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        with suppress(FileNotFoundError):
+            utime(path)
+        return data
+
+    def get_file(self, key: str, dst: Path) -> bool:
+        """Copy the entry for key to dst, returning False if there is none.
+
+        The entry is copied on disk rather than read into memory, and dst is
+        replaced in one rename.
+        """
+        path = self.path(key)
+        tmp = self._tmp(dst)
+        try:
+            copyfile(path, tmp)
+        except FileNotFoundError:
+            return False
+        tmp.replace(dst)
+        with suppress(FileNotFoundError):
+            utime(path)
+        return True
+
+    def _tmp(self, path: Path) -> Path:
+        return path.with_name(f".{path.name}.{getpid()}.{get_ident()}.tmp")
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store data under key, then evict entries if over the size cap."""
+        path = self.path(key)
+        tmp = self._tmp(path)
+        tmp.write_bytes(data)
+        self._replace(tmp, path)
+
+    def put_file(self, key: str, src: Path) -> None:
+        """Store a copy of the file src under key, without reading it into memory."""
+        path = self.path(key)
+        tmp = self._tmp(path)
+        copyfile(src, tmp)
+        self._replace(tmp, path)
+
+    def _replace(self, tmp: Path, path: Path) -> None:
+        """Rename tmp over the entry at path, then evict if over the size cap.
+
+        Only the change in size is counted, so replacing an entry with one of
+        the same size never triggers eviction.
+        """
+        size = tmp.stat().st_size
+        with suppress(FileNotFoundError):
+            size -= path.stat().st_size
+        tmp.replace(path)
+        with self._lock:
+            self._size += size
+            if self._size <= self.max_bytes:
+                return
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete the least recently used entries until within the size cap."""
+        with self._lock, self._file_lock():
+            entries = []
+            for path in self._entries():
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            size = sum(x[1] for x in entries)
+            for _, entry_size, path in sorted(entries):
+                if size <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                size -= entry_size
+            self._size = size
+        logger.debug("Cache %s trimmed to %d bytes", self.directory, size)
@@ -0,0 +1,103 @@
+"""Up-front change detection across all countries."""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+from httpx import Response
+
+from .arcgis import (
+    client_get,
+    error_code,
+    get_edit_datetimes,
+    get_service_url,
+    is_recent,
+    parse_metadata_xml,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _ArcGISError(Exception):
+    """An error ArcGIS reported in place of the requested JSON or XML."""
+
+
+def _get(url: str, params: dict) -> Response:
+    """GET through the shared client, with its retries and token refresh.
+
+    Responses are never read from the response cache, so a stale edit date
+    cannot hide a change. Raises if ArcGIS answers with an error, even one
+    sent with HTTP 200.
+    """
+    response = client_get(url, params, cache=False)
+    code = error_code(response)
+    if code is not None:
+        msg = f"ArcGIS error {code} from {url}"
+        raise _ArcGISError(msg)
+    return response
+
+
+def _is_layer_changed(url: str, params: dict, service_url: str) -> bool:
+    """Check one layer's editingInfo, falling back to its metadata XML."""
+    datetimes = get_edit_datetimes(_get(url, params).json())
+    if datetimes is not None:
+        return is_recent(datetimes)
+    datetimes = parse_metadata_xml(_get(f"{url}/metadata", params).text)
+    if datetimes is None:
+        response = _get(f"{service_url}/info/metadata", params)
+        datetimes = parse_metadata_xml(response.text)
+    return is_recent(datetimes or [])
+
+
+def _is_country_changed(iso3: str, version: str, params: dict) -> bool:
+    """Check whether any feature layer of a country was recently modified.
+
+    Errors, including ArcGIS errors sent with HTTP 200, count as changed,
+    leaving the country to the full pipeline.
+    """
+    url = get_service_url(iso3, version)
+    try:
+        service = _get(url, params).json()
+        if "layers" not in service:
+            return False
+        datetimes = get_edit_datetimes(service)
+        if datetimes and is_recent(datetimes):
+            return True
+        return any(
+            _is_layer_changed(f"{url}/{x['id']}", params, url)
+            for x in service["layers"]
+            if x["type"] == "Feature Layer"
+        )
+    except Exception:
+        logger.exception("Change detection failed for %s %s", iso3, version)
+        return True
+
+
+def find_changed_countries(
+    layer_list: list[tuple[str, str]], token: str, concurrency: int
+) -> set[str]:
+    """Return the countries with a feature layer modified in the last 1.5 days.
+
+    Probes countries on up to concurrency threads before any heavy work
+    starts. Requests go through the shared client, so they are retried and a
+    rejected token is refreshed as for any other ArcGIS request.
+    """
+    params = {"f": "json", "token": token}
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        futures = [
+            executor.submit(
+                copy_context().run, _is_country_changed, iso3, version, params
+            )
+            for iso3, version in layer_list
+        ]
+        changed = {
+            iso3
+            for (iso3, _), future in zip(layer_list, futures, strict=True)
+            if future.result()
+        }
+    logger.info(
+        "Change detection: %d of %d countries modified",
+        len(changed),
+        len(layer_list),
+    )
+    return changed
@@ -44,8 +44,36 @@ ARCGIS_METADATA_URL = f"{ARCGIS_METADATA_SERVICE_URL}/0"
 
 ATTEMPT = int(getenv("ATTEMPT", "5"))
 WAIT = int(getenv("WAIT", "10"))
+RETRY_MAX_WAIT = int(getenv("RETRY_MAX_WAIT", "120"))  # seconds
+RETRY_DEADLINE = int(getenv("RETRY_DEADLINE", "1800"))  # seconds per country
+RETRY_BUDGET = int(getenv("RETRY_BUDGET", "200"))  # retries per run
+CIRCUIT_BREAKER_FAILURES = int(getenv("CIRCUIT_BREAKER_FAILURES", "8"))
 TIMEOUT = int(getenv("TIMEOUT", "60"))
+HTTP_MAX_CONNECTIONS = int(getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = int(getenv("HTTP_KEEPALIVE_EXPIRY", "60"))  # seconds
+HTTP_CACHE_TTL = int(getenv("HTTP_CACHE_TTL", "600"))  # seconds
+HTTP_CACHE_MAX_MB = int(getenv("HTTP_CACHE_MAX_MB", "256"))
 EXPIRATION = int(getenv("EXPIRATION", "1440"))  # minutes (1 day)
+TOKEN_REFRESH_MARGIN = int(getenv("TOKEN_REFRESH_MARGIN", "60"))  # minutes
+WORKERS = int(getenv("WORKERS", "1"))
+DOWNLOAD_WORKERS = int(getenv("DOWNLOAD_WORKERS", "2"))
+CONVERT_WORKERS = int(getenv("CONVERT_WORKERS", "2"))
+UPLOAD_WORKERS = int(getenv("UPLOAD_WORKERS", "1"))
+CONVERT_ENGINE = getenv("CONVERT_ENGINE", "pyogrio").lower()  # pyogrio or subprocess
+FORMAT_WORKERS = int(getenv("FORMAT_WORKERS", "1"))
+ZIP_COMPRESSION_LEVEL = int(getenv("ZIP_COMPRESSION_LEVEL", "6"))  # 0 stores
+QUEUE_DEPTH = int(getenv("QUEUE_DEPTH", "2"))
+LAYER_WORKERS = int(getenv("LAYER_WORKERS", "4"))
+LAYER_CACHE_MAX_MB = int(getenv("LAYER_CACHE_MAX_MB", "2048"))
+FORMAT_CACHE_MAX_MB = int(getenv("FORMAT_CACHE_MAX_MB", "4096"))
+DELTA_OVERLAP = int(getenv("DELTA_OVERLAP", "3600"))  # seconds
+DOWNLOAD_FORMAT = getenv("DOWNLOAD_FORMAT", "json").lower()  # json or pbf
+PAGE_SIZE = int(getenv("PAGE_SIZE", "1000"))  # features per page, at most
+PAGE_WORKERS = int(getenv("PAGE_WORKERS", "4"))
+PRESCAN_CONCURRENCY = int(getenv("PRESCAN_CONCURRENCY", "16"))
+REPORT_TOP_N = int(getenv("REPORT_TOP_N", "10"))
+LOOKUP_CACHE_TTL = int(getenv("LOOKUP_CACHE_TTL", "86400"))  # seconds (1 day)
 
 ISO3_EXCLUDE_DEFAULTS = "COL,ECU,QAT"
 
@@ -1,8 +1,13 @@
 # flake8: noqa: E501
 """HDX dataset generation for COD-AB country data."""
 
+import json
 import logging
+from collections.abc import Callable
 from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Any
 
 from hdx.data.dataset import Dataset
 from hdx.data.organization import Organization
@@ -10,7 +15,8 @@ from hdx.data.resource import Resource
 from hdx.location.country import Country
 from pandas import isna
 
-from .config import OCHA_ORG_NAME
+from . import metrics
+from .config import LOOKUP_CACHE_TTL, OCHA_ORG_NAME
 from .geodata.compare import compare_geodata
 
 logger = logging.getLogger(__name__)
@@ -22,10 +28,108 @@ FORMAT_TYPES = [
     ("xlsx", "XLSX"),
 ]
 
+COMPARED_EXTS = ("gdb.zip", "shp.zip")
+
+
+class _LookupCache:
+    """Memoized HDX lookups that expire after a TTL.
+
+    Entries are JSON-serializable so they can be saved between runs, or
+    handed from a worker process back to the parent.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._entries: dict[str, tuple[float, Any]] = {}
+        self._fetched: dict[str, tuple[float, Any]] = {}
+        self._lock = Lock()
+
+    def get(self, key: str, fetch: Callable[[], Any]) -> Any:  # noqa: ANN401
+        """Return the cached value for key, calling fetch if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and time() - entry[0] < self.ttl:
+            metrics.add_count("lookup_cache_hits")
+            return entry[1]
+        metrics.add_count("lookup_cache_misses")
+        value = fetch()
+        with self._lock:
+            self._entries[key] = self._fetched[key] = (time(), value)
+        return value
+
+    def pop_fetched(self) -> dict[str, tuple[float, Any]]:
+        """Return the entries fetched since the last call, and forget them."""
+        with self._lock:
+            fetched, self._fetched = self._fetched, {}
+        return fetched
+
+    def merge(self, entries: dict[str, tuple[float, Any]]) -> None:
+        """Add entries fetched elsewhere, such as in a worker process."""
+        with self._lock:
+            self._entries.update(entries)
+
+    def load(self, path: Path) -> None:
+        """Load unexpired entries saved by a previous run."""
+        try:
+            entries = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return
+        now = time()
+        with self._lock:
+            self._entries.update(
+                {k: (t, v) for k, (t, v) in entries.items() if now - t < self.ttl}
+            )
+
+    def save(self, path: Path) -> None:
+        """Save entries so the next run can reuse them."""
+        with self._lock:
+            entries = dict(self._entries)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(entries))
+        tmp.replace(path)
+
+
+_lookup_cache = _LookupCache(LOOKUP_CACHE_TTL)
+
+
+def load_lookup_cache(path: Path) -> None:
+    """Load HDX organization and country lookups saved by a previous run."""
+    _lookup_cache.load(path)
+
+
+def save_lookup_cache(path: Path) -> None:
+    """Save HDX organization and country lookups for the next run."""
+    _lookup_cache.save(path)
+
+
+def pop_lookups() -> dict[str, tuple[float, Any]]:
+    """Return the lookups fetched since the last call, for a parent process."""
+    return _lookup_cache.pop_fetched()
+
+
+def merge_lookups(entries: dict[str, tuple[float, Any]]) -> None:
+    """Add lookups fetched in a worker process, so they are saved too."""
+    _lookup_cache.merge(entries)
+
+
+def _autocomplete_organization(name: str) -> list[dict]:
+    """Look up HDX organizations matching a name."""
+    return _lookup_cache.get(
+        f"organization:{name}", lambda: Organization.autocomplete(name)
+    )
+
+
+def _get_country_name(iso3: str) -> str | None:
+    """Look up the country name for an ISO3 code."""
+    return _lookup_cache.get(
+        f"country:{iso3}", lambda: Country.get_country_name_from_iso3(iso3)
+    )
+
 
 def _initialize_dataset(iso3: str) -> Dataset | None:
     """Initialize a dataset."""
-    country_name = Country.get_country_name_from_iso3(iso3)
+    country_name = _get_country_name(iso3)
     if not country_name:
         logger.error("Country not found for %s", iso3)
         return None
@@ -48,7 +152,7 @@ def _add_metadata(iso3: str, metadata: dict, dataset: Dataset) -> Dataset | None
     dataset["data_update_frequency"] = metadata["update_frequency"] * 365
     dataset.add_country_location(iso3)
     dataset["dataset_source"] = metadata["source"]
-    org = Organization.autocomplete(OCHA_ORG_NAME)
+    org = _autocomplete_organization(OCHA_ORG_NAME)
     dataset.set_organization(org[0])
     methodology_dataset = metadata["methodology_dataset"]
     methodology_pcodes = metadata["methodology_pcodes"]
@@ -65,12 +169,12 @@ def _add_metadata(iso3: str, metadata: dict, dataset: Dataset) -> Dataset | None
 
 def _get_notes(iso3: str, metadata: dict) -> str:
     """Compile notes for a dataset."""
-    country_name = Country.get_country_name_from_iso3(iso3)
+    country_name = _get_country_name(iso3)
     admin_levels = metadata["admin_level_max"]
     admin_level_range = "0" if admin_levels == 0 else f"0-{admin_levels}"
     levels_plural = "s" if admin_levels != 1 else ""
     org_name_raw = metadata["contributor"]
-    org = Organization.autocomplete(org_name_raw)
+    org = _autocomplete_organization(org_name_raw)
     org_cfg = None
     if len(org) in (1, 2):
         org_cfg = org[0]
@@ -141,6 +245,11 @@ def _get_notes(iso3: str, metadata: dict) -> str:
     return "  \n".join(lines)
 
 
+def get_resource_name(iso3: str, ext: str) -> str:
+    """Get the file name of a boundary format resource."""
+    return f"{iso3.lower()}_admin_boundaries.{ext}"
+
+
 def add_boundary_resource(  # noqa: PLR0913
     dataset: Dataset,
     iso3_dir: Path,
@@ -149,23 +258,29 @@ def add_boundary_resource(  # noqa: PLR0913
     ext: str,
     format_type: str,
     force_upload: bool = False,  # noqa: FBT001, FBT002
+    file_to_upload: Path | None = None,
 ) -> None:
-    """Add a single boundary format resource to a dataset."""
+    """Add a single boundary format resource to a dataset.
+
+    If file_to_upload is given, it is used as-is instead of comparing the
+    local file against the one already in HDX.
+    """
     admin_level = metadata["admin_level_max"]
-    country_name = Country.get_country_name_from_iso3(iso3)
+    country_name = _get_country_name(iso3)
     admin_level_range = "0" if admin_level == 0 else f"0-{admin_level}"
-    resource_name = f"{iso3.lower()}_admin_boundaries.{ext}"
+    resource_name = get_resource_name(iso3, ext)
     resource_desc = f"{country_name} administrative level {admin_level_range} boundaries (COD-AB), {format_type}"
     resource_data = {"name": resource_name, "description": resource_desc}
     if admin_level > 0:
         resource_data["p_coded"] = "True"
     resource = Resource(resource_data)
-    file_to_upload = iso3_dir / resource_name
-    if ext in ("gdb.zip", "shp.zip") and not force_upload:
-        file_to_upload = compare_geodata(
-            iso3_dir / resource_name,
-            dataset.get_name_or_id(),
-        )
+    if file_to_upload is None:
+        file_to_upload = iso3_dir / resource_name
+        if ext in COMPARED_EXTS and not force_upload:
+            file_to_upload = compare_geodata(
+                iso3_dir / resource_name,
+                dataset.get_name_or_id(),
+            )
     resource.set_file_to_upload(file_to_upload)
     resource.set_format(format_type)
     dataset.add_update_resource(resource)
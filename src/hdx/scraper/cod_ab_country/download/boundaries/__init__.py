@@ -1,57 +1,124 @@
 """Boundary layer download pipeline."""
 
 import logging
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from pathlib import Path
 
-from tenacity import retry, stop_after_attempt, wait_fixed
-
-from hdx.scraper.cod_ab_country.arcgis import client_get, is_recently_updated
-from hdx.scraper.cod_ab_country.config import ARCGIS_SERVICE_URL, ATTEMPT, WAIT
+from hdx.scraper.cod_ab_country import metrics
+from hdx.scraper.cod_ab_country.arcgis import (
+    client_get,
+    get_last_edit_date,
+    get_service_url,
+    is_service_recently_updated,
+)
+from hdx.scraper.cod_ab_country.config import LAYER_WORKERS
 
 from .download import download_feature
+from .incremental import LayerStore
 
 logger = logging.getLogger(__name__)
 
 
-@retry(stop=stop_after_attempt(ATTEMPT), wait=wait_fixed(WAIT))
-def download_boundaries(
+def _map_concurrently(func: Callable, items: list) -> list:
+    """Apply func to items on up to LAYER_WORKERS threads, keeping their order."""
+    with ThreadPoolExecutor(max_workers=max(LAYER_WORKERS, 1)) as executor:
+        futures = [executor.submit(copy_context().run, func, x) for x in items]
+        return [x.result() for x in futures]
+
+
+def _download_layers(
+    jobs: list[tuple[Path, str, dict]], params: dict, store: LayerStore | None
+) -> dict[str, str]:
+    """Download layers concurrently, returning error messages keyed by layer.
+
+    A failed layer does not stop the others, and nothing is downloaded twice.
+    """
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max(LAYER_WORKERS, 1)) as executor:
+        futures = {
+            response["name"]: executor.submit(
+                copy_context().run,
+                download_feature,
+                data_dir,
+                url,
+                params,
+                response,
+                store,
+            )
+            for data_dir, url, response in jobs
+        }
+        for name, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:  # noqa: BLE001
+                metrics.add_count("layer_failures")
+                failures[name] = f"{type(e).__name__}: {e}"
+    return failures
+
+
+def download_boundaries(  # noqa: PLR0913
     data_dir: Path,
     token: str,
     iso3: str,
     version: str,
     force: bool = False,  # noqa: FBT001, FBT002
-) -> None:
-    """Download all ESRIJSON from the URL provided."""
+    store: LayerStore | None = None,
+) -> int | None:
+    """Download all ESRIJSON from the URL provided.
+
+    Layers and tables are downloaded concurrently, at most LAYER_WORKERS at a
+    time. If any fail, the others still complete and a RuntimeError naming
+    the failed layers is raised at the end. With a layer store, only features
+    edited since the last download are fetched where possible. Returns the
+    service's last edit timestamp, if it reports one.
+    """
     params = {"f": "json", "token": token}
-    url = f"{ARCGIS_SERVICE_URL}/cod_ab_{iso3.lower()}_{version}/FeatureServer"
+    url = get_service_url(iso3, version)
     response_layers = client_get(url, params).json()
+    edited = get_last_edit_date(response_layers)
     if "layers" not in response_layers:
         logger.warning(
             "Skipping %s %s: no layers found in ArcGIS response", iso3, version
         )
-        return
+        return edited
     feature_layers = [
         layer for layer in response_layers["layers"] if layer["type"] == "Feature Layer"
     ]
-    if not force:
-        any_modified = any(
-            is_recently_updated(f"{url}/{layer['id']}", params, url)
-            for layer in feature_layers
+    layers = dict(
+        zip(
+            [x["id"] for x in feature_layers],
+            _map_concurrently(
+                lambda x: client_get(f"{url}/{x['id']}", params).json(),
+                feature_layers,
+            ),
+            strict=True,
         )
-        if not any_modified:
-            logger.info(
-                "Skipping %s %s: no layers modified in the last 1.5 days", iso3, version
-            )
-            return
-    for layer in feature_layers:
-        feature_url = f"{url}/{layer['id']}"
-        response_feature = client_get(feature_url, params).json()
-        download_feature(data_dir, feature_url, params, response_feature)
+    )
+    if not force and not is_service_recently_updated(
+        url, params, response_layers, layers
+    ):
+        logger.info(
+            "Skipping %s %s: no layers modified in the last 1.5 days", iso3, version
+        )
+        return edited
+    jobs = [(data_dir, f"{url}/{x}", response) for x, response in layers.items()]
     tables = response_layers.get("tables", [])
     if tables:
         tables_dir = data_dir / "tables"
         tables_dir.mkdir(parents=True, exist_ok=True)
-        for layer in tables:
-            table_url = f"{url}/{layer['id']}"
-            response_table = client_get(table_url, params).json()
-            download_feature(tables_dir, table_url, params, response_table)
+        responses = _map_concurrently(
+            lambda x: client_get(f"{url}/{x['id']}", params).json(), tables
+        )
+        jobs += [
+            (tables_dir, f"{url}/{x['id']}", response)
+            for x, response in zip(tables, responses, strict=True)
+        ]
+    failures = _download_layers(jobs, params, store)
+    if failures:
+        for name, error in failures.items():
+            logger.error("%s %s: layer %s failed: %s", iso3, version, name, error)
+        msg = f"{len(failures)} layers failed: {', '.join(sorted(failures))}"
+        raise RuntimeError(msg)
+    return edited
@@ -1,13 +1,69 @@
 # ruff: noqa: ERA001
 """Feature-layer download from ArcGIS REST API."""
 
+import logging
 from pathlib import Path
-from subprocess import run
+from time import time
 from urllib.parse import urlencode
 
-from tenacity import retry, stop_after_attempt, wait_fixed
+from hdx.scraper.cod_ab_country import metrics
+from hdx.scraper.cod_ab_country.arcgis import get_last_edit_date
+from hdx.scraper.cod_ab_country.cache import FileCache
+from hdx.scraper.cod_ab_country.config import (
+    DOWNLOAD_FORMAT,
+    GLOBALID,
+    LAYER_CACHE_MAX_MB,
+    OBJECTID,
+)
+from hdx.scraper.cod_ab_country.metrics import run
+from hdx.scraper.cod_ab_country.retry import retry_policy
 
-from hdx.scraper.cod_ab_country.config import ATTEMPT, GLOBALID, OBJECTID, WAIT
+from .incremental import LayerStore, download_delta, drop_objectid, schema_hash
+from .paginate import download_pages
+from .process import is_admin_layer, refactor
+
+logger = logging.getLogger(__name__)
+
+_layer_cache: FileCache | None = None
+
+
+def use_layer_cache(directory: Path | None) -> None:
+    """Cache downloaded layers in directory, or stop caching them if None."""
+    global _layer_cache  # noqa: PLW0603
+    _layer_cache = (
+        FileCache(directory, LAYER_CACHE_MAX_MB * 1024 * 1024) if directory else None
+    )
+
+
+def layer_cache_key(url: str, response: dict, *, keep_oid: bool = False) -> str | None:
+    """Key a layer by service, layer id and last edit, if it reports one.
+
+    The fields, download format and whether the OID is kept are part of the
+    key, since each changes the parquet written for the same edit.
+    """
+    edited = get_last_edit_date(response)
+    if edited is None:
+        return None
+    layer = url.rsplit("/services/", maxsplit=1)[-1]
+    key = f"{layer}@{edited}:{schema_hash(response)}:{DOWNLOAD_FORMAT}"
+    return f"{key}:oid" if keep_oid else key
+
+
+def _restore_layer(key: str | None, output_file: Path) -> bool:
+    """Write a cached layer to output_file, returning False if not cached."""
+    if key is None or _layer_cache is None:
+        return False
+    if not _layer_cache.get_file(key, output_file):
+        metrics.add_count("layer_cache_misses")
+        return False
+    metrics.add_count("layer_cache_hits")
+    return True
+
+
+def _cache_layer(key: str | None, output_file: Path) -> None:
+    if key is None or _layer_cache is None or not output_file.exists():
+        return
+    _layer_cache.put_file(key, output_file)
 
 
 def _parse_fields(fields: list) -> tuple[str, str]:
@@ -24,12 +80,78 @@ def _parse_fields(fields: list) -> tuple[str, str]:
     return objectid, field_names
 
 
-@retry(stop=stop_after_attempt(ATTEMPT), wait=wait_fixed(WAIT))
-def download_feature(data_dir: Path, url: str, params: dict, response: dict) -> None:
-    """Download a ESRIJSON from a Feature Layer."""
-    layer_name = response["name"]
-    fields = response["fields"]
-    objectid, field_names = _parse_fields(fields)
+def _download_layer(  # noqa: PLR0913
+    output_file: Path,
+    url: str,
+    params: dict,
+    response: dict,
+    objectid: str,
+    field_names: str,
+    store: LayerStore | None,
+) -> None:
+    """Download a layer as served, from the layer cache if possible.
+
+    The OID is only kept in the layer store, which merges deltas by it.
+    """
+    key = layer_cache_key(url, response, keep_oid=store is not None)
+    if _restore_layer(key, output_file):
+        logger.info("Using cached %s", response["name"])
+        if store is not None:
+            store.save(url, output_file, response, get_last_edit_date(response))
+    else:
+        if store is None or not download_delta(
+            store, output_file, url, params, response, objectid, field_names
+        ):
+            synced = int(time() * 1000)
+            if not download_pages(
+                output_file,
+                url,
+                params,
+                response,
+                objectid,
+                field_names,
+                keep_oid=store is not None,
+            ):
+                _download_stream(output_file, url, params, objectid, field_names)
+            if store is not None:
+                store.save(url, output_file, response, synced)
+        _cache_layer(key, output_file)
+    if store is not None and output_file.exists():
+        drop_objectid(output_file, objectid)
+
+
+def download_feature(
+    data_dir: Path,
+    url: str,
+    params: dict,
+    response: dict,
+    store: LayerStore | None = None,
+) -> None:
+    """Download a ESRIJSON from a Feature Layer.
+
+    Layers are fetched as parallel OBJECTID-range pages, falling back to a
+    single ogr2ogr stream for layers without features to page through. A
+    layer already downloaded at its current last edit is copied from the
+    layer cache instead. With a layer store, a stored copy is updated with
+    only the edited features if possible, and full downloads are stored for
+    next time. Admin boundary layers are then refactored in place.
+    """
+    objectid, field_names = _parse_fields(response["fields"])
+    output_file = data_dir / f"{response['name']}.parquet"
+    _download_layer(output_file, url, params, response, objectid, field_names, store)
+    if is_admin_layer(output_file.stem) and output_file.exists():
+        with metrics.timed("refactor"):
+            refactor(output_file)
+
+
+@retry_policy
+def _download_stream(
+    output_file: Path, url: str, params: dict, objectid: str, field_names: str
+) -> None:
+    """Download a layer with one ogr2ogr call paging through the query URL.
+
+    A failed ogr2ogr raises, so the call is retried.
+    """
     query = {
         **params,
         "orderByFields": objectid,
@@ -37,7 +159,6 @@ def download_feature(data_dir: Path, url: str, params: dict, response: dict) ->
         "where": "1=1",
     }
     query_url = f"{url}/query?{urlencode(query)}"
-    output_file = data_dir / f"{layer_name}.parquet"
     # revert to gdal vector set-field-type once GDAL >= 3.12 is available
     # run(
     #     [
@@ -56,5 +177,5 @@ def download_feature(data_dir: Path, url: str, params: dict, response: dict) ->
             "-overwrite",
             *["-lco", "COMPRESSION=ZSTD"],
         ],
-        check=False,
+        check=True,
     )
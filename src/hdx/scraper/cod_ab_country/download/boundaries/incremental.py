@@ -0,0 +1,220 @@
+"""Incremental layer downloads that fetch only features edited since last time."""
+
+import json
+import logging
+from datetime import UTC, datetime
+from hashlib import sha256
+from pathlib import Path
+from shutil import copyfile
+from time import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from hdx.scraper.cod_ab_country import metrics
+from hdx.scraper.cod_ab_country.config import DELTA_OVERLAP
+
+from .paginate import download_where, get_object_ids, page_size
+
+logger = logging.getLogger(__name__)
+
+# Terms per where clause, which keeps delta query URLs well under server limits
+_MAX_TERMS = 100
+# Runs of consecutive ids at least this long are selected as a range
+_MIN_RANGE = 3
+
+
+def schema_hash(response: dict) -> str:
+    """Hash the names and types of a layer's fields."""
+    fields = [(x["name"], x["type"]) for x in response.get("fields") or []]
+    return sha256(json.dumps(fields).encode()).hexdigest()
+
+
+class LayerStore:
+    """The last downloaded copy of each layer, kept between runs.
+
+    Each layer is stored as parquet next to a JSON file recording when it was
+    synced and the schema it was downloaded with.
+    """
+
+    def __init__(self, root: Path) -> None:
+        """Keep layers under root."""
+        self.root = root
+
+    def _paths(self, url: str) -> tuple[Path, Path]:
+        name = url.rsplit("/services/", maxsplit=1)[-1].replace("/", "_")
+        return self.root / f"{name}.parquet", self.root / f"{name}.json"
+
+    def load(self, url: str) -> tuple[Path, dict] | None:
+        """Return the stored copy of a layer and its sync details, if any."""
+        parquet_path, meta_path = self._paths(url)
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if not parquet_path.exists():
+            return None
+        return parquet_path, meta
+
+    def save(self, url: str, output_file: Path, response: dict, synced: int) -> None:
+        """Store a downloaded layer, synced at the given time in epoch ms."""
+        if not output_file.exists():
+            return
+        parquet_path, meta_path = self._paths(url)
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = parquet_path.with_suffix(".tmp")
+        copyfile(output_file, tmp)
+        tmp.replace(parquet_path)
+        meta = {"synced": synced, "schema": schema_hash(response)}
+        tmp = meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta))
+        tmp.replace(meta_path)
+
+
+def drop_objectid(path: Path, objectid: str) -> None:
+    """Drop the objectid column a layer was stored with from its parquet file."""
+    table = pq.read_table(path)
+    if objectid in table.column_names:
+        pq.write_table(table.drop_columns([objectid]), path, compression="zstd")
+
+
+def _runs(ids: list[int], size: int) -> list[tuple[int, int]]:
+    """Split sorted ids into runs of consecutive ids, each at most size long."""
+    runs: list[tuple[int, int]] = []
+    for x in ids:
+        if runs and x == runs[-1][1] + 1 and x - runs[-1][0] < size:
+            runs[-1] = (runs[-1][0], x)
+        else:
+            runs.append((x, x))
+    return runs
+
+
+def _where(objectid: str, runs: list[tuple[int, int]]) -> str:
+    singles = []
+    terms = []
+    for start, end in runs:
+        if end - start + 1 >= _MIN_RANGE:
+            terms.append(f"({objectid} >= {start} AND {objectid} <= {end})")
+        else:
+            singles += range(start, end + 1)
+    if singles:
+        terms.insert(0, f"{objectid} IN ({','.join(map(str, singles))})")
+    return " OR ".join(terms)
+
+
+def where_clauses(objectid: str, ids: list[int], size: int) -> list[str]:
+    """Select sorted ids in where clauses of at most size features each.
+
+    Consecutive ids are selected as ranges and the rest with IN lists, with
+    at most _MAX_TERMS ids or ranges per clause, so the query URL stays
+    short even for a full page of scattered ids.
+    """
+    clauses = []
+    batch: list[tuple[int, int]] = []
+    count = terms = 0
+    for start, end in _runs(ids, size):
+        length = end - start + 1
+        weight = 1 if length >= _MIN_RANGE else length
+        if batch and (count + length > size or terms + weight > _MAX_TERMS):
+            clauses.append(_where(objectid, batch))
+            batch = []
+            count = terms = 0
+        batch.append((start, end))
+        count += length
+        terms += weight
+    if batch:
+        clauses.append(_where(objectid, batch))
+    return clauses
+
+
+def _merge(
+    stored: pa.Table, delta: pa.Table | None, objectid: str, removed: list[int]
+) -> pa.Table:
+    """Replace removed features in stored with those in delta, by objectid."""
+    kept = stored.filter(pc.invert(pc.is_in(stored[objectid], pa.array(removed))))
+    merged = pa.concat_tables([kept, delta]) if delta is not None else kept
+    merged = merged.sort_by(objectid)
+    metadata = dict(stored.schema.metadata or {})
+    if b"geo" in metadata:
+        geo = json.loads(metadata[b"geo"])
+        for column in geo.get("columns", {}).values():
+            column.pop("bbox", None)
+        metadata[b"geo"] = json.dumps(geo).encode()
+    return merged.replace_schema_metadata(metadata)
+
+
+def download_delta(  # noqa: PLR0913
+    store: LayerStore,
+    output_file: Path,
+    url: str,
+    params: dict,
+    response: dict,
+    objectid: str,
+    field_names: str,
+) -> bool:
+    """Update the stored copy of a layer with features edited since its sync.
+
+    Features edited after the last sync (less DELTA_OVERLAP seconds) or new
+    since then are downloaded, features no longer on the server are dropped,
+    and the merged layer is written to output_file and stored. Returns False
+    if the layer must be downloaded in full instead: it has no stored copy,
+    no edit date field, or a different schema.
+    """
+    edit_field = (response.get("editFieldsInfo") or {}).get("editDateField")
+    entry = store.load(url)
+    if not edit_field or entry is None:
+        return False
+    stored_path, meta = entry
+    if meta.get("schema") != schema_hash(response):
+        logger.info("Schema of %s changed, downloading in full", response["name"])
+        return False
+    stored = pq.read_table(stored_path)
+    if objectid not in stored.column_names:
+        return False
+    synced = int(time() * 1000)
+    since = datetime.fromtimestamp(meta["synced"] / 1000 - DELTA_OVERLAP, UTC)
+    try:
+        current = set(get_object_ids(url, params))
+        edited = set(
+            get_object_ids(
+                url, params, f"{edit_field} > TIMESTAMP '{since:%Y-%m-%d %H:%M:%S}'"
+            )
+        )
+    except ValueError:
+        logger.warning("Delta query failed for %s", url, exc_info=True)
+        return False
+    previous = set(stored[objectid].to_pylist())
+    changed = sorted((edited | (current - previous)) & current)
+    deleted = sorted(previous - current)
+    delta = None
+    if changed:
+        delta_file = output_file.with_name(f".{output_file.stem}_delta.parquet")
+        wheres = where_clauses(objectid, changed, page_size(response))
+        download_where(
+            delta_file,
+            url,
+            params,
+            response,
+            objectid,
+            field_names,
+            wheres,
+            keep_oid=True,
+        )
+        delta = pq.read_table(delta_file)
+        delta_file.unlink()
+        if not delta.schema.equals(stored.schema, check_metadata=False):
+            logger.info("Columns of %s changed, downloading in full", response["name"])
+            return False
+    merged = _merge(stored, delta, objectid, changed + deleted)
+    pq.write_table(merged, output_file, compression="zstd")
+    store.save(url, output_file, response, synced)
+    metrics.add_count("delta_features", len(changed))
+    metrics.add_count("delta_deleted", len(deleted))
+    logger.info(
+        "Updated %s: %d features changed, %d deleted",
+        response["name"],
+        len(changed),
+        len(deleted),
+    )
+    return True
@@ -0,0 +1,198 @@
+"""Parallel download of a feature layer in OBJECTID-range pages."""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from pathlib import Path
+from shutil import rmtree
+
+from geopandas import GeoDataFrame
+from pandas import concat
+
+from hdx.scraper.cod_ab_country import metrics
+from hdx.scraper.cod_ab_country.arcgis import client_get
+from hdx.scraper.cod_ab_country.config import DOWNLOAD_FORMAT, PAGE_SIZE, PAGE_WORKERS
+from hdx.scraper.cod_ab_country.geodata.esrijson import read_pages, write_parquet
+from hdx.scraper.cod_ab_country.geodata.pbf import PbfError, decode, to_geodataframe
+from hdx.scraper.cod_ab_country.retry import retry_policy
+
+logger = logging.getLogger(__name__)
+
+
+def get_object_ids(url: str, params: dict, where: str = "1=1") -> list[int]:
+    """Get the OBJECTIDs of features matching where, in ascending order."""
+    query = {**params, "where": where, "returnIdsOnly": "true"}
+    response = client_get(f"{url}/query", query, cache=False).json()
+    if "error" in response:
+        msg = f"Listing OBJECTIDs failed for {url}: {response['error']}"
+        raise ValueError(msg)
+    return sorted(response.get("objectIds") or [])
+
+
+def get_pages(object_ids: list[int], page_size: int) -> list[tuple[int, int]]:
+    """Split sorted OBJECTIDs into inclusive ranges of at most page_size IDs."""
+    return [
+        (object_ids[i], object_ids[min(i + page_size, len(object_ids)) - 1])
+        for i in range(0, len(object_ids), page_size)
+    ]
+
+
+def supports_pbf(response: dict) -> bool:
+    """Return True if a feature layer advertises f=pbf among its query formats."""
+    return (
+        response.get("type") != "Table"
+        and "pbf" in response.get("supportedQueryFormats", "").lower()
+    )
+
+
+@retry_policy
+def _download_page(url: str, query: dict, path: Path) -> None:
+    response = client_get(f"{url}/query", query, cache=False)
+    if query["f"] == "pbf":
+        if response.content[:1] == b"{":
+            msg = f"Invalid page from {url}: {response.text[:200]}"
+            raise ValueError(msg)
+    elif "features" not in (data := response.json()):
+        msg = f"Invalid page from {url}: {data.get('error', data)}"
+        raise ValueError(msg)
+    metrics.add_count(f"page_bytes_{query['f']}", len(response.content))
+    path.write_bytes(response.content)
+
+
+def fetch_pages(url: str, queries: list[dict], paths: list[Path]) -> None:
+    """Fetch pages concurrently, each in a copy of the caller's context."""
+    with ThreadPoolExecutor(max_workers=max(PAGE_WORKERS, 1)) as executor:
+        futures = [
+            executor.submit(copy_context().run, _download_page, url, query, path)
+            for query, path in zip(queries, paths, strict=True)
+        ]
+        for future in futures:
+            future.result()
+
+
+def _write_pbf_pages(
+    output_file: Path, page_paths: list[Path], response: dict, drop: list[str]
+) -> None:
+    """Decode pbf pages in-process and write them, in order, as GeoParquet."""
+    with metrics.timed("pbf_decode"):
+        gdfs = [
+            to_geodataframe(decode(path.read_bytes()), response.get("extent"))
+            for path in page_paths
+        ]
+        gdf = GeoDataFrame(concat(gdfs, ignore_index=True), crs=gdfs[0].crs)
+        gdf = gdf.drop(columns=drop, errors="ignore")
+        gdf.to_parquet(output_file, compression="zstd", index=False)
+
+
+def page_size(response: dict) -> int:
+    """Return the most features to request per page from a layer."""
+    return min(response.get("maxRecordCount") or PAGE_SIZE, PAGE_SIZE)
+
+
+def download_where(  # noqa: PLR0913
+    output_file: Path,
+    url: str,
+    params: dict,
+    response: dict,
+    objectid: str,
+    field_names: str,
+    wheres: list[str],
+    fmt: str = DOWNLOAD_FORMAT,
+    *,
+    keep_oid: bool = False,
+) -> None:
+    """Download the features matching each where clause, as one page each.
+
+    Pages are fetched by up to PAGE_WORKERS threads and written to a parquet
+    file in the order given. ESRIJSON pages are converted in-process one at a
+    time, so memory use is bounded by the page size. With fmt "pbf", layers
+    that support it are fetched as protocol buffers and decoded in-process,
+    falling back to ESRIJSON if decoding fails. The objectid column is only
+    written with keep_oid.
+    """
+    if fmt == "pbf" and not supports_pbf(response):
+        fmt = "json"
+    pages_dir = output_file.parent / f".{output_file.stem}_pages"
+    rmtree(pages_dir, ignore_errors=True)
+    pages_dir.mkdir(parents=True)
+    page_paths = [pages_dir / f"{i:05d}.{fmt}" for i in range(len(wheres))]
+    queries = [
+        {
+            **params,
+            "f": fmt,
+            "orderByFields": objectid,
+            "outFields": field_names,
+            "where": where,
+        }
+        for where in wheres
+    ]
+    logger.info("Downloading %s in %d %s pages", response["name"], len(wheres), fmt)
+    try:
+        fetch_pages(url, queries, page_paths)
+        if fmt == "pbf":
+            try:
+                _write_pbf_pages(
+                    output_file, page_paths, response, [] if keep_oid else [objectid]
+                )
+            except PbfError:
+                logger.warning("Decoding pbf failed for %s, using ESRIJSON", url)
+                metrics.add_count("pbf_fallbacks")
+                rmtree(pages_dir, ignore_errors=True)
+                download_where(
+                    output_file,
+                    url,
+                    params,
+                    response,
+                    objectid,
+                    field_names,
+                    wheres,
+                    "json",
+                    keep_oid=keep_oid,
+                )
+        else:
+            with metrics.timed("esrijson_convert"):
+                write_parquet(output_file, read_pages(page_paths), keep_oid=keep_oid)
+    finally:
+        rmtree(pages_dir, ignore_errors=True)
+
+
+def download_pages(  # noqa: PLR0913
+    output_file: Path,
+    url: str,
+    params: dict,
+    response: dict,
+    objectid: str,
+    field_names: str,
+    fmt: str = DOWNLOAD_FORMAT,
+    *,
+    keep_oid: bool = False,
+) -> bool:
+    """Download a layer as concurrent OBJECTID-range pages into a parquet file.
+
+    Pages hold at most the service's maxRecordCount features and are written
+    in objectid order. Returns False without downloading if the layer has no
+    features to page through, or its OBJECTIDs cannot be listed.
+    """
+    try:
+        object_ids = get_object_ids(url, params)
+    except ValueError:
+        logger.warning("Listing OBJECTIDs failed for %s", url, exc_info=True)
+        return False
+    if not object_ids:
+        return False
+    wheres = [
+        f"{objectid} >= {low} AND {objectid} <= {high}"
+        for low, high in get_pages(object_ids, page_size(response))
+    ]
+    download_where(
+        output_file,
+        url,
+        params,
+        response,
+        objectid,
+        field_names,
+        wheres,
+        fmt,
+        keep_oid=keep_oid,
+    )
+    return True
@@ -1,11 +1,22 @@
 """Post-processing of downloaded boundary parquet files."""
 
+import json
+import re
 from pathlib import Path
-from subprocess import run
 
-from geopandas import read_parquet
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import shapely
 from hdx.location.country import Country
 
+from hdx.scraper.cod_ab_country.geodata.esrijson import GEOMETRY
+
+BBOX = "bbox"
+_BBOX_FIELDS = ["xmin", "ymin", "xmax", "ymax"]
+_ADMIN_LAYER = re.compile(r"[a-z]{3}_admin\d")
+
 
 def _get_columns(admin_level: int, *, only_nullable: bool = False) -> list[str]:
     """Get a list of column names for the given admin level."""
@@ -21,40 +32,84 @@ def _get_columns(admin_level: int, *, only_nullable: bool = False) -> list[str]:
     return columns
 
 
-def refactor(output_tmp: Path) -> None:
-    """Refactor file."""
-    output_file = output_tmp.with_stem(output_tmp.stem.replace("_tmp", ""))
-    admin_level = int(output_file.stem[-1])
-    iso3 = output_file.stem[0:3].upper()
-    all_columns = _get_columns(admin_level)
-    nullable_columns = _get_columns(admin_level, only_nullable=True)
-    pcode_columns = [f"adm{x}_pcode" for x in range(admin_level, -1, -1)]
-    gdf = read_parquet(output_tmp)
-    gdf = gdf.rename(columns={"cod_version": "version"}, errors="ignore")
-    gdf["iso2"] = Country.get_iso2_from_iso3(iso3)
-    gdf["iso3"] = iso3
-    gdf["version"] = gdf["version"].str.replace("V_", "v")
-    gdf["valid_to"] = gdf["valid_to"].astype("date32[pyarrow]")
-    gdf[nullable_columns] = gdf[nullable_columns].astype("string")
-    gdf = gdf[all_columns]
-    gdf = gdf.sort_values(by=pcode_columns).reset_index()
-    gdf.to_parquet(
-        output_tmp,
-        compression_level=15,
-        compression="zstd",
-        schema_version="1.1.0",
-        write_covering_bbox=True,
-        index=False,
+def is_admin_layer(name: str) -> bool:
+    """Return True for an admin boundary layer, such as afg_admin1."""
+    return _ADMIN_LAYER.fullmatch(name) is not None
+
+
+def _covering_bbox(geometry: pa.Array) -> pa.StructArray:
+    """Compute the GeoParquet 1.1 covering bbox of each WKB geometry."""
+    bounds = shapely.bounds(shapely.from_wkb(geometry.to_numpy(zero_copy_only=False)))
+    return pa.StructArray.from_arrays(
+        [pa.array(bounds[:, i], pa.float64()) for i in range(4)], _BBOX_FIELDS
     )
-    run(
-        [
-            *["gdal", "vector", "convert"],
-            *[output_tmp, output_file],
-            "--overwrite",
-            # "--quiet", ADD THIS BACK IN GDAL 3.12
-            "--lco=COMPRESSION_LEVEL=15",
-            "--lco=COMPRESSION=ZSTD",
-        ],
-        check=False,
+
+
+def _geo_metadata(table: pa.Table, source: dict) -> bytes:
+    """Return the source's GeoParquet metadata as version 1.1 with a covering."""
+    column = dict(source["columns"][GEOMETRY])
+    column.pop("covering", None)
+    bounds = shapely.total_bounds(
+        shapely.from_wkb(table[GEOMETRY].to_numpy(zero_copy_only=False))
     )
-    output_tmp.unlink()
+    if np.isfinite(bounds).all():
+        column["bbox"] = [float(x) for x in bounds]
+    column["covering"] = {"bbox": {x: [BBOX, x] for x in _BBOX_FIELDS}}
+    metadata = {
+        **source,
+        "version": "1.1.0",
+        "primary_column": GEOMETRY,
+        "columns": {GEOMETRY: column},
+    }
+    return json.dumps(metadata).encode()
+
+
+def refactor(path: Path) -> None:
+    """Refactor an admin boundary layer in place.
+
+    Columns are selected and ordered without copying, casts and the p-code
+    sort run on Arrow arrays, and the result is written once as GeoParquet
+    1.1 with a covering bbox column. Missing name and language columns are
+    added as nulls; other missing columns raise a ValueError.
+    """
+    admin_level = int(path.stem[-1])
+    iso3 = path.stem[0:3].upper()
+    all_columns = _get_columns(admin_level)
+    nullable_columns = set(_get_columns(admin_level, only_nullable=True))
+    pcode_columns = [f"adm{x}_pcode" for x in range(admin_level, -1, -1)]
+    table = pq.read_table(path)
+    source_geo = json.loads(table.schema.metadata[b"geo"])
+    if "cod_version" in table.column_names and "version" not in table.column_names:
+        names = ["version" if x == "cod_version" else x for x in table.column_names]
+        table = table.rename_columns(names)
+    fillable = nullable_columns.difference(pcode_columns)
+    available = {*table.column_names, *fillable, "iso2", "iso3"}
+    missing = [x for x in all_columns if x not in available]
+    if missing:
+        msg = f"{path.name} is missing columns: {', '.join(missing)}"
+        raise ValueError(msg)
+    iso2 = Country.get_iso2_from_iso3(iso3)
+    columns = []
+    for name in all_columns:
+        if name in ("iso2", "iso3"):
+            value = iso2 if name == "iso2" else iso3
+            columns.append(pa.array([value] * table.num_rows, pa.string()))
+        elif name == "version":
+            version = table[name].cast(pa.string())
+            columns.append(pc.replace_substring(version, "V_", "v"))
+        elif name == "valid_to":
+            columns.append(table[name].cast(pa.date32()))
+        elif name in nullable_columns:
+            if name in table.column_names:
+                columns.append(table[name].cast(pa.string()))
+            else:
+                columns.append(pa.nulls(table.num_rows, pa.string()))
+        else:
+            columns.append(table[name])
+    table = pa.table(columns, names=all_columns)
+    table = table.sort_by([(x, "ascending") for x in pcode_columns])
+    table = table.append_column(BBOX, _covering_bbox(table[GEOMETRY]))
+    table = table.replace_schema_metadata({"geo": _geo_metadata(table, source_geo)})
+    tmp = path.with_stem(f"{path.stem}_tmp")
+    pq.write_table(table, tmp, compression="zstd", compression_level=15)
+    tmp.replace(path)
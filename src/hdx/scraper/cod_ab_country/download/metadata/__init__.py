@@ -1,11 +1,19 @@
 """Metadata table download pipeline."""
 
 from pathlib import Path
-from subprocess import run
-from urllib.parse import urlencode
+from tempfile import TemporaryDirectory
+
+import pyarrow as pa
 
 from hdx.scraper.cod_ab_country.arcgis import client_get
 from hdx.scraper.cod_ab_country.config import ARCGIS_METADATA_URL, OBJECTID
+from hdx.scraper.cod_ab_country.download.boundaries.paginate import (
+    fetch_pages,
+    get_object_ids,
+    get_pages,
+    page_size,
+)
+from hdx.scraper.cod_ab_country.geodata.esrijson import read_pages, read_table
 
 from .process import refactor
 
@@ -25,28 +33,28 @@ def _parse_fields(fields: list) -> tuple[str, str]:
 
 
 def download_metadata(data_dir: Path, token: str) -> None:
-    """Download the metadata table from a Feature Layer."""
+    """Download the metadata table from a Feature Layer.
+
+    The table is fetched as ESRIJSON pages and converted in-process, so only
+    the refactored parquet files are written.
+    """
     params = {"f": "json", "token": token}
-    fields = client_get(ARCGIS_METADATA_URL, params).json()["fields"]
-    objectid, field_names = _parse_fields(fields)
-    query = {
-        **params,
-        "orderByFields": objectid,
-        "outFields": field_names,
-        "where": "1=1",
-    }
-    query_url = f"{ARCGIS_METADATA_URL}/query?{urlencode(query)}"
-    output_file = data_dir / "metadata/metadata_raw.parquet"
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-    run(
-        [
-            *["gdal", "vector", "convert"],
-            *["ESRIJSON:" + query_url, output_file],
-            "--overwrite",
-            # "--quiet", ADD THIS BACK IN GDAL 3.12
-            "--lco=COMPRESSION_LEVEL=15",
-            "--lco=COMPRESSION=ZSTD",
-        ],
-        check=False,
-    )
-    refactor(output_file)
+    response = client_get(ARCGIS_METADATA_URL, params).json()
+    objectid, field_names = _parse_fields(response["fields"])
+    object_ids = get_object_ids(ARCGIS_METADATA_URL, params)
+    queries = [
+        {
+            **params,
+            "orderByFields": objectid,
+            "outFields": field_names,
+            "where": f"{objectid} >= {low} AND {objectid} <= {high}",
+        }
+        for low, high in get_pages(object_ids, page_size(response))
+    ]
+    output_dir = data_dir / "metadata"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with TemporaryDirectory(dir=output_dir) as pages_dir:
+        page_paths = [Path(pages_dir) / f"{i:05d}.json" for i in range(len(queries))]
+        fetch_pages(ARCGIS_METADATA_URL, queries, page_paths)
+        table = read_table(read_pages(page_paths), pa.timestamp("ms", tz="UTC"))
+    refactor(table.to_pandas(), output_dir)
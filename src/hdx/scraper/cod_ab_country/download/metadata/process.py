@@ -2,7 +2,7 @@
 
 from pathlib import Path
 
-from pandas import read_parquet
+from pandas import DataFrame
 
 from hdx.scraper.cod_ab_country.config import (
     admin_level_full_overrides,
@@ -53,11 +53,10 @@ columns = [
 ]
 
 
-def refactor(output_file: Path) -> None:
-    """Refactor file."""
+def refactor(df: DataFrame, output_dir: Path) -> None:
+    """Refactor the metadata table and write it to output_dir."""
     iso3_exclude_all = [x for x in iso3_exclude_cfg if len(x) == ISO3_LEN]
     iso3_exclude_version = [x.replace("_V", "v") for x in iso3_exclude_cfg if "_V" in x]
-    df = read_parquet(output_file)
     df["country_name"] = df["country_name"].str.replace("\u2019", "'", regex=False)
     df["admin_level_full"] = df["admin_level_full"].astype("Int32")
     for iso3, level in admin_level_full_overrides.items():
@@ -67,14 +66,14 @@ def refactor(output_file: Path) -> None:
     df = df[~(df["country_iso3"] + df["version"]).isin(iso3_exclude_version)]
     df = df[columns].sort_values(by=["country_iso3", "version"])
     df.to_parquet(
-        output_file.parent / "metadata_all.parquet",
+        output_dir / "metadata_all.parquet",
         compression="zstd",
         compression_level=15,
         index=False,
     )
     df = df.drop_duplicates(subset=["country_iso3"], keep="last")
     df.to_parquet(
-        output_file.parent / "metadata_latest.parquet",
+        output_dir / "metadata_latest.parquet",
         compression="zstd",
         compression_level=15,
         index=False,
@@ -0,0 +1,84 @@
+"""Zip archives written member by member, straight into the final file."""
+
+from io import BytesIO
+from pathlib import Path
+from shutil import copyfileobj
+from types import TracebackType
+from typing import Self
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+from hdx.scraper.cod_ab_country.config import ZIP_COMPRESSION_LEVEL
+
+# Members this large are written with zip64 sizes, whatever they compress to
+_ZIP64_SIZE = 1 << 31
+
+
+class ZipSink:
+    """Write a zip archive one member at a time, without a staging directory.
+
+    Members are compressed at compression_level, 0 storing them as is. An
+    archive nothing is added to is not created.
+    """
+
+    def __init__(
+        self, path: Path, compression_level: int = ZIP_COMPRESSION_LEVEL
+    ) -> None:
+        """Prepare to write path, which is only created once a member is added."""
+        self.path = path
+        self._level = compression_level
+        self._zf: ZipFile | None = None
+
+    def __enter__(self) -> Self:
+        """Return the sink, to be closed when the block ends."""
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        """Close the archive."""
+        self.close()
+
+    def _zipfile(self) -> ZipFile:
+        if self._zf is None:
+            self._zf = ZipFile(
+                self.path,
+                "w",
+                ZIP_DEFLATED if self._level else ZIP_STORED,
+                compresslevel=self._level,
+            )
+        return self._zf
+
+    def add_bytes(self, name: str, data: bytes) -> None:
+        """Add data as the member name."""
+        self._zipfile().writestr(name, data)
+
+    def add_file(self, path: Path, name: str) -> None:
+        """Add a file as the member name."""
+        self._zipfile().write(path, name)
+
+    def add_tree(self, root: Path) -> None:
+        """Add everything below root, named relative to it, as make_archive does."""
+        for path in sorted(root.rglob("*")):
+            self.add_file(path, path.relative_to(root).as_posix())
+
+    def add_zip(self, source: Path | bytes) -> None:
+        """Copy the members of another zip archive into this one."""
+        zf = self._zipfile()
+        with ZipFile(BytesIO(source) if isinstance(source, bytes) else source) as src:
+            for info in src.infolist():
+                with (
+                    src.open(info) as fsrc,
+                    zf.open(
+                        info.filename, "w", force_zip64=info.file_size >= _ZIP64_SIZE
+                    ) as fdst,
+                ):
+                    copyfileobj(fsrc, fdst)
+
+    def close(self) -> None:
+        """Write the central directory, if anything was added."""
+        if self._zf is not None:
+            self._zf.close()
+            self._zf = None
@@ -3,15 +3,17 @@
 from filecmp import cmpfiles, dircmp
 from json import loads
 from pathlib import Path
-from subprocess import PIPE, run
+from subprocess import PIPE
 
 from hdx.data.dataset import Dataset
-from tenacity import retry, stop_after_attempt, wait_fixed
 
-from hdx.scraper.cod_ab_country.config import ATTEMPT, WAIT
+from hdx.scraper.cod_ab_country.metrics import run, timed
+from hdx.scraper.cod_ab_country.retry import retry_policy
 
+from . import engine
 
-@retry(stop=stop_after_attempt(ATTEMPT), wait=wait_fixed(WAIT))
+
+@retry_policy
 def _download_geodata_from_hdx(
     resource_name: str,
     dataset_name: str,
@@ -30,6 +32,8 @@ def _download_geodata_from_hdx(
 
 def _list_layers(input_path: Path) -> list[str]:
     """List layers in a GeoPackage."""
+    if engine.in_process():
+        return engine.list_layers(input_path)
     result = run(
         # ["gdal", "vector", "info", "--summary", "--format=json", input_path], ADD THIS BACK IN GDAL 3.12  # noqa: E501
         ["ogrinfo", "-al", "-so", "-json", input_path],
@@ -45,6 +49,9 @@ def _convert_geodata(input_path: Path, output_dir: Path, var: str) -> Path:
     var_path = output_dir / f"{input_path.stem}_{var}"
     var_path.mkdir(exist_ok=True, parents=True)
     for layer in layers:
+        if engine.in_process():
+            engine.to_geojson(input_path, layer, var_path / f"{layer}.geojson")
+            continue
         run(
             [
                 *["gdal", "vector", "convert"],
@@ -75,7 +82,8 @@ def compare_geodata(local_path: Path, dataset_name: str) -> Path:
     """
     tmp_dir = local_path.parent / "tmp"
     tmp_dir.mkdir(exist_ok=True)
-    remote_path = _download_geodata_from_hdx(local_path.name, dataset_name, tmp_dir)
-    if not remote_path:
-        return local_path
-    return remote_path if _is_file_same(local_path, remote_path) else local_path
+    with timed("compare"):
+        remote_path = _download_geodata_from_hdx(local_path.name, dataset_name, tmp_dir)
+        if not remote_path:
+            return local_path
+        return remote_path if _is_file_same(local_path, remote_path) else local_path
@@ -0,0 +1,205 @@
+"""In-process vector conversion with GDAL through pyogrio."""
+
+import json
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyogrio
+import shapely
+from pyproj import CRS
+
+from hdx.scraper.cod_ab_country.config import CONVERT_ENGINE, _gdal_version
+from hdx.scraper.cod_ab_country.metrics import timed
+
+_DRIVERS = {
+    ".gdb": "OpenFileGDB",
+    ".geojson": "GeoJSON",
+    ".shp": "ESRI Shapefile",
+    ".xlsx": "XLSX",
+}
+_NO_GEOMETRY = {"XLSX"}
+_MULTI_TYPES = {"Point", "LineString", "Polygon"}
+
+
+def in_process() -> bool:
+    """Return True if conversions should run in-process rather than as GDAL CLIs."""
+    return CONVERT_ENGINE == "pyogrio"
+
+
+def gdal_version() -> str:
+    """Return the GDAL that conversions run with, such as "pyogrio GDAL 3.12.4"."""
+    if in_process():
+        return f"pyogrio GDAL {pyogrio.__gdal_version_string__}"
+    return "GDAL " + ".".join(str(x) for x in _gdal_version())
+
+
+def _geometry_type(types: list[str]) -> str:
+    """Return the layer geometry type GDAL gives GeoParquet geometry_types."""
+    bases = {x.removesuffix(" Z") for x in types}
+    z = " Z" if any(x.endswith(" Z") for x in types) else ""
+    if len(bases) == 1:
+        return bases.pop() + z
+    singles = {x.removeprefix("Multi") for x in bases}
+    if len(singles) == 1 and singles <= _MULTI_TYPES:
+        return f"Multi{singles.pop()}{z}"
+    return "Unknown"
+
+
+def _geoarrow_to_wkb(chunk: pa.Array, encoding: str) -> pa.Array:
+    """Encode a chunk of native GeoArrow geometries, such as "polygon", as WKB."""
+    offsets = []
+    coords = chunk
+    while pa.types.is_list(coords.type) or pa.types.is_large_list(coords.type):
+        offsets.append(coords.offsets.to_numpy().astype(np.int64))
+        coords = coords.values
+    if pa.types.is_struct(coords.type):
+        names = [x.name for x in coords.type]
+        xyz = [
+            coords.field(x).to_numpy(zero_copy_only=False)
+            for x in names
+            if x in ("x", "y", "z")
+        ]
+        coords = np.column_stack(xyz)
+    else:
+        size = coords.type.list_size
+        values = coords.values.to_numpy(zero_copy_only=False)
+        coords = values.reshape(-1, size)[:, : min(size, 3)]
+    geometries = shapely.from_ragged_array(
+        shapely.GeometryType[encoding.upper()], coords, tuple(reversed(offsets)) or None
+    )
+    geometries[chunk.is_null().to_numpy(zero_copy_only=False)] = None
+    return pa.array(shapely.to_wkb(geometries), pa.binary())
+
+
+def _to_wkb(column: pa.ChunkedArray, encoding: str) -> pa.ChunkedArray:
+    if encoding.upper() == "WKB":
+        return column
+    return pa.chunked_array(
+        [_geoarrow_to_wkb(x, encoding) for x in column.chunks], pa.binary()
+    )
+
+
+def _layer_options(options: list[str]) -> dict[str, str]:
+    """Turn --lco=KEY=VALUE arguments into pyogrio layer options."""
+    return dict(x.removeprefix("--lco=").split("=", 1) for x in options)
+
+
+@dataclass(frozen=True)
+class Layer:
+    """A GeoParquet file decoded once, ready to write to any format."""
+
+    table: pa.Table
+    geometry: dict = field(default_factory=dict)
+
+
+def read_layer(src_dataset: Path) -> Layer:
+    """Decode a GeoParquet or parquet file once for writing to several formats.
+
+    The covering bbox column is dropped, as GDAL's reader hides it. Native
+    GeoArrow geometries are encoded as WKB, which is what pyogrio writes.
+    """
+    table = pq.read_table(src_dataset)
+    geo = json.loads((table.schema.metadata or {}).get(b"geo", b"null"))
+    table = table.replace_schema_metadata(None)
+    if not geo:
+        return Layer(table)
+    name = geo["primary_column"]
+    column = geo["columns"][name]
+    covering = column.get("covering", {}).get("bbox", {})
+    table = table.drop_columns(list({x[0] for x in covering.values()}))
+    index = table.schema.get_field_index(name)
+    wkb = _to_wkb(table.column(index), column.get("encoding", "WKB"))
+    table = table.set_column(index, pa.field(name, pa.binary()), wkb)
+    crs = column.get("crs", "OGC:CRS84")
+    geometry = {
+        "geometry_name": name,
+        "geometry_type": _geometry_type(column.get("geometry_types", [])),
+        "crs": CRS.from_user_input(crs).to_wkt() if crs else None,
+    }
+    return Layer(table, geometry)
+
+
+def _write(  # noqa: PLR0913
+    layer: Layer,
+    dst: Path | BytesIO,
+    driver: str,
+    name: str,
+    options: list[str],
+    *,
+    append: bool = False,
+) -> None:
+    table = layer.table
+    geometry = layer.geometry
+    if geometry and driver in _NO_GEOMETRY:
+        table = table.drop_columns([geometry["geometry_name"]])
+        geometry = {}
+    with timed("pyogrio write"):
+        pyogrio.write_arrow(
+            table,
+            dst,
+            layer=name,
+            driver=driver,
+            append=append,
+            layer_options=_layer_options(options),
+            **geometry,
+        )
+
+
+def write(
+    layer: Layer,
+    dst_dataset: Path,
+    name: str,
+    options: list[str],
+    *,
+    append: bool,
+) -> None:
+    """Write a decoded layer as name in dst_dataset, in this process.
+
+    Takes the same layer creation options as gdal vector convert. With
+    append, the layer is added to an existing multi-layer dataset.
+    """
+    driver = _DRIVERS[dst_dataset.suffixes[0]]
+    _write(layer, dst_dataset, driver, name, options, append=append)
+
+
+def to_bytes(layer: Layer, suffix: str, name: str, options: list[str]) -> bytes:
+    """Write a decoded layer in memory, for single-file formats such as GeoJSON."""
+    buffer = BytesIO()
+    _write(layer, buffer, _DRIVERS[suffix], name, options)
+    return buffer.getvalue()
+
+
+def write_layer(
+    src_dataset: Path,
+    dst_dataset: Path,
+    name: str,
+    options: list[str],
+    *,
+    append: bool,
+) -> None:
+    """Write a GeoParquet file as a layer of dst_dataset, in this process."""
+    write(read_layer(src_dataset), dst_dataset, name, options, append=append)
+
+
+def list_layers(path: Path) -> list[str]:
+    """List the layers of a dataset, in this process."""
+    return [str(x) for x in pyogrio.list_layers(path)[:, 0]]
+
+
+def to_geojson(path: Path, layer: str, dst: Path) -> None:
+    """Write one layer of a dataset as GeoJSON, in this process."""
+    with timed("pyogrio read"):
+        meta, table = pyogrio.read_arrow(path, layer=layer)
+    kwargs = {}
+    if meta.get("geometry_type"):
+        kwargs = {
+            "geometry_name": meta["geometry_name"] or "wkb_geometry",
+            "geometry_type": meta["geometry_type"],
+            "crs": meta["crs"],
+        }
+    with timed("pyogrio write"):
+        pyogrio.write_arrow(table, dst, layer=layer, driver="GeoJSON", **kwargs)
@@ -0,0 +1,269 @@
+"""Streaming conversion of ArcGIS ESRIJSON query pages to Arrow and GeoParquet."""
+
+import json
+from collections.abc import Iterable, Iterator
+from datetime import UTC, datetime
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import shapely
+from pyproj import CRS
+from pyproj.exceptions import CRSError
+
+from hdx.scraper.cod_ab_country.config import OBJECTID
+
+GEOMETRY = "geometry"
+# Date fields are read as dates, as ogr2ogr -mapFieldType DateTime=Date does
+DATE = pa.date32()
+
+_FIELD_TYPES = {
+    "esriFieldTypeSmallInteger": pa.int16(),
+    "esriFieldTypeInteger": pa.int32(),
+    "esriFieldTypeSingle": pa.float32(),
+    "esriFieldTypeDouble": pa.float64(),
+    "esriFieldTypeString": pa.string(),
+    "esriFieldTypeOID": pa.int32(),
+    "esriFieldTypeGUID": pa.string(),
+    "esriFieldTypeGlobalID": pa.string(),
+    "esriFieldTypeXML": pa.string(),
+    "esriFieldTypeBigInteger": pa.int64(),
+    "esriFieldTypeDateOnly": pa.date32(),
+}
+_DATE_TYPES = {"esriFieldTypeDate", "esriFieldTypeTimestampOffset"}
+_MS_PER_DAY = 86_400_000
+
+# shapely geometry type ids, named as in GeoParquet geometry_types
+_GEOMETRY_TYPES = {
+    0: "Point",
+    1: "LineString",
+    3: "Polygon",
+    4: "MultiPoint",
+    5: "MultiLineString",
+    6: "MultiPolygon",
+    7: "GeometryCollection",
+}
+
+
+def polygon(rings: list[np.ndarray]) -> shapely.Geometry:
+    """Group rings into polygons: clockwise rings are exteriors, as in Esri JSON."""
+    rings = [shapely.linearrings(x) for x in rings if len(x) >= 4]  # noqa: PLR2004
+    exteriors = [x for x in rings if not shapely.is_ccw(x)] or rings
+    holes: list[list[shapely.Geometry]] = [[] for _ in exteriors]
+    shells = [shapely.polygons(x) for x in exteriors]
+    for ring in rings:
+        if any(ring is x for x in exteriors):
+            continue
+        point = shapely.points(shapely.get_coordinates(ring)[0])
+        index = next(
+            (i for i, shell in enumerate(shells) if shapely.covers(shell, point)), 0
+        )
+        holes[index].append(ring)
+    polygons = [
+        shapely.polygons(shell, holes=hole or None)
+        for shell, hole in zip(exteriors, holes, strict=True)
+    ]
+    if len(polygons) == 1:
+        return polygons[0]
+    return shapely.multipolygons(polygons)
+
+
+def arrow_schema(fields: list[dict], date_type: pa.DataType = DATE) -> list[pa.Field]:
+    """Map ESRIJSON fields to Arrow fields, with Date fields as date_type."""
+    return [
+        pa.field(
+            x["name"],
+            date_type
+            if x["type"] in _DATE_TYPES
+            else _FIELD_TYPES.get(x["type"], pa.string()),
+        )
+        for x in fields
+    ]
+
+
+def _epoch_ms(value: object) -> int | None:
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value)
+    parsed = datetime.fromisoformat(str(value))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=UTC)
+    return int(parsed.timestamp() * 1000)
+
+
+def _column(values: list[object], arrow_type: pa.DataType) -> pa.Array:
+    if pa.types.is_date32(arrow_type):
+        days = [None if x is None else x // _MS_PER_DAY for x in map(_epoch_ms, values)]
+        return pa.array(days, pa.int32()).cast(arrow_type)
+    if pa.types.is_timestamp(arrow_type):
+        ms = [_epoch_ms(x) for x in values]
+        return pa.array(ms, pa.int64()).cast(arrow_type)
+    return pa.array(values, arrow_type)
+
+
+def _coordinates(part: list, dims: int) -> np.ndarray:
+    return np.asarray([x[:dims] for x in part], dtype=float).reshape(-1, dims)
+
+
+def _geometry(geometry: dict | None, dims: int) -> shapely.Geometry | None:  # noqa: PLR0911
+    """Build a shapely geometry from an ESRIJSON geometry object."""
+    if not geometry:
+        return None
+    if "rings" in geometry:
+        rings = [_coordinates(x, dims) for x in geometry["rings"]]
+        return polygon(rings) if rings else None
+    if "paths" in geometry:
+        lines = [shapely.linestrings(_coordinates(x, dims)) for x in geometry["paths"]]
+        if not lines:
+            return None
+        return lines[0] if len(lines) == 1 else shapely.multilinestrings(lines)
+    if "points" in geometry:
+        points = geometry["points"]
+        return shapely.multipoints(_coordinates(points, dims)) if points else None
+    if geometry.get("x") is None or geometry.get("y") is None:
+        return None
+    keys = ("x", "y", "z")[:dims]
+    return shapely.points([geometry.get(x, 0.0) for x in keys])
+
+
+def _crs(spatial_reference: dict | None) -> dict | None:
+    """Return the PROJJSON of an ESRIJSON spatial reference, if it has one."""
+    spatial_reference = spatial_reference or {}
+    wkid = spatial_reference.get("latestWkid") or spatial_reference.get("wkid")
+    candidates = [f"EPSG:{wkid}", f"ESRI:{wkid}"] if wkid else []
+    if spatial_reference.get("wkt"):
+        candidates.append(spatial_reference["wkt"])
+    for candidate in candidates:
+        try:
+            return CRS.from_user_input(candidate).to_json_dict()
+        except CRSError:
+            continue
+    return None
+
+
+def read_pages(paths: Iterable[Path]) -> Iterator[dict]:
+    """Parse ESRIJSON pages one at a time, so only one is held in memory."""
+    for path in paths:
+        yield json.loads(path.read_bytes())
+
+
+def to_batch(page: dict, schema: pa.Schema) -> pa.RecordBatch:
+    """Convert the features of an ESRIJSON page into a batch with schema."""
+    features = page.get("features") or []
+    columns = [
+        _column([x["attributes"].get(field.name) for x in features], field.type)
+        for field in schema
+        if field.name != GEOMETRY
+    ]
+    if GEOMETRY in schema.names:
+        dims = 3 if page.get("hasZ") else 2
+        geometries = [_geometry(x.get("geometry"), dims) for x in features]
+        columns.append(pa.array(shapely.to_wkb(geometries), pa.binary()))
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+class _GeoMetadata:
+    """GeoParquet column metadata, accumulated as batches are written."""
+
+    def __init__(self, crs: dict | None) -> None:
+        self.crs = crs
+        self.types: set[str] = set()
+        self.bounds = [np.inf, np.inf, -np.inf, -np.inf]
+
+    def update(self, wkb: pa.Array) -> None:
+        geometries = shapely.from_wkb(wkb.to_numpy(zero_copy_only=False))
+        present = geometries[~shapely.is_missing(geometries)]
+        if not len(present):
+            return
+        has_z = shapely.has_z(present)
+        for kind, z in zip(shapely.get_type_id(present), has_z, strict=True):
+            self.types.add(_GEOMETRY_TYPES[kind] + (" Z" if z else ""))
+        xmin, ymin, xmax, ymax = shapely.total_bounds(present)
+        self.bounds = [
+            min(self.bounds[0], xmin),
+            min(self.bounds[1], ymin),
+            max(self.bounds[2], xmax),
+            max(self.bounds[3], ymax),
+        ]
+
+    def to_json(self) -> bytes:
+        column: dict = {"encoding": "WKB", "geometry_types": sorted(self.types)}
+        if self.crs is not None:
+            column["crs"] = self.crs
+        if np.isfinite(self.bounds).all():
+            column["bbox"] = [float(x) for x in self.bounds]
+        metadata = {
+            "version": "1.1.0",
+            "primary_column": GEOMETRY,
+            "columns": {GEOMETRY: column},
+        }
+        return json.dumps(metadata).encode()
+
+
+def write_parquet(
+    output_file: Path,
+    pages: Iterable[dict],
+    date_type: pa.DataType = DATE,
+    compression_level: int | None = None,
+    *,
+    keep_oid: bool = False,
+) -> int:
+    """Write ESRIJSON pages to a parquet file, one row group per page.
+
+    The schema and CRS are taken from the first page; layers with geometry
+    are written as GeoParquet. The OID field is dropped, as ogr2ogr takes it
+    as the FID, unless keep_oid. Pages are converted as they are read, so
+    memory use is bounded by the page size. Returns the number of rows.
+    """
+    writer = None
+    geo = None
+    rows = 0
+    try:
+        for page in pages:
+            if "error" in page:
+                msg = f"Invalid ESRIJSON page: {page['error']}"
+                raise ValueError(msg)
+            if writer is None:
+                fields = arrow_schema(
+                    [
+                        x
+                        for x in page.get("fields") or []
+                        if keep_oid or x["type"] != OBJECTID
+                    ],
+                    date_type,
+                )
+                if page.get("geometryType"):
+                    fields.append(pa.field(GEOMETRY, pa.binary()))
+                    geo = _GeoMetadata(_crs(page.get("spatialReference")))
+                schema = pa.schema(fields)
+                writer = pq.ParquetWriter(
+                    output_file,
+                    schema,
+                    compression="zstd",
+                    compression_level=compression_level,
+                    store_schema=False,
+                )
+            batch = to_batch(page, schema)
+            if geo is not None:
+                geo.update(batch.column(GEOMETRY))
+            writer.write_batch(batch)
+            rows += batch.num_rows
+        if writer is not None and geo is not None:
+            writer.add_key_value_metadata({"geo": geo.to_json()})
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def read_table(pages: Iterable[dict], date_type: pa.DataType = DATE) -> pa.Table:
+    """Convert the attributes of ESRIJSON pages to one Arrow table."""
+    schema = None
+    batches = []
+    for page in pages:
+        if schema is None:
+            schema = pa.schema(arrow_schema(page.get("fields") or [], date_type))
+        batches.append(to_batch(page, schema))
+    return pa.Table.from_batches(batches, schema=schema or pa.schema([]))
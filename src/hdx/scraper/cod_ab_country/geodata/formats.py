@@ -1,11 +1,46 @@
 """Geospatial format conversion via GDAL."""
 
-import zipfile
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from contextvars import copy_context
+from functools import partial
+from hashlib import file_digest, sha256
 from pathlib import Path
-from shutil import make_archive, rmtree
-from subprocess import run
+from shutil import rmtree
+from tempfile import TemporaryDirectory
 
-import pandas as pd
+from hdx.scraper.cod_ab_country import metrics
+from hdx.scraper.cod_ab_country.cache import FileCache
+from hdx.scraper.cod_ab_country.config import (
+    FORMAT_CACHE_MAX_MB,
+    FORMAT_WORKERS,
+    ZIP_COMPRESSION_LEVEL,
+)
+from hdx.scraper.cod_ab_country.metrics import run
+
+from . import engine
+from .archive import ZipSink
+
+# Each output, with the dataset suffix whose creation options it is built with
+_OUTPUTS = {
+    "gdb.zip": ".gdb",
+    "shp.zip": ".shp",
+    "geojson.zip": ".geojson",
+    "xlsx": ".xlsx",
+}
+# Outputs streamed into a zip archive, with the suffix of each member layer
+_ARCHIVED = {"shp.zip": ".shp.zip", "geojson.zip": ".geojson"}
+
+_format_cache: FileCache | None = None
+
+
+def use_format_cache(directory: Path | None) -> None:
+    """Cache built outputs in directory, or stop caching them if None."""
+    global _format_cache  # noqa: PLW0603
+    _format_cache = (
+        FileCache(directory, FORMAT_CACHE_MAX_MB * 1024 * 1024) if directory else None
+    )
 
 
 def _get_layer_create_options(suffix: str) -> list[str]:
@@ -28,12 +63,33 @@ def _get_dst_dataset(src_dataset: Path, dst_dataset: Path, *, multi: bool) -> Pa
     return dst_dataset
 
 
-def _to_multilayer(src_dataset: Path, dst_dataset: Path, *, multi: bool) -> None:
-    """Use GDAL to turn a GeoParquet into a generic layer."""
+def _to_multilayer(
+    src_dataset: Path,
+    dst_dataset: Path,
+    *,
+    multi: bool,
+    layer: engine.Layer | None = None,
+) -> None:
+    """Use GDAL to turn a GeoParquet into a generic layer.
+
+    GDAL runs in-process through pyogrio unless CONVERT_ENGINE is
+    "subprocess", when gdal vector convert is used.
+    In-process, an already decoded layer is written instead of re-reading
+    src_dataset.
+    """
     lco = _get_layer_create_options(dst_dataset.suffixes[0])
     output_options = [f"--nln={src_dataset.stem}"] if multi else []
     dst_dataset = _get_dst_dataset(src_dataset, dst_dataset, multi=multi)
     dst_dataset.parent.mkdir(parents=True, exist_ok=True)
+    if layer is not None or engine.in_process():
+        engine.write(
+            layer or engine.read_layer(src_dataset),
+            dst_dataset,
+            src_dataset.stem,
+            lco,
+            append=dst_dataset.exists(),
+        )
+        return
     mode = "--append" if dst_dataset.exists() else "--overwrite"
     run(
         [
@@ -48,35 +104,175 @@ def _to_multilayer(src_dataset: Path, dst_dataset: Path, *, multi: bool) -> None
     )
 
 
-def _table_to_csv(src: Path, dst: Path) -> None:
-    pd.read_parquet(src).to_csv(dst, index=False)
+def _to_archive(
+    src_dataset: Path,
+    sink: ZipSink,
+    suffix: str,
+    layer: engine.Layer | None = None,
+) -> None:
+    """Add a GeoParquet to an archive as a single-layer dataset.
+
+    In-process, GeoJSON is written in memory. Shapefiles, which GDAL only
+    writes to disk, are staged as a .shp.zip whose members are copied into
+    the archive.
+    """
+    name = src_dataset.stem + suffix
+    if suffix == ".geojson" and (layer is not None or engine.in_process()):
+        lco = _get_layer_create_options(suffix)
+        layer = layer or engine.read_layer(src_dataset)
+        sink.add_bytes(name, engine.to_bytes(layer, suffix, src_dataset.stem, lco))
+        return
+    with TemporaryDirectory() as tmp:
+        dst_dataset = Path(tmp) / name
+        _to_multilayer(src_dataset, dst_dataset, multi=True, layer=layer)
+        if dst_dataset.suffix == ".zip":
+            sink.add_zip(dst_dataset)
+        else:
+            sink.add_bytes(name, dst_dataset.read_bytes())
+
+
+def _table_to_csv(table: engine.Layer) -> bytes:
+    return table.table.to_pandas().to_csv(index=False).encode()
+
+
+def _run_tasks(tasks: list[Callable[[], None]], workers: int) -> None:
+    """Run tasks on up to workers threads, each in a copy of the caller's context.
+
+    Every task finishes before the first error, if any, is raised.
+    """
+    if workers <= 1:
+        for task in tasks:
+            task()
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(copy_context().run, task) for task in tasks]
+        wait(futures)
+    for future in futures:
+        future.result()
+
+
+def _cache_keys(iso3_dir: Path, sources: list[Path]) -> dict[str, str]:
+    """Key each output by its sources, the GDAL used and its creation options.
+
+    Sources are hashed by name and content, so a rerun on the same download
+    finds the outputs built last time.
+    """
+    if _format_cache is None:
+        return {}
+    digest = sha256()
+    for path in sources:
+        digest.update(path.relative_to(iso3_dir).as_posix().encode() + b"\0")
+        with path.open("rb") as f:
+            digest.update(file_digest(f, "sha256").digest())
+    gdal = engine.gdal_version()
+    return {
+        ext: ":".join(
+            [
+                ext,
+                digest.hexdigest(),
+                gdal,
+                " ".join(_get_layer_create_options(suffix)),
+                f"zip level {ZIP_COMPRESSION_LEVEL}",
+            ]
+        )
+        for ext, suffix in _OUTPUTS.items()
+    }
+
+
+def _restore_output(key: str | None, output_file: Path) -> bool:
+    """Write a cached output to output_file, returning False if not cached."""
+    if key is None or _format_cache is None:
+        return False
+    if not _format_cache.get_file(key, output_file):
+        metrics.add_count("format_cache_misses")
+        return False
+    metrics.add_count("format_cache_hits")
+    return True
+
+
+def _cache_output(key: str | None, output_file: Path) -> None:
+    if key is None or _format_cache is None or not output_file.exists():
+        return
+    _format_cache.put_file(key, output_file)
+
+
+def _convert(
+    outputs: dict[str, Path],
+    layer_files: list[Path],
+    table_files: list[Path],
+    workers: int,
+) -> None:
+    """Build outputs, keyed by extension, decoding each source once for all.
+
+    Each layer and table is written to every output before the next is
+    read, so layers keep their order within multi-layer outputs. With more
+    than one worker, the outputs for a layer are written concurrently.
+    Anything left by an earlier, interrupted conversion is removed first, as
+    multi-layer outputs are appended to.
+    """
+    in_process = engine.in_process()
+    gdb = outputs["gdb.zip"].with_suffix("") if "gdb.zip" in outputs else None
+    for path in outputs.values():
+        path.unlink(missing_ok=True)
+    if gdb is not None:
+        rmtree(gdb, ignore_errors=True)
+    with ExitStack() as stack:
+        sinks = {
+            ext: stack.enter_context(ZipSink(path))
+            for ext, path in outputs.items()
+            if ext in _ARCHIVED
+        }
+        table_writers = [
+            partial(_to_multilayer, dst_dataset=dst, multi=True)
+            for dst in (gdb, outputs.get("xlsx"))
+            if dst is not None
+        ]
+        layer_writers = [
+            *table_writers,
+            *[
+                partial(_to_archive, sink=sink, suffix=_ARCHIVED[ext])
+                for ext, sink in sinks.items()
+            ],
+        ]
+        for src_dataset in layer_files:
+            layer = engine.read_layer(src_dataset) if in_process else None
+            _run_tasks(
+                [partial(x, src_dataset, layer=layer) for x in layer_writers], workers
+            )
+        for src_dataset in table_files:
+            table = engine.read_layer(src_dataset)
+            layer = table if in_process else None
+            _run_tasks(
+                [partial(x, src_dataset, layer=layer) for x in table_writers], workers
+            )
+            csv = _table_to_csv(table) if sinks else b""
+            for sink in sinks.values():
+                sink.add_bytes(f"{src_dataset.stem}.csv", csv)
+    if gdb is not None and gdb.is_dir():
+        with ZipSink(outputs["gdb.zip"]) as sink:
+            sink.add_tree(gdb)
+        rmtree(gdb)
+
 
+def main(iso3_dir: Path, iso3: str, workers: int = FORMAT_WORKERS) -> None:
+    """Convert geometries into multiple formats.
 
-def main(iso3_dir: Path, iso3: str) -> None:
-    """Convert geometries into multiple formats."""
+    Outputs found in the format cache are restored instead of being built.
+    The shapefile and GeoJSON outputs are streamed straight into their zip
+    archives, and each table's CSV is built once for both.
+    """
     tables_dir = iso3_dir / "tables"
     table_files = sorted(tables_dir.glob("*.parquet")) if tables_dir.exists() else []
-    for ext, multi in [
-        ("gdb", True),
-        ("shp.zip", True),
-        ("geojson", False),
-        ("xlsx", True),
-    ]:
-        dst_dataset = iso3_dir / f"{iso3.lower()}_admin_boundaries.{ext}"
-        for src_dataset in sorted(iso3_dir.glob("*.parquet")):
-            _to_multilayer(src_dataset, dst_dataset, multi=multi)
-        for table in table_files:
-            if ext in ("gdb", "xlsx"):
-                _to_multilayer(table, dst_dataset, multi=True)
-            elif ext == "shp.zip":
-                csv_path = tables_dir / (table.stem + ".csv")
-                _table_to_csv(table, csv_path)
-                with zipfile.ZipFile(dst_dataset, "a") as zf:
-                    zf.write(csv_path, arcname=csv_path.name)
-            elif ext == "geojson":
-                geojson_dir = dst_dataset
-                csv_path = geojson_dir / (table.stem + ".csv")
-                _table_to_csv(table, csv_path)
-        if dst_dataset.is_dir():
-            make_archive(str(dst_dataset), "zip", dst_dataset)
-            rmtree(dst_dataset)
+    layer_files = sorted(iso3_dir.glob("*.parquet"))
+    name = f"{iso3.lower()}_admin_boundaries"
+    outputs = {ext: iso3_dir / f"{name}.{ext}" for ext in _OUTPUTS}
+    keys = _cache_keys(iso3_dir, [*layer_files, *table_files])
+    pending = {
+        ext: path
+        for ext, path in outputs.items()
+        if not _restore_output(keys.get(ext), path)
+    }
+    if pending:
+        _convert(pending, layer_files, table_files, workers)
+    for ext, path in pending.items():
+        _cache_output(keys.get(ext), path)
@@ -0,0 +1,344 @@
+"""Decoder for ArcGIS FeatureCollection protocol buffers (f=pbf)."""
+
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from struct import unpack
+
+import numpy as np
+import pyarrow as pa
+import shapely
+from geopandas import GeoDataFrame
+from pandas import ArrowDtype
+
+from .esrijson import polygon
+
+_VARINT = 0
+_FIXED64 = 1
+_BYTES = 2
+_FIXED32 = 5
+
+_POINT = 0
+_MULTIPOINT = 1
+_POLYLINE = 2
+_POLYGON = 3
+
+_UPPER_LEFT = 0
+
+# esriFieldType enum values in FeatureCollection.proto
+_FIELD_TYPES = {
+    0: pa.int16(),  # SmallInteger
+    1: pa.int32(),  # Integer
+    2: pa.float32(),  # Single
+    3: pa.float64(),  # Double
+    4: pa.string(),  # String
+    5: pa.date32(),  # Date, as mapped by -mapFieldType DateTime=Date
+    6: pa.int32(),  # OID
+    10: pa.string(),  # GUID
+    11: pa.string(),  # GlobalID
+    12: pa.string(),  # XML
+    13: pa.int64(),  # BigInteger
+    14: pa.date32(),  # DateOnly
+    16: pa.date32(),  # TimestampOffset
+}
+_DATE_TYPES = {5, 16}
+_EXTENT_TOLERANCE = 0.01
+
+
+class PbfError(ValueError):
+    """Raised when a pbf response cannot be decoded."""
+
+
+@dataclass(slots=True)
+class Transform:
+    """Quantization transform from integer to real coordinates."""
+
+    upper_left: bool = True
+    scale: tuple[float, float, float] = (1.0, 1.0, 1.0)
+    translate: tuple[float, float, float] = (0.0, 0.0, 0.0)
+
+
+@dataclass(slots=True)
+class FeatureResult:
+    """The parts of a FeatureResult message needed to rebuild a layer."""
+
+    geometry_type: int = _POLYGON
+    wkid: int | None = None
+    wkt: str | None = None
+    has_z: bool = False
+    has_m: bool = False
+    exceeded_transfer_limit: bool = False
+    transform: Transform = field(default_factory=Transform)
+    fields: list[tuple[str, int]] = field(default_factory=list)
+    attributes: list[list[object]] = field(default_factory=list)
+    lengths: list[bytes] = field(default_factory=list)
+    coords: list[bytes] = field(default_factory=list)
+
+
+def _varint(buf: memoryview, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        try:
+            byte = buf[pos]
+        except IndexError:
+            msg = "Truncated varint"
+            raise PbfError(msg) from None
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:  # noqa: PLR2004
+            return result, pos
+        shift += 7
+
+
+def _fields(buf: memoryview) -> Iterator[tuple[int, int, int | memoryview]]:
+    """Yield (field number, wire type, value) for each field in a message."""
+    pos, end = 0, len(buf)
+    while pos < end:
+        key, pos = _varint(buf, pos)
+        number, wire = key >> 3, key & 7
+        if wire == _VARINT:
+            value, pos = _varint(buf, pos)
+        elif wire == _BYTES:
+            length, pos = _varint(buf, pos)
+            value = buf[pos : pos + length]
+            pos += length
+        elif wire == _FIXED64:
+            value = buf[pos : pos + 8]
+            pos += 8
+        elif wire == _FIXED32:
+            value = buf[pos : pos + 4]
+            pos += 4
+        else:
+            msg = f"Unsupported wire type {wire}"
+            raise PbfError(msg)
+        if pos > end:
+            msg = "Truncated message"
+            raise PbfError(msg)
+        yield number, wire, value
+
+
+def _zigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def _signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+
+def _double(value: memoryview) -> float:
+    return unpack("<d", value)[0]
+
+
+def decode_varints(buf: bytes | memoryview) -> np.ndarray:
+    """Decode packed unsigned varints into a uint64 array."""
+    data = np.frombuffer(buf, dtype=np.uint8)
+    if data.size == 0:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)  # noqa: PLR2004
+    if ends.size == 0 or ends[-1] != data.size - 1:
+        msg = "Truncated packed varints"
+        raise PbfError(msg)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    owner = np.repeat(np.arange(ends.size), ends - starts + 1)
+    shifts = ((np.arange(data.size) - starts[owner]) * 7).astype(np.uint64)
+    payload = (data & 0x7F).astype(np.uint64) << shifts
+    return np.bitwise_or.reduceat(payload, starts)
+
+
+def _decode_value(buf: memoryview) -> object:  # noqa: PLR0911
+    """Decode a Value message, which holds one of several scalar types."""
+    for number, _, value in _fields(buf):
+        match number:
+            case 1:
+                return bytes(value).decode()
+            case 2:
+                return unpack("<f", value)[0]
+            case 3:
+                return _double(value)
+            case 4 | 8:
+                return _zigzag(value)
+            case 5 | 7:
+                return value
+            case 6:
+                return _signed(value, 64)
+            case 9:
+                return bool(value)
+    return None
+
+
+def _decode_transform(buf: memoryview) -> Transform:
+    transform = Transform()
+    scale, translate = [1.0, 1.0, 1.0], [0.0, 0.0, 0.0]
+    for number, _, value in _fields(buf):
+        if number == 1:
+            transform.upper_left = value == _UPPER_LEFT
+        elif number in (2, 3):
+            target = scale if number == 2 else translate  # noqa: PLR2004
+            for axis, _, v in _fields(value):
+                # x, y, m, z in that order; m is not kept
+                if axis in (1, 2):
+                    target[axis - 1] = _double(v)
+                elif axis == 4:  # noqa: PLR2004
+                    target[2] = _double(v)
+    transform.scale = (scale[0], scale[1], scale[2])
+    transform.translate = (translate[0], translate[1], translate[2])
+    return transform
+
+
+def _decode_feature(buf: memoryview, result: FeatureResult) -> None:
+    attributes, lengths, coords = [], b"", b""
+    for number, _, value in _fields(buf):
+        if number == 1:
+            attributes.append(_decode_value(value))
+        elif number == 2:  # noqa: PLR2004
+            for part, _, v in _fields(value):
+                if part == 2:  # noqa: PLR2004
+                    lengths += bytes(v)
+                elif part == 3:  # noqa: PLR2004
+                    coords += bytes(v)
+        elif number == 3:  # noqa: PLR2004
+            msg = "esriShapeBuffer geometries are not supported"
+            raise PbfError(msg)
+    result.attributes.append(attributes)
+    result.lengths.append(lengths)
+    result.coords.append(coords)
+
+
+def _decode_feature_result(buf: memoryview) -> FeatureResult:  # noqa: C901, PLR0912
+    result = FeatureResult()
+    for number, _, value in _fields(buf):
+        match number:
+            case 7:
+                result.geometry_type = value
+            case 8:
+                for sr_field, _, v in _fields(value):
+                    if sr_field in (1, 2) and v:
+                        result.wkid = v
+                    elif sr_field == 5:  # noqa: PLR2004
+                        result.wkt = bytes(v).decode()
+            case 9:
+                result.exceeded_transfer_limit = bool(value)
+            case 10:
+                result.has_z = bool(value)
+            case 11:
+                result.has_m = bool(value)
+            case 12:
+                result.transform = _decode_transform(value)
+            case 13:
+                name, field_type = "", 4
+                for f, _, v in _fields(value):
+                    if f == 1:
+                        name = bytes(v).decode()
+                    elif f == 2:  # noqa: PLR2004
+                        field_type = v
+                result.fields.append((name, field_type))
+            case 15:
+                _decode_feature(value, result)
+    return result
+
+
+def decode(data: bytes) -> FeatureResult:
+    """Decode a FeatureCollectionPBuffer holding a query's features."""
+    buf = memoryview(data)
+    for number, wire, value in _fields(buf):
+        if number == 2 and wire == _BYTES:  # noqa: PLR2004
+            for result_field, _, v in _fields(value):
+                if result_field == 1:
+                    return _decode_feature_result(v)
+    msg = "No feature result in pbf response"
+    raise PbfError(msg)
+
+
+def _coordinates(result: FeatureResult, coords: bytes) -> np.ndarray:
+    """Undo delta encoding and quantization of one geometry's coordinates."""
+    dims = 2 + result.has_z + result.has_m
+    raw = decode_varints(coords).astype(np.int64)
+    values = (raw >> 1) ^ -(raw & 1)
+    if values.size % dims:
+        msg = "Coordinate count is not a multiple of the dimensions"
+        raise PbfError(msg)
+    values = np.cumsum(values.reshape(-1, dims), axis=0, dtype=np.int64)
+    scale, translate = result.transform.scale, result.transform.translate
+    xy = np.empty((values.shape[0], 3 if result.has_z else 2), dtype=np.float64)
+    xy[:, 0] = translate[0] + values[:, 0] * scale[0]
+    y_sign = -1 if result.transform.upper_left else 1
+    xy[:, 1] = translate[1] + y_sign * values[:, 1] * scale[1]
+    if result.has_z:
+        xy[:, 2] = translate[2] + values[:, 2] * scale[2]
+    return xy
+
+
+def _split_parts(xy: np.ndarray, lengths: bytes) -> list[np.ndarray]:
+    counts = decode_varints(lengths).astype(np.int64) if lengths else [len(xy)]
+    if sum(counts) != len(xy):
+        msg = "Part lengths do not match the number of coordinates"
+        raise PbfError(msg)
+    return np.split(xy, np.cumsum(counts)[:-1])
+
+
+def _geometry(result: FeatureResult, lengths: bytes, coords: bytes) -> object:
+    if not coords:
+        return None
+    xy = _coordinates(result, coords)
+    if result.geometry_type == _POINT:
+        return shapely.points(xy[0])
+    if result.geometry_type == _MULTIPOINT:
+        return shapely.multipoints(xy)
+    parts = _split_parts(xy, lengths)
+    if result.geometry_type == _POLYLINE:
+        lines = [shapely.linestrings(x) for x in parts]
+        return lines[0] if len(lines) == 1 else shapely.multilinestrings(lines)
+    if result.geometry_type == _POLYGON:
+        return polygon(parts)
+    msg = f"Unsupported geometry type {result.geometry_type}"
+    raise PbfError(msg)
+
+
+def _column(values: list[object], field_type: int) -> pa.Array:
+    if field_type in _DATE_TYPES:
+        values = [
+            None if x is None else datetime.fromtimestamp(x / 1000, tz=UTC).date()
+            for x in values
+        ]
+    return pa.array(values, type=_FIELD_TYPES.get(field_type, pa.string()))
+
+
+def _check_extent(gdf: GeoDataFrame, extent: dict | None) -> None:
+    """Reject coordinates well outside the layer's extent, a sign of bad decoding."""
+    keys = ("xmin", "ymin", "xmax", "ymax")
+    if not extent or gdf.empty or any(extent.get(k) is None for k in keys):
+        return
+    xmin, ymin, xmax, ymax = (extent[k] for k in keys)
+    pad_x = (xmax - xmin) * _EXTENT_TOLERANCE + 1e-9
+    pad_y = (ymax - ymin) * _EXTENT_TOLERANCE + 1e-9
+    bxmin, bymin, bxmax, bymax = gdf.total_bounds
+    if (
+        bxmin < xmin - pad_x
+        or bymin < ymin - pad_y
+        or bxmax > xmax + pad_x
+        or bymax > ymax + pad_y
+    ):
+        msg = "Decoded coordinates fall outside the layer extent"
+        raise PbfError(msg)
+
+
+def to_geodataframe(result: FeatureResult, extent: dict | None = None) -> GeoDataFrame:
+    """Build a GeoDataFrame with the column types ogr2ogr would give the layer.
+
+    If the layer extent is given, the decoded geometries are checked against
+    it.
+    """
+    columns = {}
+    for i, (name, field_type) in enumerate(result.fields):
+        values = [row[i] if i < len(row) else None for row in result.attributes]
+        columns[name] = _column(values, field_type)
+    geometries = [
+        _geometry(result, lengths, coords)
+        for lengths, coords in zip(result.lengths, result.coords, strict=True)
+    ]
+    crs = f"EPSG:{result.wkid}" if result.wkid else result.wkt
+    table = pa.table(columns) if columns else pa.table({})
+    df = table.to_pandas(types_mapper=ArrowDtype)
+    gdf = GeoDataFrame(df, geometry=geometries, crs=crs)
+    _check_extent(gdf, extent)
+    return gdf
@@ -0,0 +1,85 @@
+"""Crash-safe journal of completed work per country."""
+
+import json
+from datetime import UTC, datetime
+from pathlib import Path
+from shutil import rmtree
+
+DOWNLOADED = "downloaded"
+CONVERTED = "converted"
+COMPARED = "compared"
+UPLOADED = "uploaded"
+DONE = "done"
+
+
+class Journal:
+    """Record of each country's completed stages, persisted as JSON.
+
+    Every country has its own file, so concurrent workers never write to the
+    same one. Files are replaced atomically, so a crash at any point leaves
+    either the previous entry or the new one. An entry only counts for the
+    service version and edit timestamp it was recorded against.
+    """
+
+    def __init__(self, journal_dir: Path, *, resume: bool = False) -> None:
+        """Open the journal, discarding previous entries unless resuming."""
+        self.journal_dir = journal_dir
+        if not resume:
+            rmtree(journal_dir, ignore_errors=True)
+        journal_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, iso3: str) -> Path:
+        return self.journal_dir / f"{iso3.lower()}.json"
+
+    def _read(self, iso3: str) -> dict:
+        try:
+            return json.loads(self._path(iso3).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, iso3: str, entry: dict) -> None:
+        path = self._path(iso3)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(entry, indent=2, sort_keys=True))
+        tmp.replace(path)
+
+    def get(self, iso3: str, version: str) -> dict:
+        """Return the entry for a country, or an empty one for a new version."""
+        entry = self._read(iso3)
+        if entry.get("version") != version:
+            return {"version": version, "edited": None, "stages": {}}
+        return entry
+
+    def edited(self, iso3: str, version: str) -> int | None:
+        """Return the service edit timestamp recorded for a country."""
+        return self.get(iso3, version)["edited"]
+
+    def is_done(self, iso3: str, version: str, stage: str) -> bool:
+        """Return True if a stage has completed for this country and version."""
+        return stage in self.get(iso3, version)["stages"]
+
+    def stage_info(self, iso3: str, version: str, stage: str) -> dict:
+        """Return the details recorded when a stage completed."""
+        return self.get(iso3, version)["stages"].get(stage, {})
+
+    def mark(
+        self,
+        iso3: str,
+        version: str,
+        stage: str,
+        edited: int | None = None,
+        **details: str | bool | None,
+    ) -> None:
+        """Record a completed stage for a country."""
+        entry = self.get(iso3, version)
+        if edited is not None:
+            entry["edited"] = edited
+        entry["stages"][stage] = {
+            "completed": datetime.now(UTC).isoformat(),
+            **details,
+        }
+        self._write(iso3, entry)
+
+    def reset(self, iso3: str, version: str, edited: int | None = None) -> None:
+        """Forget completed stages for a country, e.g. when its service changed."""
+        self._write(iso3, {"version": version, "edited": edited, "stages": {}})
@@ -0,0 +1,108 @@
+"""Indexed in-memory store of refactored COD-AB metadata."""
+
+import logging
+from collections.abc import Iterable
+from dataclasses import dataclass, fields
+from datetime import date
+from pathlib import Path
+
+from pandas import read_parquet
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True, frozen=True)
+class MetadataRecord:
+    """Metadata for one version of a country's boundaries.
+
+    Fields can also be read with dict-style access, as dataset generation does.
+    """
+
+    country_name: str | None = None
+    country_iso2: str | None = None
+    country_iso3: str | None = None
+    version: str | None = None
+    admin_level_full: int | None = None
+    admin_level_max: int | None = None
+    admin_1_name: str | None = None
+    admin_2_name: str | None = None
+    admin_3_name: str | None = None
+    admin_4_name: str | None = None
+    admin_5_name: str | None = None
+    admin_1_count: int | None = None
+    admin_2_count: int | None = None
+    admin_3_count: int | None = None
+    admin_4_count: int | None = None
+    admin_5_count: int | None = None
+    admin_notes: str | None = None
+    date_source: date | None = None
+    date_updated: date | None = None
+    date_reviewed: date | None = None
+    date_metadata: date | None = None
+    date_valid_on: date | None = None
+    date_valid_to: date | None = None
+    update_frequency: int | None = None
+    update_type: str | None = None
+    source: str | None = None
+    contributor: str | None = None
+    methodology_dataset: str | None = None
+    methodology_pcodes: str | None = None
+    caveats: str | None = None
+
+    def __getitem__(self, key: str) -> object:
+        """Get a field by name."""
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: object = None) -> object:
+        """Get a field by name, or default if there is no such field."""
+        return getattr(self, key, default)
+
+
+_FIELDS = [x.name for x in fields(MetadataRecord)]
+
+
+class MetadataStore:
+    """Metadata records indexed by (country_iso3, version).
+
+    Loaded once per run so that per-country lookups need no disk I/O.
+    """
+
+    __slots__ = ("_latest", "_records")
+
+    def __init__(self, records: Iterable[MetadataRecord]) -> None:
+        """Index records, treating the last version of each country as latest.
+
+        Records are expected in (country_iso3, version) order, as written by
+        the metadata refactor.
+        """
+        self._records: dict[tuple[str, str], MetadataRecord] = {}
+        self._latest: dict[str, str] = {}
+        for record in records:
+            self._records[(record.country_iso3, record.version)] = record
+            self._latest[record.country_iso3] = record.version
+
+    @classmethod
+    def from_parquet(cls, path: Path) -> "MetadataStore":
+        """Load a store from metadata_all.parquet."""
+        df = read_parquet(path)
+        columns = [x for x in _FIELDS if x in df.columns]
+        return cls(MetadataRecord(**row) for row in df[columns].to_dict("records"))
+
+    def __len__(self) -> int:
+        """Return the number of records."""
+        return len(self._records)
+
+    def get(self, iso3: str, version: str) -> MetadataRecord | dict:
+        """Get metadata for a country version, or an empty dict if not found."""
+        record = self._records.get((iso3, version))
+        if record is None:
+            logger.error("Metadata not found for %s %s", iso3, version)
+            return {}
+        return record
+
+    def latest(self) -> list[tuple[str, str]]:
+        """Get the latest version of every country."""
+        return list(self._latest.items())
@@ -0,0 +1,252 @@
+"""Per-country stage timing and resource usage for a run report."""
+
+import csv
+import json
+import logging
+import subprocess
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from pathlib import Path
+from resource import RUSAGE_CHILDREN, RUSAGE_SELF, getrusage
+from threading import Lock
+from time import perf_counter
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+_country: ContextVar[str | None] = ContextVar("country", default=None)
+_lock = Lock()
+_records: dict[str, dict] = {}
+_started = datetime.now(UTC)
+
+
+def reset() -> None:
+    """Forget all records and restart the run clock."""
+    global _started  # noqa: PLW0603
+    with _lock:
+        _records.clear()
+        _started = datetime.now(UTC)
+
+
+def current_country() -> str | None:
+    """Return the ISO3 of the country whose stage is running, if any."""
+    return _country.get()
+
+
+def _new_record() -> dict:
+    return {
+        "stages": {},
+        "steps": {},
+        "bytes_downloaded": 0,
+        "output_bytes": {},
+        "subprocesses": 0,
+        "counts": {},
+        "peak_rss_kb": 0,
+        "peak_child_rss_kb": 0,
+    }
+
+
+def _record(iso3: str) -> dict:
+    """Return the record for a country, creating it if needed. Hold _lock."""
+    if iso3 not in _records:
+        _records[iso3] = _new_record()
+    return _records[iso3]
+
+
+def _add(key: str, name: str, seconds: float) -> None:
+    iso3 = _country.get()
+    if iso3 is None:
+        return
+    with _lock:
+        timings = _record(iso3)[key]
+        timings[name] = timings.get(name, 0) + seconds
+
+
+@contextmanager
+def stage(name: str, iso3: str) -> Iterator[None]:
+    """Time a top-level stage of a country, attributing nested work to it.
+
+    Peak RSS is sampled when the stage ends. It is the peak of the whole
+    process (and of its largest child), so with threads it is shared across
+    the countries running at the same time.
+    """
+    token = _country.set(iso3)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        _add("stages", name, perf_counter() - start)
+        with _lock:
+            record = _record(iso3)
+            record["peak_rss_kb"] = max(
+                record["peak_rss_kb"], getrusage(RUSAGE_SELF).ru_maxrss
+            )
+            record["peak_child_rss_kb"] = max(
+                record["peak_child_rss_kb"], getrusage(RUSAGE_CHILDREN).ru_maxrss
+            )
+        _country.reset(token)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Time a step within the current country's stage."""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        _add("steps", name, perf_counter() - start)
+
+
+def add_bytes_downloaded(size: int) -> None:
+    """Count bytes received from the network for the current country."""
+    iso3 = _country.get()
+    if iso3 is None:
+        return
+    with _lock:
+        _record(iso3)["bytes_downloaded"] += size
+
+
+def add_count(name: str, count: int = 1) -> None:
+    """Increment a named counter for the current country."""
+    iso3 = _country.get()
+    if iso3 is None:
+        return
+    with _lock:
+        counts = _record(iso3)["counts"]
+        counts[name] = counts.get(name, 0) + count
+
+
+def get_counts() -> dict[str, int]:
+    """Return named counters summed across all countries."""
+    totals = {}
+    with _lock:
+        for record in _records.values():
+            for name, count in record["counts"].items():
+                totals[name] = totals.get(name, 0) + count
+    return totals
+
+
+def add_output_sizes(iso3: str, paths: dict[str, Path]) -> None:
+    """Record the size of each output file of a country, keyed by format."""
+    with _lock:
+        _record(iso3)["output_bytes"].update(
+            {key: path.stat().st_size for key, path in paths.items() if path.exists()}
+        )
+
+
+def run(args: list, **kwargs: Any) -> subprocess.CompletedProcess:  # noqa: ANN401
+    """Run a subprocess, counting it against the current country."""
+    iso3 = _country.get()
+    if iso3 is not None:
+        with _lock:
+            _record(iso3)["subprocesses"] += 1
+    name = Path(str(args[0])).name
+    if name == "gdal" and len(args) > 2:  # noqa: PLR2004
+        name = f"gdal {args[1]} {args[2]}"
+    with timed(name):
+        return subprocess.run(args, **kwargs)  # noqa: PLW1510
+
+
+def pop(iso3: str) -> dict:
+    """Remove and return a country's record, e.g. to send it between processes."""
+    with _lock:
+        return _records.pop(iso3, _new_record())
+
+
+def merge(iso3: str, record: dict) -> None:
+    """Merge a record collected elsewhere into this process."""
+    with _lock:
+        target = _record(iso3)
+        for key in ("stages", "steps"):
+            for name, seconds in record[key].items():
+                target[key][name] = target[key].get(name, 0) + seconds
+        target["output_bytes"].update(record["output_bytes"])
+        for name, count in record["counts"].items():
+            target["counts"][name] = target["counts"].get(name, 0) + count
+        for key in ("bytes_downloaded", "subprocesses"):
+            target[key] += record[key]
+        for key in ("peak_rss_kb", "peak_child_rss_kb"):
+            target[key] = max(target[key], record[key])
+
+
+def _total(record: dict) -> float:
+    return sum(record["stages"].values())
+
+
+def _csv_rows(records: dict[str, dict]) -> tuple[list[str], list[dict]]:
+    stages = sorted({x for r in records.values() for x in r["stages"]})
+    steps = sorted({x for r in records.values() for x in r["steps"]})
+    outputs = sorted({x for r in records.values() for x in r["output_bytes"]})
+    counts = sorted({x for r in records.values() for x in r["counts"]})
+    fieldnames = [
+        "iso3",
+        "total_seconds",
+        *[f"stage_{x}_seconds" for x in stages],
+        *[f"step_{x}_seconds" for x in steps],
+        "bytes_downloaded",
+        *[f"output_{x}_bytes" for x in outputs],
+        "subprocesses",
+        *[f"count_{x}" for x in counts],
+        "peak_rss_kb",
+        "peak_child_rss_kb",
+    ]
+    rows = []
+    for iso3, record in sorted(records.items()):
+        row = {
+            "iso3": iso3,
+            "total_seconds": round(_total(record), 3),
+            "bytes_downloaded": record["bytes_downloaded"],
+            "subprocesses": record["subprocesses"],
+            "peak_rss_kb": record["peak_rss_kb"],
+            "peak_child_rss_kb": record["peak_child_rss_kb"],
+        }
+        row.update(
+            {f"stage_{k}_seconds": round(v, 3) for k, v in record["stages"].items()}
+        )
+        row.update(
+            {f"step_{k}_seconds": round(v, 3) for k, v in record["steps"].items()}
+        )
+        row.update({f"output_{k}_bytes": v for k, v in record["output_bytes"].items()})
+        row.update({f"count_{k}": v for k, v in record["counts"].items()})
+        rows.append(row)
+    return fieldnames, rows
+
+
+def write_report(report_dir: Path, top_n: int = 10, **extra: Any) -> Path:  # noqa: ANN401
+    """Write the run report as JSON and CSV, and log the slowest countries.
+
+    Any extra keyword arguments are stored at the top level of the JSON report.
+    Returns the path of the JSON report.
+    """
+    finished = datetime.now(UTC)
+    with _lock:
+        records = {k: json.loads(json.dumps(v)) for k, v in _records.items()}
+    report_dir.mkdir(parents=True, exist_ok=True)
+    stem = f"run_{_started.strftime('%Y%m%dT%H%M%SZ')}"
+    report = {
+        "started": _started.isoformat(),
+        "finished": finished.isoformat(),
+        "seconds": round((finished - _started).total_seconds(), 3),
+        **extra,
+        "countries": records,
+    }
+    json_path = report_dir / f"{stem}.json"
+    json_path.write_text(json.dumps(report, indent=2, sort_keys=True))
+    fieldnames, rows = _csv_rows(records)
+    with (report_dir / f"{stem}.csv").open("w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    slowest = sorted(records.items(), key=lambda x: _total(x[1]), reverse=True)
+    for iso3, record in slowest[:top_n]:
+        breakdown = ", ".join(
+            f"{name} {seconds:.1f}s"
+            for name, seconds in sorted(
+                record["stages"].items(), key=lambda x: x[1], reverse=True
+            )
+        )
+        logger.info("Slowest: %s %.1fs (%s)", iso3, _total(record), breakdown)
+    logger.info("Run report written to %s", json_path)
+    return json_path
@@ -0,0 +1,111 @@
+"""Staged country pipeline connected by bounded queues."""
+
+import logging
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from pathlib import Path
+from queue import Queue
+from threading import Lock, Thread
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+@dataclass
+class CountryJob:
+    """State handed from one stage to the next for a single country."""
+
+    iso3: str
+    version: str
+    iso3_dir: Path
+    has_downloads: bool = False
+
+
+@dataclass
+class Stage:
+    """A pipeline stage: a function run by a fixed number of worker threads.
+
+    The function returns False when the country needs no further stages.
+    """
+
+    name: str
+    func: Callable[[CountryJob], bool]
+    workers: int = 1
+
+
+def _work(
+    stage: Stage,
+    inbox: Queue,
+    outbox: Queue | None,
+    finish: Callable[[CountryJob, str | None], None],
+) -> None:
+    """Take jobs from inbox until told to stop, passing each on to outbox."""
+    while (job := inbox.get()) is not _DONE:
+        try:
+            with metrics.stage(stage.name, job.iso3):
+                proceed = stage.func(job)
+        except Exception as e:
+            logger.exception("%s failed for %s %s", stage.name, job.iso3, job.version)
+            finish(job, f"{type(e).__name__}: {e}")
+            continue
+        if proceed and outbox is not None:
+            outbox.put(job)
+        else:
+            finish(job, None)
+
+
+def run_pipeline(
+    jobs: Iterable[CountryJob],
+    stages: list[Stage],
+    queue_depth: int,
+    on_done: Callable[[CountryJob], None] | None = None,
+) -> dict[str, str]:
+    """Run jobs through stages, each with its own worker pool.
+
+    Stages are connected by queues holding at most queue_depth jobs, so a fast
+    stage blocks instead of running ahead of a slow one. Country N+1 can be
+    downloading while country N converts and country N-1 uploads. Returns
+    error messages keyed by ISO3 for jobs that raised in any stage.
+    """
+    queues: list[Queue] = [Queue(maxsize=max(queue_depth, 1)) for _ in stages]
+    failures: dict[str, str] = {}
+    lock = Lock()
+
+    def finish(job: CountryJob, error: str | None) -> None:
+        with lock:
+            if error:
+                failures[job.iso3] = error
+            if on_done:
+                on_done(job)
+
+    threads = [
+        [
+            Thread(
+                target=_work,
+                args=(
+                    stage,
+                    queues[i],
+                    queues[i + 1] if i + 1 < len(queues) else None,
+                    finish,
+                ),
+                name=f"{stage.name}-{n}",
+                daemon=True,
+            )
+            for n in range(max(stage.workers, 1))
+        ]
+        for i, stage in enumerate(stages)
+    ]
+    for stage_threads in threads:
+        for thread in stage_threads:
+            thread.start()
+    for job in jobs:
+        queues[0].put(job)
+    for inbox, stage_threads in zip(queues, threads, strict=True):
+        for _ in stage_threads:
+            inbox.put(_DONE)
+        for thread in stage_threads:
+            thread.join()
+    return failures
@@ -0,0 +1,189 @@
+"""Retry policy shared by every network and GDAL call that may fail transiently."""
+
+import logging
+from collections.abc import Callable
+from contextvars import ContextVar
+from functools import wraps
+from multiprocessing import get_context
+from os import register_at_fork
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+from typing import TypeVar
+
+from httpx import HTTPStatusError
+
+from . import metrics
+from .config import (
+    ATTEMPT,
+    CIRCUIT_BREAKER_FAILURES,
+    RETRY_BUDGET,
+    RETRY_DEADLINE,
+    RETRY_MAX_WAIT,
+    WAIT,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_retrying: ContextVar[bool] = ContextVar("retrying", default=False)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling again for a country that keeps failing."""
+
+
+def retry_reason(e: BaseException) -> str:
+    """Name the cause of a failed attempt for the retry counters."""
+    if isinstance(e, HTTPStatusError):
+        return f"http_{e.response.status_code}"
+    return type(e).__name__
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter, bounded per country and per run.
+
+    Each country has a deadline, counted from its first call under the
+    policy, after which it is not retried again. After max_failures
+    consecutive failed attempts its circuit opens and later calls fail at
+    once, so the run moves on to other countries. A budget of retries is
+    shared by the whole run, including forked worker processes.
+
+    Calls made while another call under the policy is already retrying are
+    attempted once, so nested functions never multiply attempts.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        attempts: int,
+        base_wait: float,
+        max_wait: float,
+        deadline: float,
+        budget: int,
+        max_failures: int,
+    ) -> None:
+        """Create a policy. Waits and the deadline are in seconds."""
+        self.attempts = attempts
+        self.base_wait = base_wait
+        self.max_wait = max_wait
+        self.deadline = deadline
+        self.max_failures = max_failures
+        self._budget = get_context("fork").Value("i", budget)
+        self._initial_budget = budget
+        self._lock = Lock()
+        register_at_fork(after_in_child=self._reset_lock)
+        self._started: dict[str, float] = {}
+        self._failures: dict[str, int] = {}
+
+    def _reset_lock(self) -> None:
+        self._lock = Lock()
+
+    def reset(self) -> None:
+        """Restore the retry budget and forget every country's state."""
+        with self._budget.get_lock():
+            self._budget.value = self._initial_budget
+        with self._lock:
+            self._started.clear()
+            self._failures.clear()
+
+    def _wait(self, attempt: int) -> float:
+        """Return a jittered wait before the given retry, starting at 1."""
+        cap = min(self.max_wait, self.base_wait * 2 ** (attempt - 1))
+        return uniform(cap / 2, cap)  # noqa: S311
+
+    def _take_budget(self) -> bool:
+        with self._budget.get_lock():
+            if self._budget.value <= 0:
+                return False
+            self._budget.value -= 1
+            return True
+
+    def _check_circuit(self, iso3: str | None, name: str) -> None:
+        if iso3 is None:
+            return
+        with self._lock:
+            self._started.setdefault(iso3, monotonic())
+            failures = self._failures.get(iso3, 0)
+        if failures >= self.max_failures:
+            metrics.add_count("retry_circuit_open")
+            msg = f"{iso3}: giving up on {name} after {failures} consecutive failures"
+            raise CircuitOpenError(msg)
+
+    def _record(self, iso3: str | None, *, failed: bool) -> None:
+        if iso3 is None:
+            return
+        with self._lock:
+            self._failures[iso3] = self._failures.get(iso3, 0) + 1 if failed else 0
+
+    def _can_retry(self, iso3: str | None, attempt: int, wait: float) -> bool:
+        if attempt >= self.attempts:
+            return False
+        if iso3 is not None:
+            with self._lock:
+                failures = self._failures.get(iso3, 0)
+                elapsed = monotonic() - self._started[iso3]
+            if failures >= self.max_failures or elapsed + wait > self.deadline:
+                return False
+        if not self._take_budget():
+            metrics.add_count("retry_budget_exhausted")
+            return False
+        return True
+
+    def call(self, func: Callable[..., T], *args: object, **kwargs: object) -> T:
+        """Call func, retrying failed attempts while the policy allows."""
+        if _retrying.get():
+            return func(*args, **kwargs)
+        iso3 = metrics.current_country()
+        name = getattr(func, "__name__", repr(func))
+        self._check_circuit(iso3, name)
+        token = _retrying.set(True)
+        try:
+            attempt = 1
+            while True:
+                try:
+                    result = func(*args, **kwargs)
+                except CircuitOpenError:
+                    raise
+                except Exception as e:
+                    self._record(iso3, failed=True)
+                    wait = self._wait(attempt)
+                    if not self._can_retry(iso3, attempt, wait):
+                        raise
+                    reason = retry_reason(e)
+                    metrics.add_count(f"retry_{reason}")
+                    logger.warning(
+                        "Retrying %s in %.1fs (attempt %d of %d): %s",
+                        name,
+                        wait,
+                        attempt + 1,
+                        self.attempts,
+                        reason,
+                    )
+                    sleep(wait)
+                    attempt += 1
+                else:
+                    self._record(iso3, failed=False)
+                    return result
+        finally:
+            _retrying.reset(token)
+
+    def __call__(self, func: Callable[..., T]) -> Callable[..., T]:
+        """Decorate func so that every call goes through the policy."""
+
+        @wraps(func)
+        def wrapper(*args: object, **kwargs: object) -> T:
+            return self.call(func, *args, **kwargs)
+
+        return wrapper
+
+
+retry_policy = RetryPolicy(
+    attempts=ATTEMPT,
+    base_wait=WAIT,
+    max_wait=RETRY_MAX_WAIT,
+    deadline=RETRY_DEADLINE,
+    budget=RETRY_BUDGET,
+    max_failures=CIRCUIT_BREAKER_FAILURES,
+)
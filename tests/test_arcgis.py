@@ -1,13 +1,24 @@
 # flake8: noqa: S101
-# ruff: noqa: D102
+# ruff: noqa: D102, PLR2004
 """Tests for arcgis module."""
 
+from datetime import UTC, datetime, timedelta
 from pathlib import Path
 from unittest.mock import patch
 
+import httpx
 import pandas as pd
 
-from hdx.scraper.cod_ab_country.arcgis import get_layer_list, get_metadata
+from hdx.scraper.cod_ab_country.arcgis import (
+    client_get,
+    close_client,
+    get_client,
+    get_edit_datetimes,
+    get_layer_list,
+    is_service_recently_updated,
+    shared_client,
+    use_response_cache,
+)
 
 
 class TestGetLayerList:
@@ -61,51 +72,111 @@ class TestGetLayerList:
             assert result == [("AFG", "v3")]
 
 
-class TestGetMetadata:
-    """Tests for get_metadata function."""
-
-    def test_returns_metadata_for_country(self, tmp_path: Path) -> None:
-        metadata_dir = tmp_path / "metadata"
-        metadata_dir.mkdir()
-        df = pd.DataFrame(
-            {
-                "country_iso3": ["AFG", "BFA", "CAF"],
-                "version": ["v1", "v2", "v1"],
-                "source": ["Source A", "Source B", "Source C"],
-            },
-        )
-        df.to_parquet(metadata_dir / "metadata_all.parquet")
-
-        result = get_metadata(tmp_path, "BFA", "v2")
-        assert result["country_iso3"] == "BFA"
-        assert result["version"] == "v2"
-        assert result["source"] == "Source B"
-
-    def test_returns_empty_dict_when_not_found(self, tmp_path: Path) -> None:
-        metadata_dir = tmp_path / "metadata"
-        metadata_dir.mkdir()
-        df = pd.DataFrame(
-            {
-                "country_iso3": ["AFG"],
-                "version": ["v1"],
-            },
-        )
-        df.to_parquet(metadata_dir / "metadata_all.parquet")
-
-        result = get_metadata(tmp_path, "XXX", "v1")
-        assert result == {}
-
-    def test_filters_by_both_iso3_and_version(self, tmp_path: Path) -> None:
-        metadata_dir = tmp_path / "metadata"
-        metadata_dir.mkdir()
-        df = pd.DataFrame(
-            {
-                "country_iso3": ["AFG", "AFG", "AFG"],
-                "version": ["v1", "v2", "v3"],
-                "data": ["first", "second", "third"],
-            },
-        )
-        df.to_parquet(metadata_dir / "metadata_all.parquet")
-
-        result = get_metadata(tmp_path, "AFG", "v2")
-        assert result["data"] == "second"
+class TestSharedClient:
+    """Tests for the shared HTTP client."""
+
+    def test_reuses_client_until_closed(self) -> None:
+        client = get_client()
+        assert get_client() is client
+        close_client()
+        assert client.is_closed
+        assert get_client() is not client
+        close_client()
+
+    def test_shared_client_closes_on_exit(self) -> None:
+        with shared_client() as client:
+            assert get_client() is client
+        assert client.is_closed
+
+    def test_client_get_uses_shared_client(self) -> None:
+        with patch("hdx.scraper.cod_ab_country.arcgis.get_client") as mock_get_client:
+            mock_get_client.return_value.get.return_value.content = b"{}"
+            client_get("https://example.com", {"f": "json"})
+            mock_get_client.return_value.get.assert_called_once_with(
+                "https://example.com", params={"f": "json"}, headers=None
+            )
+
+
+def _edit_info(days_ago: float) -> dict:
+    dt = datetime.now(UTC) - timedelta(days=days_ago)
+    return {"editingInfo": {"lastEditDate": int(dt.timestamp() * 1000)}}
+
+
+class TestEditInfo:
+    """Tests for change detection from editingInfo timestamps."""
+
+    def test_get_edit_datetimes(self) -> None:
+        response = {"editingInfo": {"lastEditDate": 0, "dataLastEditDate": 1000}}
+        assert get_edit_datetimes(response) == [
+            datetime(1970, 1, 1, 0, 0, 1, tzinfo=UTC)
+        ]
+        assert get_edit_datetimes({}) is None
+
+    def test_uses_edit_info_without_fetching_xml(self) -> None:
+        with patch("hdx.scraper.cod_ab_country.arcgis.is_recently_updated") as mock_xml:
+            assert is_service_recently_updated("url", {}, _edit_info(0.1), {})
+            assert not is_service_recently_updated(
+                "url", {}, {}, {0: _edit_info(10), 1: _edit_info(5)}
+            )
+            assert is_service_recently_updated(
+                "url", {}, _edit_info(10), {0: _edit_info(10), 1: _edit_info(0.5)}
+            )
+            mock_xml.assert_not_called()
+
+    def test_falls_back_to_xml_for_layers_without_edit_info(self) -> None:
+        with patch(
+            "hdx.scraper.cod_ab_country.arcgis.is_recently_updated", return_value=True
+        ) as mock_xml:
+            assert is_service_recently_updated(
+                "url", {}, {}, {0: _edit_info(10), 1: {}}
+            )
+            mock_xml.assert_called_once_with("url/1", {}, "url")
+
+
+class TestResponseCache:
+    """Tests for the ArcGIS response cache beneath client_get."""
+
+    def test_revalidates_with_etag(self, tmp_path: Path) -> None:
+        use_response_cache(tmp_path)
+        try:
+            with patch("hdx.scraper.cod_ab_country.arcgis.get_client") as mock_client:
+                mock_get = mock_client.return_value.get
+                mock_get.return_value = httpx.Response(
+                    200, json={"layers": []}, headers={"etag": '"v1"'}
+                )
+                client_get("https://example.com", {"f": "json", "token": "a"})
+                mock_get.return_value = httpx.Response(304)
+                response = client_get(
+                    "https://example.com", {"f": "json", "token": "b"}
+                )
+                assert response.json() == {"layers": []}
+                assert mock_get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+        finally:
+            use_response_cache(None)
+
+    def test_reuses_entries_without_validators_within_ttl(self, tmp_path: Path) -> None:
+        use_response_cache(tmp_path)
+        try:
+            with patch("hdx.scraper.cod_ab_country.arcgis.get_client") as mock_client:
+                mock_get = mock_client.return_value.get
+                mock_get.return_value = httpx.Response(200, json={"name": "a"})
+                client_get("https://example.com", {"f": "json"})
+                response = client_get("https://example.com", {"f": "json"})
+                assert response.json() == {"name": "a"}
+                mock_get.assert_called_once()
+        finally:
+            use_response_cache(None)
+
+    def test_does_not_cache_errors(self, tmp_path: Path) -> None:
+        use_response_cache(tmp_path)
+        try:
+            with patch("hdx.scraper.cod_ab_country.arcgis.get_client") as mock_client:
+                mock_get = mock_client.return_value.get
+                mock_get.return_value = httpx.Response(
+                    200, json={"error": {"code": 500}}
+                )
+                client_get("https://example.com", {"f": "json"})
+                client_get("https://example.com", {"f": "json"})
+                assert mock_get.call_count == 2
+        finally:
+            use_response_cache(None)
@@ -0,0 +1,74 @@
+# flake8: noqa: S101
+# ruff: noqa: D102
+"""Tests for streaming zip archives."""
+
+import zipfile
+from pathlib import Path
+from shutil import make_archive
+
+import pytest
+
+from hdx.scraper.cod_ab_country.geodata.archive import ZipSink
+
+
+class TestZipSink:
+    """Tests for ZipSink class."""
+
+    @pytest.mark.parametrize("level", [0, 6, 9])
+    def test_writes_members_in_order(self, tmp_path: Path, level: int) -> None:
+        src = tmp_path / "layer.geojson"
+        src.write_bytes(b"{}" * 100_000)
+        path = tmp_path / "out.zip"
+        with ZipSink(path, level) as sink:
+            for i in range(5):
+                sink.add_bytes(f"é{i}.csv", f"a\n{i}\n".encode())
+            sink.add_file(src, "layer.geojson")
+        with zipfile.ZipFile(path) as zf:
+            assert zf.testzip() is None
+            assert zf.namelist() == [*[f"é{i}.csv" for i in range(5)], "layer.geojson"]
+            assert zf.read("é4.csv") == b"a\n4\n"
+            assert zf.read("layer.geojson") == src.read_bytes()
+            method = zf.getinfo("layer.geojson").compress_type
+        assert method == (zipfile.ZIP_DEFLATED if level else zipfile.ZIP_STORED)
+
+    def test_adds_tree_as_make_archive_does(self, tmp_path: Path) -> None:
+        root = tmp_path / "afg.gdb"
+        (root / "afg.gdb").mkdir(parents=True)
+        (root / "afg.gdb" / "a00000001.gdbtable").write_bytes(b"table")
+        (root / "afg.gdb" / "gdb").write_bytes(b"")
+        with ZipSink(tmp_path / "sink.zip") as sink:
+            sink.add_tree(root)
+        expected = make_archive(str(tmp_path / "expected"), "zip", root)
+        with (
+            zipfile.ZipFile(tmp_path / "sink.zip") as zf,
+            zipfile.ZipFile(expected) as ef,
+        ):
+            assert zf.namelist() == ef.namelist()
+            assert zf.getinfo("afg.gdb/").is_dir()
+            assert zf.read("afg.gdb/a00000001.gdbtable") == b"table"
+
+    def test_copies_zip_members(self, tmp_path: Path) -> None:
+        sources = []
+        for level in (1, 2):
+            src = tmp_path / f"afg_admin{level}.shp.zip"
+            with zipfile.ZipFile(src, "w", zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr(f"afg_admin{level}.shp", b"shp" * 1000)
+                zf.writestr(f"afg_admin{level}.dbf", b"dbf")
+            sources.append(src)
+        with ZipSink(tmp_path / "out.zip") as sink:
+            sink.add_zip(sources[0])
+            sink.add_zip(sources[1].read_bytes())
+        with zipfile.ZipFile(tmp_path / "out.zip") as zf:
+            assert zf.testzip() is None
+            assert zf.namelist() == [
+                "afg_admin1.shp",
+                "afg_admin1.dbf",
+                "afg_admin2.shp",
+                "afg_admin2.dbf",
+            ]
+            assert zf.read("afg_admin2.shp") == b"shp" * 1000
+
+    def test_creates_nothing_when_empty(self, tmp_path: Path) -> None:
+        with ZipSink(tmp_path / "out.zip"):
+            pass
+        assert not (tmp_path / "out.zip").exists()
@@ -0,0 +1,94 @@
+# flake8: noqa: S101
+# ruff: noqa: D102, PLR2004
+"""Tests for auth module."""
+
+from pathlib import Path
+from time import time
+from unittest.mock import MagicMock, patch
+
+import httpx
+
+from hdx.scraper.cod_ab_country.arcgis import client_get
+from hdx.scraper.cod_ab_country.auth import TokenManager
+
+_HOUR = 3600
+
+
+def _generator(*tokens: str) -> MagicMock:
+    return MagicMock(side_effect=[(x, time() + 2 * _HOUR) for x in tokens])
+
+
+class TestTokenManager:
+    """Tests for TokenManager class."""
+
+    def test_reuses_token_until_close_to_expiry(self) -> None:
+        generate = MagicMock(
+            side_effect=[("a", time() + _HOUR / 2), ("b", time() + 2 * _HOUR)]
+        )
+        tokens = TokenManager(generate, "key", _HOUR)
+        assert tokens.get() == "a"
+        assert tokens.get() == "b"
+        assert tokens.get() == "b"
+        assert generate.call_count == 2
+
+    def test_reuses_cached_token_across_runs(self, tmp_path: Path) -> None:
+        path = tmp_path / "token.json"
+        generate = _generator("a")
+        assert TokenManager(generate, "key", 60, path).get() == "a"
+        assert TokenManager(generate, "key", 60, path).get() == "a"
+        generate.assert_called_once()
+        assert TokenManager(_generator("b"), "other", 60, path).get() == "b"
+
+    def test_refresh_adopts_token_renewed_elsewhere(self, tmp_path: Path) -> None:
+        path = tmp_path / "token.json"
+        first = TokenManager(_generator("a", "c"), "key", 60, path)
+        second = TokenManager(_generator("b"), "key", 60, path)
+        assert first.get() == "a"
+        assert second.get() == "a"
+        assert first.refresh("a") == "c"
+        assert second.refresh("a") == "c"
+        assert first.refresh("a") == "c"
+
+    def test_current_swaps_tokens_it_issued(self) -> None:
+        tokens = TokenManager(_generator("a", "b"), "key", 60)
+        assert tokens.get() == "a"
+        assert tokens.refresh("a") == "b"
+        assert tokens.current("a") == "b"
+        assert tokens.current("other") == "other"
+
+
+class TestClientGetReauthenticates:
+    """Tests for retrying requests after ArcGIS rejects a token."""
+
+    def test_retries_with_new_token(self) -> None:
+        rejected = httpx.Response(200, json={"error": {"code": 498}})
+        accepted = httpx.Response(200, json={"layers": []})
+        with (
+            patch("hdx.scraper.cod_ab_country.arcgis.get_client") as mock_client,
+            patch(
+                "hdx.scraper.cod_ab_country.arcgis.refresh_token", return_value="new"
+            ) as mock_refresh,
+        ):
+            mock_client.return_value.get.side_effect = [rejected, accepted]
+            response = client_get("https://example.com", {"token": "old"})
+            assert response is accepted
+            mock_refresh.assert_called_once_with("old")
+            mock_client.return_value.get.assert_called_with(
+                "https://example.com", params={"token": "new"}, headers=None
+            )
+
+    def test_later_requests_use_refreshed_token(self) -> None:
+        rejected = httpx.Response(200, json={"error": {"code": 498}})
+        accepted = httpx.Response(200, json={"layers": []})
+        tokens = TokenManager(_generator("old", "new"), "key", 60)
+        params = {"token": tokens.get()}
+        with (
+            patch("hdx.scraper.cod_ab_country.arcgis.get_client") as mock_client,
+            patch("hdx.scraper.cod_ab_country.arcgis._tokens", tokens),
+        ):
+            mock_client.return_value.get.side_effect = [rejected, accepted, accepted]
+            client_get("https://example.com/0", params, cache=False)
+            client_get("https://example.com/1", params, cache=False)
+        sent = [x.kwargs["params"] for x in mock_client.return_value.get.call_args_list]
+        assert sent == [{"token": "old"}, {"token": "new"}, {"token": "new"}]
+        assert params == {"token": "old"}
@@ -0,0 +1,112 @@
+# flake8: noqa: S101
+# ruff: noqa: D102
+"""Tests for refactoring downloaded admin boundary layers."""
+
+import json
+from datetime import date
+from pathlib import Path
+from unittest.mock import patch
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from geopandas import read_parquet
+
+from hdx.scraper.cod_ab_country.download.boundaries.process import (
+    is_admin_layer,
+    refactor,
+)
+from hdx.scraper.cod_ab_country.geodata.esrijson import write_parquet
+
+MODULE = "hdx.scraper.cod_ab_country.download.boundaries.process"
+
+
+def _field(name: str, field_type: str = "esriFieldTypeString") -> dict:
+    return {"name": name, "type": field_type}
+
+
+def _feature(pcode: str, x: float, name1: str | None = None) -> dict:
+    attributes = {
+        "OBJECTID": int(x),
+        "adm1_name": f"name {pcode}",
+        "adm1_name1": name1,
+        "adm1_pcode": pcode,
+        "adm0_name": "Afghanistan",
+        "adm0_pcode": "AF",
+        "cod_version": "V_01",
+        "valid_on": 1700000000000,
+        "valid_to": None,
+    }
+    ring = [[x, 0], [x, 1], [x + 1, 1], [x + 1, 0], [x, 0]]
+    return {"attributes": attributes, "geometry": {"rings": [ring]}}
+
+
+def _write_layer(path: Path) -> None:
+    fields = [
+        _field("OBJECTID", "esriFieldTypeOID"),
+        *[_field(x) for x in ("adm1_name", "adm1_name1", "adm1_pcode")],
+        *[_field(x) for x in ("adm0_name", "adm0_pcode", "cod_version")],
+        _field("valid_on", "esriFieldTypeDate"),
+        _field("valid_to", "esriFieldTypeDate"),
+    ]
+    page = {
+        "geometryType": "esriGeometryPolygon",
+        "spatialReference": {"wkid": 4326},
+        "fields": fields,
+        "features": [_feature("AF02", 2, "b"), _feature("AF01", 0)],
+    }
+    write_parquet(path, [page])
+
+
+class TestRefactor:
+    """Tests for refactor function."""
+
+    def test_writes_standard_geoparquet(self, tmp_path: Path) -> None:
+        path = tmp_path / "afg_admin1.parquet"
+        _write_layer(path)
+        with patch(f"{MODULE}.Country.get_iso2_from_iso3", return_value="AF"):
+            refactor(path)
+        table = pq.read_table(path)
+        assert table.column_names == [
+            *["adm1_name", "adm1_name1", "adm1_name2", "adm1_name3", "adm1_pcode"],
+            *["adm0_name", "adm0_name1", "adm0_name2", "adm0_name3", "adm0_pcode"],
+            *["lang", "lang1", "lang2", "lang3"],
+            *["iso2", "iso3", "version", "valid_on", "valid_to", "geometry", "bbox"],
+        ]
+        assert table.schema.field("adm1_name2").type == pa.string()
+        assert table.schema.field("valid_to").type == pa.date32()
+        assert table["adm1_pcode"].to_pylist() == ["AF01", "AF02"]
+        assert table["version"].to_pylist() == ["v01", "v01"]
+        assert table["iso2"].to_pylist() == ["AF", "AF"]
+        assert table["valid_on"].to_pylist() == [date(2023, 11, 14)] * 2
+        assert table["bbox"].to_pylist()[1] == {
+            "xmin": 2.0,
+            "ymin": 0.0,
+            "xmax": 3.0,
+            "ymax": 1.0,
+        }
+        geo = json.loads(table.schema.metadata[b"geo"])
+        assert geo["version"] == "1.1.0"
+        assert geo["columns"]["geometry"]["covering"]["bbox"]["xmin"] == [
+            "bbox",
+            "xmin",
+        ]
+        gdf = read_parquet(path, bbox=(2.5, 0.5, 2.6, 0.6))
+        assert gdf["adm1_pcode"].tolist() == ["AF02"]
+        assert gdf.crs == "EPSG:4326"
+        assert not list(tmp_path.glob("*_tmp*"))
+
+    def test_rejects_missing_columns(self, tmp_path: Path) -> None:
+        path = tmp_path / "afg_admin2.parquet"
+        _write_layer(path)
+        with pytest.raises(ValueError, match="adm2_pcode"):
+            refactor(path)
+
+
+class TestIsAdminLayer:
+    """Tests for is_admin_layer function."""
+
+    def test_matches_admin_boundaries_only(self) -> None:
+        assert is_admin_layer("afg_admin1")
+        assert not is_admin_layer("afg_admin1_em")
+        assert not is_admin_layer("afg_adminlines")
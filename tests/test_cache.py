@@ -0,0 +1,58 @@
+# flake8: noqa: S101
+# ruff: noqa: D102
+"""Tests for cache module."""
+
+from os import utime
+from pathlib import Path
+from unittest.mock import patch
+
+from hdx.scraper.cod_ab_country.cache import FileCache
+
+
+class TestFileCache:
+    """Tests for FileCache class."""
+
+    def test_stores_and_returns_entries(self, tmp_path: Path) -> None:
+        cache = FileCache(tmp_path, 1024)
+        assert cache.get("a") is None
+        cache.put("a", b"data")
+        assert cache.get("a") == b"data"
+        assert FileCache(tmp_path, 1024).get("a") == b"data"
+
+    def test_evicts_least_recently_used(self, tmp_path: Path) -> None:
+        cache = FileCache(tmp_path, 10)
+        cache.put("a", b"aaaa")
+        cache.put("b", b"bbbb")
+        utime(cache.path("a"), (0, 0))
+        utime(cache.path("b"), (1, 1))
+        cache.get("a")
+        cache.put("c", b"cccc")
+        assert cache.get("a") == b"aaaa"
+        assert cache.get("b") is None
+        assert cache.get("c") == b"cccc"
+
+    def test_copies_files_in_and_out(self, tmp_path: Path) -> None:
+        cache = FileCache(tmp_path / "cache", 10)
+        src = tmp_path / "src.zip"
+        src.write_bytes(b"zipped")
+        dst = tmp_path / "dst.zip"
+        assert not cache.get_file("a", dst)
+        assert not dst.exists()
+        cache.put_file("a", src)
+        assert cache.get_file("a", dst)
+        assert dst.read_bytes() == b"zipped"
+        cache.put_file("b", src)
+        assert not cache.get_file("a", dst)
+        assert not list(tmp_path.glob(".*.tmp"))
+
+    def test_counts_only_growth_when_replacing(self, tmp_path: Path) -> None:
+        cache = FileCache(tmp_path, 10)
+        src = tmp_path / "src"
+        src.write_bytes(b"aaaa")
+        with patch.object(cache, "evict") as evict:
+            for _ in range(5):
+                cache.put("a", b"aaaa")
+                cache.put_file("b", src)
+            evict.assert_not_called()
+            cache.put("a", b"aaaaaaa")
+            evict.assert_called_once()
@@ -0,0 +1,109 @@
+# flake8: noqa: S101
+# ruff: noqa: D102
+"""Tests for changes module."""
+
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+
+from hdx.scraper.cod_ab_country.arcgis import use_response_cache
+from hdx.scraper.cod_ab_country.changes import find_changed_countries
+
+ARCGIS = "hdx.scraper.cod_ab_country.arcgis"
+_RECENT = datetime.now(UTC) - timedelta(hours=1)
+_OLD = datetime.now(UTC) - timedelta(days=30)
+
+
+def _metadata_xml(dt: datetime) -> str:
+    return (
+        f"<metadata><Esri><ModDate>{dt:%Y%m%d}</ModDate>"
+        f"<ModTime>{dt:%H%M%S}00</ModTime></Esri></metadata>"
+    )
+
+
+def _edit_info(dt: datetime) -> dict:
+    return {"lastEditDate": int(dt.timestamp() * 1000)}
+
+
+def _handler(request: httpx.Request) -> httpx.Response:  # noqa: C901, PLR0911
+    path = request.url.path
+    if "cod_ab_err" in path:
+        return httpx.Response(500)
+    if "cod_ab_expired" in path:
+        return httpx.Response(200, json={"error": {"code": 498}})
+    if "cod_ab_denied" in path and path.endswith("/0"):
+        return httpx.Response(200, json={"error": {"code": 403}})
+    if path.endswith("/FeatureServer"):
+        return httpx.Response(
+            200,
+            json={
+                "layers": [
+                    {"id": 0, "type": "Feature Layer"},
+                    {"id": 1, "type": "Feature Layer"},
+                ]
+            },
+        )
+    if path.endswith(("/0", "/1")):
+        if "cod_ab_edit" in path and path.endswith("/1"):
+            return httpx.Response(200, json={"editingInfo": _edit_info(_RECENT)})
+        if "cod_ab_stale" in path:
+            return httpx.Response(200, json={"editingInfo": _edit_info(_OLD)})
+        return httpx.Response(200, json={"name": "layer"})
+    if "cod_ab_stale" in path:
+        return httpx.Response(200, text=_metadata_xml(_RECENT))
+    if "cod_ab_new" in path and path.endswith("/1/metadata"):
+        return httpx.Response(200, text=_metadata_xml(_RECENT))
+    if "cod_ab_bad" in path and path.endswith("/0/metadata"):
+        return httpx.Response(200, text="<not xml")
+    if "cod_ab_bad" in path and path.endswith("/info/metadata"):
+        return httpx.Response(200, text=_metadata_xml(_RECENT))
+    return httpx.Response(200, text=_metadata_xml(_OLD))
+
+
+class TestFindChangedCountries:
+    """Tests for find_changed_countries function."""
+
+    def test_returns_recently_modified_countries(self) -> None:
+        client = httpx.Client(transport=httpx.MockTransport(_handler))
+        with (
+            patch(f"{ARCGIS}.get_client", return_value=client),
+            patch(f"{ARCGIS}.refresh_token", return_value="fresh") as refresh,
+            patch("hdx.scraper.cod_ab_country.retry.sleep"),
+        ):
+            result = find_changed_countries(
+                [
+                    ("NEW", "v1"),
+                    ("OLD", "v1"),
+                    ("BAD", "v1"),
+                    ("ERR", "v1"),
+                    ("EDIT", "v1"),
+                    ("STALE", "v1"),
+                    ("EXPIRED", "v1"),
+                    ("DENIED", "v1"),
+                ],
+                "token",
+                2,
+            )
+        assert result == {"NEW", "BAD", "ERR", "EDIT", "EXPIRED", "DENIED"}
+        refresh.assert_called_with("token")
+
+    def test_ignores_response_cache(self, tmp_path: Path) -> None:
+        edited = [_OLD]
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path.endswith("/FeatureServer"):
+                service = {"layers": [], "editingInfo": _edit_info(edited[0])}
+                return httpx.Response(200, json=service)
+            return httpx.Response(404)
+
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        use_response_cache(tmp_path)
+        try:
+            with patch(f"{ARCGIS}.get_client", return_value=client):
+                assert find_changed_countries([("AFG", "v1")], "token", 1) == set()
+                edited[0] = _RECENT
+                assert find_changed_countries([("AFG", "v1")], "token", 1) == {"AFG"}
+        finally:
+            use_response_cache(None)
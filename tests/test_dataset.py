@@ -0,0 +1,61 @@
+# flake8: noqa: S101
+# ruff: noqa: D102, SLF001
+"""Tests for dataset module."""
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from hdx.scraper.cod_ab_country import metrics
+from hdx.scraper.cod_ab_country.dataset import _LookupCache
+
+
+class TestLookupCache:
+    """Tests for _LookupCache class."""
+
+    def test_fetches_once_within_ttl(self) -> None:
+        cache = _LookupCache(ttl=60)
+        fetch = MagicMock(return_value=[{"name": "ocha-fiss"}])
+        metrics.reset()
+        with metrics.stage("upload", "CAF"):
+            assert cache.get("organization:x", fetch) == [{"name": "ocha-fiss"}]
+            assert cache.get("organization:x", fetch) == [{"name": "ocha-fiss"}]
+        fetch.assert_called_once()
+        assert metrics.get_counts() == {
+            "lookup_cache_hits": 1,
+            "lookup_cache_misses": 1,
+        }
+
+    def test_refetches_after_ttl(self) -> None:
+        cache = _LookupCache(ttl=60)
+        fetch = MagicMock(return_value="Central African Republic")
+        with patch("hdx.scraper.cod_ab_country.dataset.time", return_value=0):
+            cache.get("country:CAF", fetch)
+        with patch("hdx.scraper.cod_ab_country.dataset.time", return_value=61):
+            cache.get("country:CAF", fetch)
+        assert fetch.call_count == 2  # noqa: PLR2004
+
+    def test_persists_between_runs(self, tmp_path: Path) -> None:
+        path = tmp_path / "lookup_cache.json"
+        cache = _LookupCache(ttl=60)
+        cache.get("country:CAF", lambda: "Central African Republic")
+        cache.save(path)
+        restored = _LookupCache(ttl=60)
+        restored.load(path)
+        fetch = MagicMock()
+        assert restored.get("country:CAF", fetch) == "Central African Republic"
+        fetch.assert_not_called()
+
+    def test_load_skips_expired_entries(self, tmp_path: Path) -> None:
+        path = tmp_path / "lookup_cache.json"
+        cache = _LookupCache(ttl=60)
+        with patch("hdx.scraper.cod_ab_country.dataset.time", return_value=0):
+            cache.get("country:CAF", lambda: "Central African Republic")
+        cache.save(path)
+        restored = _LookupCache(ttl=60)
+        restored.load(path)
+        assert restored._entries == {}
+
+    def test_load_ignores_missing_file(self, tmp_path: Path) -> None:
+        cache = _LookupCache(ttl=60)
+        cache.load(tmp_path / "missing.json")
+        assert cache._entries == {}
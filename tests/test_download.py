@@ -0,0 +1,147 @@
+# flake8: noqa: S101
+# ruff: noqa: D102
+"""Tests for boundary downloads."""
+
+from collections.abc import Iterator
+from pathlib import Path
+from subprocess import CalledProcessError
+from unittest.mock import MagicMock, patch
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from hdx.scraper.cod_ab_country.download.boundaries import download_boundaries
+from hdx.scraper.cod_ab_country.download.boundaries.download import (
+    _download_stream,
+    download_feature,
+    use_layer_cache,
+)
+from hdx.scraper.cod_ab_country.download.boundaries.incremental import LayerStore
+
+MODULE = "hdx.scraper.cod_ab_country.download.boundaries"
+LAYER_URL = "https://example.com/arcgis/rest/services/cod_ab_afg_v01/FeatureServer/1"
+
+
+def _client_get(url: str, _: dict) -> MagicMock:
+    if url.endswith("FeatureServer"):
+        service = {
+            "layers": [
+                {"id": 0, "type": "Feature Layer"},
+                {"id": 1, "type": "Feature Layer"},
+            ],
+            "tables": [{"id": 2}],
+        }
+        return MagicMock(json=lambda: service)
+    layer_id = url.rsplit("/", 1)[1]
+    return MagicMock(json=lambda: {"name": f"afg_adm{layer_id}"})
+
+
+class TestDownloadBoundaries:
+    """Tests for download_boundaries function."""
+
+    def test_downloads_layers_and_tables(self, tmp_path: Path) -> None:
+        with (
+            patch(f"{MODULE}.client_get", side_effect=_client_get),
+            patch(f"{MODULE}.download_feature") as mock_download,
+        ):
+            download_boundaries(tmp_path, "token", "AFG", "v1", force=True)
+        dirs = {(x.args[0], x.args[3]["name"]) for x in mock_download.call_args_list}
+        assert dirs == {
+            (tmp_path, "afg_adm0"),
+            (tmp_path, "afg_adm1"),
+            (tmp_path / "tables", "afg_adm2"),
+        }
+
+    def test_reports_failed_layers_after_others_finish(self, tmp_path: Path) -> None:
+        def download_feature(_: Path, url: str, *__: object) -> None:
+            if url.endswith("/1"):
+                msg = "boom"
+                raise ValueError(msg)
+
+        with (
+            patch(f"{MODULE}.client_get", side_effect=_client_get),
+            patch(
+                f"{MODULE}.download_feature", side_effect=download_feature
+            ) as mock_download,
+            pytest.raises(RuntimeError, match="afg_adm1"),
+        ):
+            download_boundaries(tmp_path, "token", "AFG", "v1", force=True)
+        assert mock_download.call_count == 3  # noqa: PLR2004
+
+
+class TestLayerCache:
+    """Tests for reusing cached layers in download_feature."""
+
+    @pytest.fixture(autouse=True)
+    def layer_cache(self, tmp_path: Path) -> Iterator[None]:
+        use_layer_cache(tmp_path / "layer_cache")
+        yield
+        use_layer_cache(None)
+
+    @staticmethod
+    def _download(data_dir: Path, edited: int) -> MagicMock:
+        response = {
+            "name": "afg_adm1",
+            "editingInfo": {"lastEditDate": edited},
+            "fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}],
+        }
+
+        def download_pages(output_file: Path, *_: object, **__: object) -> bool:
+            output_file.write_bytes(f"edit {edited}".encode())
+            return True
+
+        data_dir.mkdir(exist_ok=True)
+        with patch(
+            f"{MODULE}.download.download_pages", side_effect=download_pages
+        ) as mock_pages:
+            download_feature(data_dir, LAYER_URL, {}, response)
+        return mock_pages
+
+    def test_reuses_layer_until_edited(self, tmp_path: Path) -> None:
+        assert self._download(tmp_path / "a", 1).called
+        assert not self._download(tmp_path / "b", 1).called
+        assert (tmp_path / "b" / "afg_adm1.parquet").read_bytes() == b"edit 1"
+        assert self._download(tmp_path / "c", 2).called
+        assert (tmp_path / "c" / "afg_adm1.parquet").read_bytes() == b"edit 2"
+
+
+class TestObjectId:
+    """Tests for where download_feature keeps the OBJECTID column."""
+
+    def test_keeps_objectid_only_in_layer_store(self, tmp_path: Path) -> None:
+        response = {
+            "name": "afg_codes",
+            "fields": [
+                {"name": "OBJECTID", "type": "esriFieldTypeOID"},
+                {"name": "code", "type": "esriFieldTypeString"},
+            ],
+        }
+        store = LayerStore(tmp_path / "layers")
+
+        def download_pages(output_file: Path, *_: object, keep_oid: bool) -> bool:
+            table = pa.table({"OBJECTID": [1], "code": ["a"]})
+            pq.write_table(
+                table if keep_oid else table.drop_columns("OBJECTID"), output_file
+            )
+            return True
+
+        with patch(f"{MODULE}.download.download_pages", side_effect=download_pages):
+            download_feature(tmp_path, LAYER_URL, {}, response, store)
+        assert pq.read_schema(tmp_path / "afg_codes.parquet").names == ["code"]
+        stored_path, _ = store.load(LAYER_URL)
+        assert pq.read_schema(stored_path).names == ["OBJECTID", "code"]
+
+
+class TestDownloadStream:
+    """Tests for _download_stream function."""
+
+    def test_retries_failed_ogr2ogr(self, tmp_path: Path) -> None:
+        with (
+            patch(f"{MODULE}.download.run") as mock_run,
+            patch("hdx.scraper.cod_ab_country.retry.sleep"),
+        ):
+            mock_run.side_effect = [CalledProcessError(1, "ogr2ogr"), None]
+            _download_stream(tmp_path / "a.parquet", LAYER_URL, {}, "OBJECTID", "*")
+        assert mock_run.call_count == 2  # noqa: PLR2004
+        assert mock_run.call_args.kwargs == {"check": True}
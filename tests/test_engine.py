@@ -0,0 +1,105 @@
+# flake8: noqa: S101
+# ruff: noqa: D102
+"""Tests for in-process GDAL conversion."""
+
+from io import BytesIO
+from pathlib import Path
+
+import pyogrio
+import pytest
+import shapely
+from geopandas import read_parquet
+
+from hdx.scraper.cod_ab_country.geodata.engine import (
+    _geometry_type,
+    list_layers,
+    read_layer,
+    to_bytes,
+    to_geojson,
+    write_layer,
+)
+from hdx.scraper.cod_ab_country.geodata.esrijson import write_parquet
+
+FIXTURES = Path(__file__).parent / "fixtures" / "caf"
+
+
+def _write_source(path: Path, ids: list[int]) -> None:
+    square = [[0, 0], [0, 1], [1, 1], [1, 0], [0, 0]]
+    page = {
+        "geometryType": "esriGeometryPolygon",
+        "spatialReference": {"wkid": 4326},
+        "fields": [
+            {"name": "OBJECTID", "type": "esriFieldTypeOID"},
+            {"name": "adm1_name", "type": "esriFieldTypeString"},
+        ],
+        "features": [
+            {
+                "attributes": {"OBJECTID": x, "adm1_name": f"é{x}"},
+                "geometry": {"rings": [square]},
+            }
+            for x in ids
+        ],
+    }
+    write_parquet(path, [page], keep_oid=True)
+
+
+class TestGeometryType:
+    """Tests for _geometry_type function."""
+
+    def test_promotes_mixed_single_and_multi(self) -> None:
+        assert _geometry_type(["Polygon"]) == "Polygon"
+        assert _geometry_type(["MultiPolygon", "Polygon"]) == "MultiPolygon"
+        assert _geometry_type(["LineString Z"]) == "LineString Z"
+        assert _geometry_type(["Point", "Polygon"]) == "Unknown"
+        assert _geometry_type([]) == "Unknown"
+
+
+class TestReadLayer:
+    """Tests for read_layer function."""
+
+    @pytest.mark.parametrize(
+        "src", sorted(FIXTURES.glob("*.parquet")), ids=lambda x: x.stem
+    )
+    def test_writes_native_geoarrow_fixtures(self, src: Path) -> None:
+        data = to_bytes(read_layer(src), ".geojson", src.stem, [])
+        written = pyogrio.read_dataframe(BytesIO(data))
+        expected = read_parquet(src)
+        assert written.crs == expected.crs
+        assert shapely.equals_exact(
+            shapely.normalize(written.geometry.to_numpy()),
+            shapely.normalize(expected.geometry.to_numpy()),
+            1e-9,
+        ).all()
+
+
+class TestWriteLayer:
+    """Tests for write_layer function."""
+
+    @pytest.mark.parametrize(
+        ("name", "options"),
+        [
+            ("out.gdb", ["--lco=TARGET_ARCGIS_VERSION=ARCGIS_PRO_3_2_OR_LATER"]),
+            ("out.shp.zip", ["--lco=ENCODING=UTF-8"]),
+            ("out.xlsx", []),
+        ],
+    )
+    def test_appends_layers(self, tmp_path: Path, name: str, options: list) -> None:
+        dst = tmp_path / name
+        for stem, ids in (("afg_admin1", [1, 2]), ("afg_admin2", [1, 2, 3])):
+            src = tmp_path / f"{stem}.parquet"
+            _write_source(src, ids)
+            write_layer(src, dst, stem, options, append=dst.exists())
+        assert list_layers(dst) == ["afg_admin1", "afg_admin2"]
+        df = pyogrio.read_dataframe(dst, layer="afg_admin2")
+        assert df["adm1_name"].tolist() == ["é1", "é2", "é3"]
+
+    def test_round_trips_through_geojson(self, tmp_path: Path) -> None:
+        src = tmp_path / "afg_admin1.parquet"
+        _write_source(src, [1])
+        dst = tmp_path / "out.gdb"
+        write_layer(src, dst, "afg_admin1", [], append=False)
+        geojson = tmp_path / "afg_admin1.geojson"
+        to_geojson(dst, "afg_admin1", geojson)
+        df = pyogrio.read_dataframe(geojson)
+        assert df.crs == "EPSG:4326"
+        assert df.geometry[0].area == 1
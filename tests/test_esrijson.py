@@ -0,0 +1,97 @@
+# flake8: noqa: S101
+# ruff: noqa: D102, PLR2004
+"""Tests for ESRIJSON to Arrow conversion."""
+
+import json
+from datetime import UTC, date, datetime
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from geopandas import read_parquet
+
+from hdx.scraper.cod_ab_country.geodata.esrijson import (
+    read_pages,
+    read_table,
+    write_parquet,
+)
+
+FIELDS = [
+    {"name": "OBJECTID", "type": "esriFieldTypeOID"},
+    {"name": "adm1_name", "type": "esriFieldTypeString"},
+    {"name": "valid_on", "type": "esriFieldTypeDate"},
+]
+SQUARE = [[0, 0], [0, 4], [4, 4], [4, 0], [0, 0]]
+HOLE = [[1, 1], [2, 1], [2, 2], [1, 2], [1, 1]]
+OTHER = [[10, 10], [10, 11], [11, 11], [11, 10], [10, 10]]
+
+
+def _page(features: list[dict], geometry_type: str | None = None) -> dict:
+    page = {"fields": FIELDS, "features": features}
+    if geometry_type:
+        page["geometryType"] = geometry_type
+        page["spatialReference"] = {"wkid": 4326, "latestWkid": 4326}
+    return page
+
+
+def _feature(oid: int, geometry: dict | None = None) -> dict:
+    attributes = {"OBJECTID": oid, "adm1_name": f"a{oid}", "valid_on": 1700000000000}
+    return {"attributes": attributes, "geometry": geometry}
+
+
+class TestWriteParquet:
+    """Tests for write_parquet function."""
+
+    def test_writes_geoparquet_one_row_group_per_page(self, tmp_path: Path) -> None:
+        pages = [
+            _page(
+                [_feature(1, {"rings": [SQUARE, HOLE]}), _feature(2)],
+                "esriGeometryPolygon",
+            ),
+            _page([_feature(3, {"rings": [SQUARE, OTHER]})], "esriGeometryPolygon"),
+        ]
+        output_file = tmp_path / "afg_adm1.parquet"
+        assert write_parquet(output_file, pages, keep_oid=True) == 3
+        assert pq.read_metadata(output_file).num_row_groups == 2
+        gdf = read_parquet(output_file)
+        assert gdf.crs == "EPSG:4326"
+        assert gdf["OBJECTID"].tolist() == [1, 2, 3]
+        assert gdf["valid_on"].tolist() == [date(2023, 11, 14)] * 3
+        assert gdf.geometry[0].area == 15
+        assert gdf.geometry[1] is None
+        assert gdf.geometry[2].geom_type == "MultiPolygon"
+        geo = json.loads(pq.read_schema(output_file).metadata[b"geo"])
+        column = geo["columns"]["geometry"]
+        assert column["geometry_types"] == ["MultiPolygon", "Polygon"]
+        assert column["bbox"] == [0.0, 0.0, 11.0, 11.0]
+
+    def test_drops_oid_field(self, tmp_path: Path) -> None:
+        output_file = tmp_path / "afg_codes.parquet"
+        write_parquet(output_file, [_page([_feature(1)])])
+        assert pq.read_schema(output_file).names == ["adm1_name", "valid_on"]
+
+    def test_reads_pages_from_files(self, tmp_path: Path) -> None:
+        paths = []
+        for i in range(2):
+            path = tmp_path / f"{i:05d}.json"
+            page = _page([_feature(i, {"x": i, "y": i})], "esriGeometryPoint")
+            path.write_text(json.dumps(page))
+            paths.append(path)
+        output_file = tmp_path / "afg_adminpoints.parquet"
+        write_parquet(output_file, read_pages(paths))
+        assert read_parquet(output_file).geometry.x.tolist() == [0, 1]
+
+
+class TestReadTable:
+    """Tests for read_table function."""
+
+    def test_reads_tables_with_timestamps(self) -> None:
+        table = read_table(
+            [_page([_feature(1)]), _page([_feature(2)])], pa.timestamp("ms", tz="UTC")
+        )
+        assert table.column_names == ["OBJECTID", "adm1_name", "valid_on"]
+        assert table.schema.field("OBJECTID").type == pa.int32()
+        assert (
+            table["valid_on"].to_pylist()
+            == [datetime(2023, 11, 14, 22, 13, 20, tzinfo=UTC)] * 2
+        )
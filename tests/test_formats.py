@@ -2,16 +2,58 @@
 # ruff: noqa: D102
 """Tests for formats module."""
 
+import zipfile
+from collections.abc import Iterator
 from pathlib import Path
+from threading import Lock
 from unittest.mock import patch
 
+import pandas as pd
+import pyogrio
+import pytest
+
+from hdx.scraper.cod_ab_country.geodata import engine
+from hdx.scraper.cod_ab_country.geodata.esrijson import write_parquet
 from hdx.scraper.cod_ab_country.geodata.formats import (
     _get_dst_dataset,
     _get_layer_create_options,
     _to_multilayer,
+    main,
+    use_format_cache,
 )
 
 
+def _write_sources(iso3_dir: Path) -> None:
+    square = [[0, 0], [0, 1], [1, 1], [1, 0], [0, 0]]
+    for level in range(2):
+        page = {
+            "geometryType": "esriGeometryPolygon",
+            "spatialReference": {"wkid": 4326},
+            "fields": [
+                {"name": "OBJECTID", "type": "esriFieldTypeOID"},
+                {"name": "name", "type": "esriFieldTypeString"},
+            ],
+            "features": [
+                {
+                    "attributes": {"OBJECTID": 1, "name": "a"},
+                    "geometry": {"rings": [square]},
+                }
+            ],
+        }
+        write_parquet(iso3_dir / f"afg_admin{level}.parquet", [page])
+    (iso3_dir / "tables").mkdir()
+    pd.DataFrame({"a": [1]}).to_parquet(iso3_dir / "tables" / "afg_codes.parquet")
+
+
+@pytest.fixture(autouse=True)
+def subprocess_engine() -> Iterator[None]:
+    """Convert with GDAL subprocesses, which these tests mock."""
+    with patch(
+        "hdx.scraper.cod_ab_country.geodata.engine.CONVERT_ENGINE", "subprocess"
+    ):
+        yield
+
+
 class TestGetLayerCreateOptions:
     """Tests for _get_layer_create_options function."""
 
@@ -144,3 +186,141 @@ class TestToMultilayer:
             mock_run.assert_called_once()
             call_args = mock_run.call_args[0][0]
             assert "--lco=ENCODING=UTF-8" in call_args
+
+
+class TestMain:
+    """Tests for main function."""
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_builds_every_format(self, tmp_path: Path, workers: int) -> None:
+        for name in ("afg_admin0", "afg_admin1", "afg_admin2"):
+            (tmp_path / f"{name}.parquet").touch()
+        (tmp_path / "tables").mkdir()
+        pd.DataFrame({"a": [1]}).to_parquet(tmp_path / "tables" / "afg_codes.parquet")
+        calls = []
+        lock = Lock()
+
+        def run(args: list, **_: object) -> None:
+            dst = Path(args[4])
+            with lock:
+                calls.append((dst.name, Path(args[3]).stem))
+            if dst.suffix == ".zip":
+                with zipfile.ZipFile(dst, "a") as zf:
+                    zf.writestr(Path(args[3]).stem, "")
+            else:
+                dst.touch()
+
+        with patch("hdx.scraper.cod_ab_country.geodata.formats.run", side_effect=run):
+            main(tmp_path, "AFG", workers)
+        gdb_layers = [x[1] for x in calls if x[0] == "afg_admin_boundaries.gdb"]
+        assert gdb_layers == ["afg_admin0", "afg_admin1", "afg_admin2", "afg_codes"]
+        outputs = {x.name for x in tmp_path.iterdir() if x.is_file()}
+        assert outputs >= {
+            "afg_admin_boundaries.gdb.zip",
+            "afg_admin_boundaries.shp.zip",
+            "afg_admin_boundaries.geojson.zip",
+            "afg_admin_boundaries.xlsx",
+        }
+        with zipfile.ZipFile(tmp_path / "afg_admin_boundaries.geojson.zip") as zf:
+            assert set(zf.namelist()) == {
+                "afg_admin0.geojson",
+                "afg_admin1.geojson",
+                "afg_admin2.geojson",
+                "afg_codes.csv",
+            }
+        with zipfile.ZipFile(tmp_path / "afg_admin_boundaries.shp.zip") as zf:
+            assert zf.namelist()[-1] == "afg_codes.csv"
+
+    @pytest.mark.parametrize("workers", [1, 4])
+    def test_decodes_each_source_once_in_process(
+        self, tmp_path: Path, workers: int
+    ) -> None:
+        _write_sources(tmp_path)
+
+        with (
+            patch(f"{engine.__name__}.CONVERT_ENGINE", "pyogrio"),
+            patch(f"{engine.__name__}.read_layer", wraps=engine.read_layer) as read,
+        ):
+            main(tmp_path, "AFG", workers)
+        assert sorted(x.args[0].name for x in read.call_args_list) == [
+            "afg_admin0.parquet",
+            "afg_admin1.parquet",
+            "afg_codes.parquet",
+        ]
+        assert pyogrio.list_layers(tmp_path / "afg_admin_boundaries.xlsx")[
+            :, 0
+        ].tolist() == [
+            "afg_admin0",
+            "afg_admin1",
+            "afg_codes",
+        ]
+        for ext in ("gdb.zip", "shp.zip"):
+            layers = pyogrio.list_layers(tmp_path / f"afg_admin_boundaries.{ext}")
+            assert {"afg_admin0", "afg_admin1"} <= set(layers[:, 0])
+        with zipfile.ZipFile(tmp_path / "afg_admin_boundaries.shp.zip") as zf:
+            assert zf.read("afg_codes.csv") == b"a\n1\n"
+        with zipfile.ZipFile(tmp_path / "afg_admin_boundaries.geojson.zip") as zf:
+            assert zf.read("afg_codes.csv") == b"a\n1\n"
+
+    def test_converting_again_replaces_partial_outputs(self, tmp_path: Path) -> None:
+        _write_sources(tmp_path)
+        outputs = [
+            tmp_path / f"afg_admin_boundaries.{ext}" for ext in ("xlsx", "gdb.zip")
+        ]
+
+        def counts() -> list[int]:
+            return [
+                pyogrio.read_info(path, layer="afg_admin1")["features"]
+                for path in outputs
+            ]
+
+        with patch(f"{engine.__name__}.CONVERT_ENGINE", "pyogrio"):
+            main(tmp_path, "AFG")
+            expected = counts()
+            (tmp_path / "afg_admin_boundaries.gdb.zip").unlink()
+            (tmp_path / "afg_admin_boundaries.gdb").mkdir()
+            engine.write_layer(
+                tmp_path / "afg_admin1.parquet",
+                tmp_path / "afg_admin_boundaries.gdb" / "afg_admin_boundaries.gdb",
+                "afg_admin1",
+                [],
+                append=False,
+            )
+            main(tmp_path, "AFG")
+        assert counts() == expected
+
+
+class TestFormatCache:
+    """Tests for reusing outputs from the format cache."""
+
+    @pytest.fixture(autouse=True)
+    def format_cache(self, tmp_path: Path) -> Iterator[None]:
+        use_format_cache(tmp_path / "cache")
+        with patch(f"{engine.__name__}.CONVERT_ENGINE", "pyogrio"):
+            yield
+        use_format_cache(None)
+
+    def test_reuses_outputs_for_same_sources(self, tmp_path: Path) -> None:
+        iso3_dir = tmp_path / "afg"
+        iso3_dir.mkdir()
+        _write_sources(iso3_dir)
+        main(iso3_dir, "AFG")
+        outputs = {x.name: x.read_bytes() for x in iso3_dir.glob("afg_admin_*")}
+        assert sorted(outputs) == [
+            "afg_admin_boundaries.gdb.zip",
+            "afg_admin_boundaries.geojson.zip",
+            "afg_admin_boundaries.shp.zip",
+            "afg_admin_boundaries.xlsx",
+        ]
+        for name in outputs:
+            (iso3_dir / name).unlink()
+
+        with patch(f"{engine.__name__}.read_layer") as read:
+            main(iso3_dir, "AFG")
+        read.assert_not_called()
+        assert {x: (iso3_dir / x).read_bytes() for x in outputs} == outputs
+
+        pd.DataFrame({"a": [2]}).to_parquet(iso3_dir / "tables" / "afg_codes.parquet")
+        main(iso3_dir, "AFG")
+        with zipfile.ZipFile(iso3_dir / "afg_admin_boundaries.shp.zip") as zf:
+            assert zf.read("afg_codes.csv") == b"a\n2\n"
@@ -2,9 +2,12 @@
 # ruff: noqa: D102
 """Tests for geodata_compare module."""
 
+from collections.abc import Iterator
 from pathlib import Path
 from unittest.mock import MagicMock, patch
 
+import pytest
+
 from hdx.scraper.cod_ab_country.geodata.compare import (
     _convert_geodata,
     _download_geodata_from_hdx,
@@ -13,6 +16,15 @@ from hdx.scraper.cod_ab_country.geodata.compare import (
 )
 
 
+@pytest.fixture(autouse=True)
+def subprocess_engine() -> Iterator[None]:
+    """Convert with GDAL subprocesses, which these tests mock."""
+    with patch(
+        "hdx.scraper.cod_ab_country.geodata.engine.CONVERT_ENGINE", "subprocess"
+    ):
+        yield
+
+
 class TestDownloadGdbFromHdx:
     """Tests for _download_gdb_from_hdx function."""
 
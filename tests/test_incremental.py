@@ -0,0 +1,129 @@
+# flake8: noqa: S101
+# ruff: noqa: D102, PLR2004
+"""Tests for incremental layer downloads."""
+
+from pathlib import Path
+from unittest.mock import patch
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from hdx.scraper.cod_ab_country.download.boundaries.incremental import (
+    LayerStore,
+    _merge,
+    download_delta,
+    where_clauses,
+)
+
+MODULE = "hdx.scraper.cod_ab_country.download.boundaries.incremental"
+SYNCED = 1_700_000_000_000
+URL = "https://example.com/arcgis/rest/services/cod_ab_afg_v01/FeatureServer/1"
+RESPONSE = {
+    "name": "afg_adm1",
+    "editFieldsInfo": {"editDateField": "EditDate"},
+    "fields": [
+        {"name": "OBJECTID", "type": "esriFieldTypeOID"},
+        {"name": "name", "type": "esriFieldTypeString"},
+    ],
+}
+
+
+def _table(ids: list[int], names: list[str]) -> pa.Table:
+    return pa.table({"OBJECTID": pa.array(ids, pa.int64()), "name": names})
+
+
+def _store(tmp_path: Path, table: pa.Table, response: dict = RESPONSE) -> LayerStore:
+    source = tmp_path / "source.parquet"
+    pq.write_table(table, source)
+    store = LayerStore(tmp_path / "layers")
+    store.save(URL, source, response, SYNCED)
+    return store
+
+
+class TestMerge:
+    """Tests for _merge function."""
+
+    def test_replaces_and_drops_features(self) -> None:
+        stored = _table([1, 2, 3], ["a", "b", "c"])
+        delta = _table([2, 4], ["B", "d"])
+        merged = _merge(stored, delta, "OBJECTID", [2, 3, 4])
+        assert merged.to_pydict() == {"OBJECTID": [1, 2, 4], "name": ["a", "B", "d"]}
+
+
+class TestWhereClauses:
+    """Tests for where_clauses function."""
+
+    def test_selects_runs_as_ranges(self) -> None:
+        assert where_clauses("OID", [1, 2, 3, 4, 7, 9, 10], 1000) == [
+            "OID IN (7,9,10) OR (OID >= 1 AND OID <= 4)"
+        ]
+
+    def test_limits_features_per_clause(self) -> None:
+        assert where_clauses("OID", list(range(1, 6)), 2) == [
+            "OID IN (1,2)",
+            "OID IN (3,4)",
+            "OID IN (5)",
+        ]
+
+    def test_keeps_scattered_ids_short(self) -> None:
+        clauses = where_clauses("OBJECTID", list(range(1, 2000, 2)), 1000)
+        assert len(clauses) == 10
+        assert all(len(x) < 1000 for x in clauses)
+        ids = [int(y) for x in clauses for y in x[13:-1].split(",")]
+        assert ids == list(range(1, 2000, 2))
+
+
+class TestDownloadDelta:
+    """Tests for download_delta function."""
+
+    def test_merges_edited_new_and_deleted_features(self, tmp_path: Path) -> None:
+        store = _store(tmp_path, _table([1, 2, 3], ["a", "b", "c"]))
+        output_file = tmp_path / "afg_adm1.parquet"
+
+        def get_object_ids(_url: str, _params: dict, where: str = "1=1") -> list:
+            return [1, 2, 4] if where == "1=1" else [2]
+
+        def download_where(path: Path, *args: object, keep_oid: bool) -> None:
+            assert args[-1] == ["OBJECTID IN (2,4)"]
+            assert keep_oid
+            pq.write_table(_table([2, 4], ["B", "d"]), path)
+
+        with (
+            patch(f"{MODULE}.get_object_ids", side_effect=get_object_ids) as mock_ids,
+            patch(f"{MODULE}.download_where", side_effect=download_where),
+        ):
+            result = download_delta(
+                store, output_file, URL, {}, RESPONSE, "OBJECTID", "*"
+            )
+        assert result
+        assert "EditDate > TIMESTAMP '2023-11-14 " in mock_ids.call_args.args[2]
+        expected = {"OBJECTID": [1, 2, 4], "name": ["a", "B", "d"]}
+        assert pq.read_table(output_file).to_pydict() == expected
+        stored_path, meta = store.load(URL)
+        assert pq.read_table(stored_path).to_pydict() == expected
+        assert meta["synced"] > SYNCED
+
+    def test_falls_back_without_stored_copy(self, tmp_path: Path) -> None:
+        store = LayerStore(tmp_path / "layers")
+        with patch(f"{MODULE}.get_object_ids") as mock_ids:
+            result = download_delta(
+                store, tmp_path / "out.parquet", URL, {}, RESPONSE, "OBJECTID", "*"
+            )
+        assert not result
+        mock_ids.assert_not_called()
+
+    def test_falls_back_when_schema_changed(self, tmp_path: Path) -> None:
+        store = _store(tmp_path, _table([1], ["a"]))
+        response = {
+            **RESPONSE,
+            "fields": [
+                *RESPONSE["fields"],
+                {"name": "x", "type": "esriFieldTypeInteger"},
+            ],
+        }
+        with patch(f"{MODULE}.get_object_ids") as mock_ids:
+            result = download_delta(
+                store, tmp_path / "out.parquet", URL, {}, response, "OBJECTID", "*"
+            )
+        assert not result
+        mock_ids.assert_not_called()
@@ -0,0 +1,86 @@
+# flake8: noqa: S101
+# ruff: noqa: D102, PLR2004
+"""Tests for journal module."""
+
+from pathlib import Path
+from unittest.mock import patch
+
+from hdx.scraper.cod_ab_country.__main__ import _download_stage
+from hdx.scraper.cod_ab_country.journal import DONE, DOWNLOADED, Journal
+from hdx.scraper.cod_ab_country.pipeline import CountryJob
+
+
+class TestJournal:
+    """Tests for Journal class."""
+
+    def test_marks_stage_as_done(self, tmp_path: Path) -> None:
+        journal = Journal(tmp_path / "journal")
+        journal.mark("AFG", "v1", DOWNLOADED, edited=123, has_downloads=True)
+        assert journal.is_done("AFG", "v1", DOWNLOADED)
+        assert not journal.is_done("AFG", "v1", DONE)
+        assert journal.edited("AFG", "v1") == 123
+        assert journal.stage_info("AFG", "v1", DOWNLOADED)["has_downloads"] is True
+
+    def test_ignores_entry_for_other_version(self, tmp_path: Path) -> None:
+        journal = Journal(tmp_path / "journal")
+        journal.mark("AFG", "v1", DONE)
+        assert not journal.is_done("AFG", "v2", DONE)
+
+    def test_resume_keeps_entries(self, tmp_path: Path) -> None:
+        Journal(tmp_path / "journal").mark("AFG", "v1", DONE)
+        assert Journal(tmp_path / "journal", resume=True).is_done("AFG", "v1", DONE)
+
+    def test_fresh_run_clears_entries(self, tmp_path: Path) -> None:
+        Journal(tmp_path / "journal").mark("AFG", "v1", DONE)
+        assert not Journal(tmp_path / "journal").is_done("AFG", "v1", DONE)
+
+    def test_reset_forgets_stages(self, tmp_path: Path) -> None:
+        journal = Journal(tmp_path / "journal")
+        journal.mark("AFG", "v1", DOWNLOADED, edited=1)
+        journal.reset("AFG", "v1", edited=2)
+        assert not journal.is_done("AFG", "v1", DOWNLOADED)
+        assert journal.edited("AFG", "v1") == 2
+
+
+class TestDownloadStageResume:
+    """Tests for resuming the download stage from the journal."""
+
+    def test_skips_completed_country(self, tmp_path: Path) -> None:
+        journal = Journal(tmp_path / "journal")
+        journal.mark("AFG", "v1", DONE)
+        job = CountryJob("AFG", "v1", tmp_path / "afg")
+        with patch(
+            "hdx.scraper.cod_ab_country.__main__.download_boundaries"
+        ) as mock_download:
+            assert not _download_stage(
+                job,
+                force_download=False,
+                global_metadata_updated=False,
+                journal=journal,
+            )
+            mock_download.assert_not_called()
+
+    def test_redownloads_when_service_edited(self, tmp_path: Path) -> None:
+        journal = Journal(tmp_path / "journal")
+        journal.mark("AFG", "v1", DONE, edited=1)
+        job = CountryJob("AFG", "v1", tmp_path / "afg")
+        with (
+            patch("hdx.scraper.cod_ab_country.__main__.client_get") as mock_get,
+            patch("hdx.scraper.cod_ab_country.__main__.get_token", return_value="t"),
+            patch(
+                "hdx.scraper.cod_ab_country.__main__.download_boundaries",
+                return_value=2,
+            ) as mock_download,
+        ):
+            mock_get.return_value.json.return_value = {
+                "editingInfo": {"lastEditDate": 2}
+            }
+            assert not _download_stage(
+                job,
+                force_download=False,
+                global_metadata_updated=False,
+                journal=journal,
+            )
+            mock_download.assert_called_once()
+            assert journal.edited("AFG", "v1") == 2
+            assert journal.is_done("AFG", "v1", DONE)
@@ -0,0 +1,132 @@
+# flake8: noqa: S101
+# ruff: noqa: D102, PLR2004
+"""Tests for the pipeline entry point."""
+
+import json
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from hdx.scraper.cod_ab_country.__main__ import _run_countries, _upload_stage
+from hdx.scraper.cod_ab_country.dataset import (
+    FORMAT_TYPES,
+    _get_country_name,
+    _LookupCache,
+    save_lookup_cache,
+)
+from hdx.scraper.cod_ab_country.journal import UPLOADED, Journal
+from hdx.scraper.cod_ab_country.metadata import MetadataStore
+from hdx.scraper.cod_ab_country.pipeline import CountryJob
+
+MAIN = "hdx.scraper.cod_ab_country.__main__"
+DATASET = "hdx.scraper.cod_ab_country.dataset"
+
+LAYER_LIST = [("AFG", "v1"), ("BFA", "v2"), ("CAF", "v1")]
+
+
+def _fail_for_bfa(iso3: str, **_kwargs: object) -> None:
+    if iso3 == "BFA":
+        msg = "boom"
+        raise ValueError(msg)
+
+
+class TestRunCountries:
+    """Tests for _run_countries function."""
+
+    def test_sequential_collects_failures(self) -> None:
+        with patch(
+            "hdx.scraper.cod_ab_country.__main__._create_country_dataset",
+            side_effect=_fail_for_bfa,
+        ) as mock_create:
+            result = _run_countries(LAYER_LIST, 1, test=True)
+            assert result == {"BFA": "ValueError: boom"}
+            assert mock_create.call_count == 3
+
+    def test_process_pool_collects_failures(self) -> None:
+        with patch(
+            "hdx.scraper.cod_ab_country.__main__._create_country_dataset",
+            side_effect=_fail_for_bfa,
+        ):
+            result = _run_countries(LAYER_LIST, 2, test=True)
+            assert result == {"BFA": "ValueError: boom"}
+
+    def test_process_pool_keeps_worker_lookups(self, tmp_path: Path) -> None:
+        def create(iso3: str, **_kwargs: object) -> None:
+            _get_country_name(iso3)
+
+        with (
+            patch(f"{DATASET}._lookup_cache", _LookupCache(60)),
+            patch(f"{DATASET}.Country") as mock_country,
+            patch(f"{MAIN}._create_country_dataset", side_effect=create),
+        ):
+            mock_country.get_country_name_from_iso3.side_effect = str.title
+            assert _run_countries(LAYER_LIST, 2, test=True) == {}
+            save_lookup_cache(tmp_path / "lookup_cache.json")
+        entries = json.loads((tmp_path / "lookup_cache.json").read_text())
+        assert {k: v for k, (_, v) in entries.items()} == {
+            "country:AFG": "Afg",
+            "country:BFA": "Bfa",
+            "country:CAF": "Caf",
+        }
+
+    def test_pipeline_warns_that_workers_is_ignored(
+        self, caplog: pytest.LogCaptureFixture
+    ) -> None:
+        with patch(f"{MAIN}._run_pipelined", return_value={}) as mock_pipelined:
+            assert _run_countries(LAYER_LIST, 4, pipeline=True, test=True) == {}
+        mock_pipelined.assert_called_once()
+        assert "Ignoring --workers 4 with --pipeline" in caplog.text
+
+
+class TestUploadStage:
+    """Tests for _upload_stage function."""
+
+    def _upload(self, tmp_path: Path, *, single_upload: bool) -> list[MagicMock]:
+        job = CountryJob("CAF", "v1", tmp_path / "caf", has_downloads=True)
+        job.iso3_dir.mkdir()
+        journal = Journal(tmp_path / "journal")
+        datasets = []
+
+        def generate(*_args: object, **_kwargs: object) -> MagicMock:
+            datasets.append(MagicMock())
+            return datasets[-1]
+
+        with (
+            patch(f"{MAIN}.generate_dataset", side_effect=generate),
+            patch(f"{MAIN}.add_boundary_resource") as mock_add,
+            patch(f"{MAIN}.compare_geodata", side_effect=lambda path, _: path),
+        ):
+            _upload_stage(
+                job,
+                {"batch": "batch"},
+                MetadataStore([]),
+                force_upload=False,
+                test=False,
+                journal=journal,
+                single_upload=single_upload,
+            )
+        assert mock_add.call_count == len(FORMAT_TYPES)
+        for ext, _ in FORMAT_TYPES:
+            assert journal.is_done("CAF", "v1", f"{UPLOADED}:{ext}")
+        return datasets
+
+    def test_uploads_each_format_separately(self, tmp_path: Path) -> None:
+        datasets = self._upload(tmp_path, single_upload=False)
+        assert len(datasets) == len(FORMAT_TYPES)
+        datasets[0].preview_resource.assert_called_once()
+        for dataset in datasets[1:]:
+            dataset.preview_resource.assert_not_called()
+        removes = [
+            x.create_in_hdx.call_args.kwargs["remove_additional_resources"]
+            for x in datasets
+        ]
+        assert removes == [True, False, False, False]
+
+    def test_single_upload_creates_dataset_once(self, tmp_path: Path) -> None:
+        datasets = self._upload(tmp_path, single_upload=True)
+        assert len(datasets) == 1
+        datasets[0].preview_resource.assert_called_once()
+        datasets[0].create_in_hdx.assert_called_once()
+        kwargs = datasets[0].create_in_hdx.call_args.kwargs
+        assert kwargs["remove_additional_resources"] is True
@@ -0,0 +1,70 @@
+# flake8: noqa: S101
+# ruff: noqa: D102, D103
+"""Tests for metadata module."""
+
+import pickle
+from datetime import date
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from hdx.scraper.cod_ab_country.arcgis import get_layer_list
+from hdx.scraper.cod_ab_country.metadata import MetadataRecord, MetadataStore
+
+
+@pytest.fixture
+def metadata_all(tmp_path: Path) -> Path:
+    path = tmp_path / "metadata_all.parquet"
+    pd.DataFrame(
+        {
+            "country_iso3": ["AFG", "AFG", "BFA"],
+            "version": ["v1", "v2", "v1"],
+            "admin_1_count": pd.array([34, None, 13], dtype="Int32"),
+            "date_valid_on": [date(2020, 1, 1), date(2021, 1, 1), None],
+            "source": ["Source A", "Source B", "Source C"],
+        },
+    ).to_parquet(path)
+    return path
+
+
+class TestMetadataStore:
+    """Tests for MetadataStore class."""
+
+    def test_gets_record_by_iso3_and_version(self, metadata_all: Path) -> None:
+        store = MetadataStore.from_parquet(metadata_all)
+        record = store.get("AFG", "v2")
+        assert record["source"] == "Source B"
+        assert record["date_valid_on"] == date(2021, 1, 1)
+        assert record["admin_1_count"] is None
+        assert record["caveats"] is None
+        assert store.get("AFG", "v1")["admin_1_count"] == 34  # noqa: PLR2004
+
+    def test_returns_empty_dict_when_not_found(self, metadata_all: Path) -> None:
+        assert MetadataStore.from_parquet(metadata_all).get("XXX", "v1") == {}
+
+    def test_latest_uses_last_version(self, metadata_all: Path) -> None:
+        store = MetadataStore.from_parquet(metadata_all)
+        assert store.latest() == [("AFG", "v2"), ("BFA", "v1")]
+
+    def test_get_layer_list_from_store(self, metadata_all: Path) -> None:
+        store = MetadataStore.from_parquet(metadata_all)
+        with patch("hdx.scraper.cod_ab_country.arcgis.iso3_include_cfg", ["BFA"]):
+            assert get_layer_list(metadata_all.parent, store) == [("BFA", "v1")]
+
+    def test_store_can_be_pickled(self, metadata_all: Path) -> None:
+        store = pickle.loads(pickle.dumps(MetadataStore.from_parquet(metadata_all)))  # noqa: S301
+        assert len(store) == 3  # noqa: PLR2004
+        assert store.get("BFA", "v1")["source"] == "Source C"
+
+
+class TestMetadataRecord:
+    """Tests for MetadataRecord class."""
+
+    def test_raises_key_error_for_unknown_field(self) -> None:
+        with pytest.raises(KeyError):
+            MetadataRecord()["unknown"]
+
+    def test_uses_slots(self) -> None:
+        assert not hasattr(MetadataRecord(), "__dict__")
@@ -0,0 +1,62 @@
+# flake8: noqa: S101
+# ruff: noqa: D102
+"""Tests for metrics module."""
+
+import csv
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+from hdx.scraper.cod_ab_country import metrics
+
+
+class TestMetrics:
+    """Tests for per-country metrics."""
+
+    def setup_method(self) -> None:
+        metrics.reset()
+
+    def test_attributes_nested_work_to_country(self) -> None:
+        with metrics.stage("download", "AFG"):
+            with metrics.timed("arcgis_query"):
+                metrics.add_bytes_downloaded(100)
+            with patch("hdx.scraper.cod_ab_country.metrics.subprocess.run"):
+                metrics.run(["gdal", "vector", "convert", "a", "b"], check=False)
+        record = metrics.pop("AFG")
+        assert set(record["stages"]) == {"download"}
+        assert set(record["steps"]) == {"arcgis_query", "gdal vector convert"}
+        assert record["bytes_downloaded"] == 100  # noqa: PLR2004
+        assert record["subprocesses"] == 1
+        assert record["peak_rss_kb"] > 0
+
+    def test_ignores_work_outside_a_country(self) -> None:
+        metrics.add_bytes_downloaded(100)
+        with metrics.timed("arcgis_query"):
+            pass
+        assert metrics.pop("AFG")["bytes_downloaded"] == 0
+
+    def test_merge_combines_records(self) -> None:
+        with metrics.stage("download", "AFG"):
+            metrics.add_bytes_downloaded(10)
+        record = metrics.pop("AFG")
+        metrics.merge("AFG", record)
+        metrics.merge("AFG", record)
+        merged = metrics.pop("AFG")
+        assert merged["bytes_downloaded"] == 20  # noqa: PLR2004
+        assert merged["stages"]["download"] == 2 * record["stages"]["download"]
+
+    def test_write_report(self, tmp_path: Path) -> None:
+        for iso3 in ("AFG", "BFA"):
+            with metrics.stage("download", iso3):
+                pass
+        (tmp_path / "afg.xlsx").write_bytes(b"12345")
+        metrics.add_output_sizes("AFG", {"xlsx": tmp_path / "afg.xlsx"})
+        json_path = metrics.write_report(tmp_path / "reports", failures={})
+        report = json.loads(json_path.read_text())
+        assert set(report["countries"]) == {"AFG", "BFA"}
+        assert report["countries"]["AFG"]["output_bytes"] == {"xlsx": 5}
+        with json_path.with_suffix(".csv").open() as f:
+            rows = list(csv.DictReader(f))
+        assert [row["iso3"] for row in rows] == ["AFG", "BFA"]
+        assert rows[0]["output_xlsx_bytes"] == "5"
+        assert rows[1]["output_xlsx_bytes"] == ""
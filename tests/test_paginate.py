@@ -0,0 +1,132 @@
+# flake8: noqa: S101
+# ruff: noqa: D102
+"""Tests for paginated boundary downloads."""
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import httpx
+from geopandas import read_parquet
+
+from hdx.scraper.cod_ab_country.download.boundaries.paginate import (
+    download_pages,
+    get_pages,
+)
+
+from .test_pbf import _collection
+
+MODULE = "hdx.scraper.cod_ab_country.download.boundaries.paginate"
+
+
+def _client_get(url: str, params: dict, *, cache: bool) -> httpx.Response:
+    assert not cache
+    assert url == "https://example.com/0/query"
+    if params.get("returnIdsOnly"):
+        return httpx.Response(200, json={"objectIds": [5, 1, 2, 3, 7]})
+    low = int(params["where"].split()[2])
+    page = {
+        "geometryType": "esriGeometryPoint",
+        "spatialReference": {"wkid": 4326},
+        "fields": [
+            {"name": "OBJECTID", "type": "esriFieldTypeOID"},
+            {"name": "name", "type": "esriFieldTypeString"},
+        ],
+        "features": [
+            {
+                "attributes": {"OBJECTID": low, "name": f"a{low}"},
+                "geometry": {"x": 1, "y": 2},
+            }
+        ],
+    }
+    return httpx.Response(200, json=page)
+
+
+class TestGetPages:
+    """Tests for get_pages function."""
+
+    def test_splits_ids_into_ranges(self) -> None:
+        assert get_pages([1, 2, 3, 5, 7], 2) == [(1, 2), (3, 5), (7, 7)]
+        assert get_pages([1, 2], 5) == [(1, 2)]
+
+
+class TestDownloadPages:
+    """Tests for download_pages function."""
+
+    def test_downloads_pages_in_objectid_order(self, tmp_path: Path) -> None:
+        with patch(f"{MODULE}.client_get", side_effect=_client_get) as mock_get:
+            result = download_pages(
+                tmp_path / "afg_adm1.parquet",
+                "https://example.com/0",
+                {"f": "json"},
+                {"name": "afg_adm1", "maxRecordCount": 2},
+                "OBJECTID",
+                "name",
+            )
+        assert result
+        wheres = [x.args[1]["where"] for x in mock_get.call_args_list[1:]]
+        assert wheres == [
+            "OBJECTID >= 1 AND OBJECTID <= 2",
+            "OBJECTID >= 3 AND OBJECTID <= 5",
+            "OBJECTID >= 7 AND OBJECTID <= 7",
+        ]
+        gdf = read_parquet(tmp_path / "afg_adm1.parquet")
+        assert gdf.columns.tolist() == ["name", "geometry"]
+        assert gdf["name"].tolist() == ["a1", "a3", "a7"]
+        assert gdf.crs == "EPSG:4326"
+        assert [x.name for x in tmp_path.iterdir()] == ["afg_adm1.parquet"]
+
+    def test_skips_layers_without_features(self, tmp_path: Path) -> None:
+        with patch(f"{MODULE}.client_get") as mock_get:
+            mock_get.return_value = MagicMock(json=lambda: {"objectIds": None})
+            assert not download_pages(
+                tmp_path / "a.parquet", "url", {}, {"name": "a"}, "OBJECTID", ""
+            )
+
+
+class TestDownloadPbfPages:
+    """Tests for downloading pages as protocol buffers."""
+
+    def _client_get(self, page: bytes) -> MagicMock:
+        def client_get(_: str, params: dict, *, cache: bool) -> httpx.Response:
+            assert not cache
+            if params.get("returnIdsOnly"):
+                return httpx.Response(200, json={"objectIds": [1, 2]})
+            if params["f"] == "pbf":
+                return httpx.Response(200, content=page)
+            return httpx.Response(200, json={"features": []})
+
+        return MagicMock(side_effect=client_get)
+
+    def test_decodes_pages_in_process(self, tmp_path: Path) -> None:
+        output_file = tmp_path / "afg_adm1.parquet"
+        with (
+            patch(f"{MODULE}.client_get", self._client_get(_collection())),
+            patch(f"{MODULE}.write_parquet") as mock_write,
+        ):
+            assert download_pages(
+                output_file,
+                "url",
+                {"f": "json"},
+                {"name": "afg_adm1", "supportedQueryFormats": "JSON, PBF"},
+                "OBJECTID",
+                "adm1_name",
+                "pbf",
+            )
+        mock_write.assert_not_called()
+        assert read_parquet(output_file)["adm1_name"].tolist() == ["a", "b"]
+
+    def test_falls_back_to_json_when_decoding_fails(self, tmp_path: Path) -> None:
+        with (
+            patch(f"{MODULE}.client_get", self._client_get(b"\x08\x01")),
+            patch(f"{MODULE}.write_parquet") as mock_write,
+        ):
+            assert download_pages(
+                tmp_path / "a.parquet",
+                "url",
+                {"f": "json"},
+                {"name": "a", "supportedQueryFormats": "JSON, PBF"},
+                "OBJECTID",
+                "",
+                "pbf",
+            )
+        mock_write.assert_called_once()
@@ -0,0 +1,129 @@
+# flake8: noqa: S101
+# ruff: noqa: D102, PLR2004
+"""Tests for pbf module."""
+
+from datetime import date
+from struct import pack
+
+import pytest
+import shapely
+
+from hdx.scraper.cod_ab_country.geodata.pbf import (
+    PbfError,
+    decode,
+    decode_varints,
+    to_geodataframe,
+)
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(number: int, wire: int) -> bytes:
+    return _varint(number << 3 | wire)
+
+
+def _int(number: int, value: int) -> bytes:
+    return _key(number, 0) + _varint(value)
+
+
+def _bytes(number: int, value: bytes) -> bytes:
+    return _key(number, 2) + _varint(len(value)) + value
+
+
+def _double(number: int, value: float) -> bytes:
+    return _key(number, 1) + pack("<d", value)
+
+
+def _packed(number: int, values: list[int], *, signed: bool = False) -> bytes:
+    encoded = b"".join(_varint(_zigzag(x) if signed else x) for x in values)
+    return _bytes(number, encoded)
+
+
+def _geometry(parts: list[list[tuple[int, int]]]) -> bytes:
+    deltas, previous = [], (0, 0)
+    for part in parts:
+        for x, y in part:
+            deltas += [x - previous[0], y - previous[1]]
+            previous = (x, y)
+    return _packed(2, [len(x) for x in parts]) + _packed(3, deltas, signed=True)
+
+
+def _feature(name: str, edited: int, parts: list[list[tuple[int, int]]]) -> bytes:
+    return (
+        _bytes(1, _bytes(1, name.encode()))
+        + _bytes(1, _int(6, edited))
+        + _bytes(2, _geometry(parts))
+    )
+
+
+def _collection() -> bytes:
+    square = [(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)]
+    hole = [(2, 2), (4, 2), (4, 4), (2, 4), (2, 2)]
+    island = [(20, 0), (20, 10), (30, 10), (30, 0), (20, 0)]
+    transform = (
+        _int(1, 1)
+        + _bytes(2, _double(1, 0.5) + _double(2, 0.25))
+        + _bytes(3, _double(1, 100.0) + _double(2, -10.0))
+    )
+    result = (
+        _int(7, 3)
+        + _bytes(8, _int(1, 4326))
+        + _bytes(12, transform)
+        + _bytes(13, _bytes(1, b"adm1_name") + _int(2, 4))
+        + _bytes(13, _bytes(1, b"date") + _int(2, 5))
+        + _bytes(15, _feature("a", 86_400_000, [square, hole]))
+        + _bytes(15, _feature("b", 0, [square, island]))
+    )
+    return _bytes(1, b"1") + _bytes(2, _bytes(1, result))
+
+
+class TestDecodeVarints:
+    """Tests for decode_varints function."""
+
+    def test_matches_scalar_decoding(self) -> None:
+        values = [0, 1, 127, 128, 300, 2**35, 2**63]
+        data = b"".join(_varint(x) for x in values)
+        assert decode_varints(data).tolist() == values
+
+    def test_rejects_truncated_input(self) -> None:
+        with pytest.raises(PbfError):
+            decode_varints(b"\x80")
+
+
+class TestDecode:
+    """Tests for decoding a FeatureCollection into a GeoDataFrame."""
+
+    def test_decodes_attributes_and_geometry(self) -> None:
+        gdf = to_geodataframe(decode(_collection()))
+        assert gdf.crs.to_epsg() == 4326
+        assert gdf["adm1_name"].tolist() == ["a", "b"]
+        assert gdf["date"].tolist() == [date(1970, 1, 2), date(1970, 1, 1)]
+        first, second = gdf.geometry
+        assert first.geom_type == "Polygon"
+        assert len(first.interiors) == 1
+        assert first.exterior.bounds == (100.0, -10.0, 105.0, -7.5)
+        assert second.geom_type == "MultiPolygon"
+        assert shapely.get_num_geometries(second) == 2
+
+    def test_rejects_coordinates_outside_extent(self) -> None:
+        extent = {"xmin": 0, "ymin": 0, "xmax": 1, "ymax": 1}
+        with pytest.raises(PbfError):
+            to_geodataframe(decode(_collection()), extent)
+
+    def test_rejects_responses_without_features(self) -> None:
+        with pytest.raises(PbfError):
+            decode(_bytes(1, b"1"))
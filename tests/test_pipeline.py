@@ -0,0 +1,64 @@
+# flake8: noqa: S101
+# ruff: noqa: D102
+"""Tests for pipeline module."""
+
+from pathlib import Path
+
+from hdx.scraper.cod_ab_country.pipeline import CountryJob, Stage, run_pipeline
+
+
+def _jobs(tmp_path: Path, *iso3s: str) -> list[CountryJob]:
+    return [CountryJob(iso3, "v1", tmp_path / iso3.lower()) for iso3 in iso3s]
+
+
+class TestRunPipeline:
+    """Tests for run_pipeline function."""
+
+    def test_runs_every_stage_for_every_job(self, tmp_path: Path) -> None:
+        seen = []
+        stages = [
+            Stage(name, lambda job, name=name: seen.append((name, job.iso3)) or True, 2)
+            for name in ("download", "convert", "upload")
+        ]
+        done = []
+        failures = run_pipeline(
+            _jobs(tmp_path, "AFG", "BFA", "CAF"),
+            stages,
+            1,
+            lambda j: done.append(j.iso3),
+        )
+        assert failures == {}
+        assert sorted(done) == ["AFG", "BFA", "CAF"]
+        for iso3 in ("AFG", "BFA", "CAF"):
+            order = [name for name, x in seen if x == iso3]
+            assert order == ["download", "convert", "upload"]
+
+    def test_stops_job_when_stage_returns_false(self, tmp_path: Path) -> None:
+        uploaded = []
+        stages = [
+            Stage("download", lambda job: job.iso3 != "BFA"),
+            Stage("upload", lambda job: uploaded.append(job.iso3) or True),
+        ]
+        done = []
+        failures = run_pipeline(
+            _jobs(tmp_path, "AFG", "BFA"), stages, 1, lambda j: done.append(j.iso3)
+        )
+        assert failures == {}
+        assert uploaded == ["AFG"]
+        assert sorted(done) == ["AFG", "BFA"]
+
+    def test_collects_failures_and_continues(self, tmp_path: Path) -> None:
+        def convert(job: CountryJob) -> bool:
+            if job.iso3 == "AFG":
+                msg = "bad layer"
+                raise ValueError(msg)
+            return True
+
+        uploaded = []
+        stages = [
+            Stage("convert", convert),
+            Stage("upload", lambda job: uploaded.append(job.iso3) or True),
+        ]
+        failures = run_pipeline(_jobs(tmp_path, "AFG", "BFA"), stages, 1)
+        assert failures == {"AFG": "ValueError: bad layer"}
+        assert uploaded == ["BFA"]
@@ -0,0 +1,83 @@
+# flake8: noqa: S101
+# ruff: noqa: D102, PLR2004
+"""Tests for retry module."""
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from hdx.scraper.cod_ab_country import metrics
+from hdx.scraper.cod_ab_country.retry import CircuitOpenError, RetryPolicy
+
+
+def _policy(**kwargs: float) -> RetryPolicy:
+    settings = {
+        "attempts": 3,
+        "base_wait": 1,
+        "max_wait": 4,
+        "deadline": 60,
+        "budget": 100,
+        "max_failures": 10,
+    }
+    return RetryPolicy(**{**settings, **kwargs})
+
+
+@pytest.fixture(autouse=True)
+def _no_sleep() -> None:
+    metrics.reset()
+    with patch("hdx.scraper.cod_ab_country.retry.sleep"):
+        yield
+
+
+class TestRetryPolicy:
+    """Tests for RetryPolicy class."""
+
+    def test_retries_until_success_and_counts_reasons(self) -> None:
+        func = MagicMock(side_effect=[TimeoutError, TimeoutError, "ok"])
+        with metrics.stage("download", "AFG"):
+            assert _policy().call(func) == "ok"
+        assert func.call_count == 3
+        assert metrics.get_counts()["retry_TimeoutError"] == 2
+
+    def test_backoff_grows_and_is_capped(self) -> None:
+        policy = _policy()
+        for attempt, cap in [(1, 1), (2, 2), (3, 4), (5, 4)]:
+            assert cap / 2 <= policy._wait(attempt) <= cap  # noqa: SLF001
+
+    def test_nested_calls_are_not_retried(self) -> None:
+        policy = _policy()
+        inner = MagicMock(side_effect=TimeoutError)
+        outer = MagicMock(side_effect=lambda: policy.call(inner))
+        with pytest.raises(TimeoutError):
+            policy.call(outer)
+        assert inner.call_count == 3
+
+    def test_global_budget_limits_retries(self) -> None:
+        policy = _policy(budget=1)
+        func = MagicMock(side_effect=TimeoutError)
+        with pytest.raises(TimeoutError):
+            policy.call(func)
+        assert func.call_count == 2
+        policy.reset()
+        with pytest.raises(TimeoutError):
+            policy.call(func)
+        assert func.call_count == 4
+
+    def test_circuit_opens_for_failing_country(self) -> None:
+        policy = _policy(max_failures=3)
+        func = MagicMock(side_effect=TimeoutError)
+        with metrics.stage("download", "AFG"):
+            with pytest.raises(TimeoutError):
+                policy.call(func)
+            with pytest.raises(CircuitOpenError):
+                policy.call(func)
+        assert func.call_count == 3
+        with metrics.stage("download", "BFA"), pytest.raises(TimeoutError):
+            policy.call(func)
+
+    def test_deadline_stops_retries(self) -> None:
+        policy = _policy(deadline=0)
+        func = MagicMock(side_effect=TimeoutError)
+        with metrics.stage("download", "AFG"), pytest.raises(TimeoutError):
+            policy.call(func)
+        assert func.call_count == 1